@@ -0,0 +1,155 @@
+"""
+Catalog throughput and tail latency: WSGI vs ASGI, sync vs async views.
+
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 64
+
+Drives the same catalog endpoint three ways from one process:
+
+- WSGI with the DRF viewset, on a thread per concurrent client (like a
+  threaded WSGI server),
+- ASGI with the DRF viewset, which Django runs through sync_to_async,
+- ASGI with the async view from store/async_views.py.
+
+The apps are called in-process through httpx's WSGI/ASGI transports, so no
+server needs to be installed. To measure real servers instead, start them
+(e.g. ``gunicorn config.wsgi -k gthread --threads 64`` and
+``uvicorn config.asgi:application``) and pass --wsgi-url / --asgi-url.
+The response cache is disabled unless --cache is given, so every request
+does the database work.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from .common import setup_django, temporary_database
+
+
+def seed(stones, projects):
+    from store.models import Category, Project, ProjectStone, Stone, StoneVideo
+
+    categories = [
+        Category.objects.create(name_en=f'Category {i}', name_fa=f'دسته {i}', slug=f'category-{i}')
+        for i in range(5)
+    ]
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ {i}', category=categories[i % 5], description_en='',
+              description_fa='', origin='Isfahan, Iran', price=Decimal('85.00'))
+        for i in range(stones)
+    ])
+    StoneVideo.objects.bulk_create([
+        StoneVideo(stone=stone, video_url=f'https://example.com/{stone.pk}.mp4', is_primary=True) for stone in stones
+    ])
+    projects = Project.objects.bulk_create([
+        Project(title_en=f'Project {i}', title_fa=f'پروژه {i}', description_en='', description_fa='',
+                location_en='Tehran', location_fa='تهران', year=2020, category_en='Hotel', category_fa='هتل')
+        for i in range(projects)
+    ])
+    ProjectStone.objects.bulk_create([
+        ProjectStone(project=project, stone=stones[(i + j) % len(stones)], quantity=100)
+        for i, project in enumerate(projects) for j in range(3)
+    ])
+
+
+def summarize(name, latencies, elapsed, errors):
+    latencies.sort()
+    p50 = statistics.median(latencies) if latencies else 0
+    p99 = statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else p50
+    print(
+        f'{name:<22} {len(latencies) / elapsed:8.0f} req/s   p50 {p50 * 1000:7.1f} ms   '
+        f'p99 {p99 * 1000:7.1f} ms   {errors} errors'
+    )
+
+
+def run_wsgi(name, path, args):
+    import httpx
+    from django.core.wsgi import get_wsgi_application
+
+    if args.wsgi_url:
+        transport, base_url = None, args.wsgi_url
+    else:
+        transport, base_url = httpx.WSGITransport(app=get_wsgi_application()), 'http://localhost'
+    latencies, errors = [], 0
+
+    def fetch(client):
+        nonlocal errors
+        start = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors += 1
+
+    with httpx.Client(transport=transport, base_url=base_url) as client:
+        fetch(client)
+        latencies.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda _: fetch(client), range(args.requests)))
+        summarize(name, latencies, time.perf_counter() - start, errors)
+
+
+def run_asgi(name, path, args):
+    import httpx
+    from django.core.asgi import get_asgi_application
+
+    if args.asgi_url:
+        transport, base_url = None, args.asgi_url
+    else:
+        transport, base_url = httpx.ASGITransport(app=get_asgi_application()), 'http://localhost'
+    latencies, errors = [], 0
+
+    async def main():
+        nonlocal errors
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def fetch(client):
+            nonlocal errors
+            async with slots:
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            await fetch(client)
+            latencies.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(client) for _ in range(args.requests)))
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    summarize(name, latencies, elapsed, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--endpoint', choices=['categories', 'stones', 'projects'], default='stones')
+    parser.add_argument('--stones', type=int, default=200)
+    parser.add_argument('--projects', type=int, default=50)
+    parser.add_argument('--cache', action='store_true', help='Keep the catalog response cache enabled')
+    parser.add_argument('--wsgi-url', help='Benchmark a running WSGI server instead of the in-process app')
+    parser.add_argument('--asgi-url', help='Benchmark a running ASGI server instead of the in-process app')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    settings.DEBUG = False
+    if not args.cache:
+        settings.CACHES['catalog'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+    # Worker threads open their own connections, so SQLite needs a file
+    with temporary_database(test_name=str(settings.BASE_DIR / 'bench_asgi.sqlite3')):
+        seed(args.stones, args.projects)
+        print(f'{args.requests} requests for /api/{args.endpoint}/, {args.concurrency} concurrent')
+        run_wsgi('WSGI, DRF viewset', f'/api/{args.endpoint}/', args)
+        run_asgi('ASGI, DRF viewset', f'/api/{args.endpoint}/', args)
+        run_asgi('ASGI, async view', f'/api/async/{args.endpoint}/', args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Mixed read/write throughput with and without the SQLite tuning.
+
+    python -m benchmarks.bench_database --threads 8 --seconds 10
+
+Threads read catalog pages and write orders (price lookup, order, items and
+a stone price touch in one transaction) against a file database, first
+with Django's plain SQLite settings and then with config.database's tuned profile (WAL,
+synchronous=NORMAL, busy_timeout, IMMEDIATE transactions, larger page
+cache and mmap). Reports operations per second, read and write latency and
+how many operations failed with "database is locked".
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+from .common import setup_django, temporary_database
+
+
+def seed(stones):
+    from django.contrib.auth.models import User
+    from store.models import Category, Stone
+
+    user = User.objects.create_user('bench', password='bench')
+    categories = [
+        Category.objects.create(name_en=f'Category {i}', name_fa=f'دسته {i}', slug=f'category-{i}')
+        for i in range(5)
+    ]
+    Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ {i}', category=categories[i % 5], description_en='',
+              description_fa='', origin='Isfahan, Iran', price=Decimal('85.00'))
+        for i in range(stones)
+    ])
+    return user, list(Stone.objects.values_list('pk', flat=True))
+
+
+def worker(user, stone_ids, deadline, write_rate, seed, results, lock):
+    from django.db import OperationalError, connection, transaction
+    from django.db.models import F
+    from store.models import Order, OrderItem, Stone
+
+    rng = random.Random(seed)
+    reads, writes, locked = [], [], 0
+    try:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_rate:
+                    picked = rng.sample(stone_ids, 3)
+                    with transaction.atomic():
+                        # Read first, like checkout does with the cart, so a deferred
+                        # transaction has to upgrade its lock to write
+                        total = sum(Stone.objects.filter(pk__in=picked).values_list('price', flat=True))
+                        order = Order.objects.create(
+                            user=user, total_amount=total, shipping_address='Street',
+                            shipping_city='Tehran', shipping_postal_code='1234567890', shipping_phone='+989120000000'
+                        )
+                        OrderItem.objects.bulk_create([
+                            OrderItem(order=order, stone_id=pk, quantity=1, price=Decimal('85.00')) for pk in picked
+                        ])
+                        Stone.objects.filter(pk=picked[0]).update(price=F('price'))
+                    writes.append(time.perf_counter() - start)
+                else:
+                    offset = rng.randrange(0, len(stone_ids) - 20)
+                    list(Stone.objects.select_related('category').order_by('pk')[offset:offset + 20])
+                    reads.append(time.perf_counter() - start)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+    finally:
+        connection.close()
+        with lock:
+            results['reads'] += reads
+            results['writes'] += writes
+            results['locked'] += locked
+
+
+def percentile(values, p):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100)[p - 1]
+
+
+def run(name, tuned, args):
+    from django.conf import settings
+    from django.db import connection
+    from config.database import sqlite_database
+
+    # Threads open their own connections from this same settings dict
+    path = str(settings.BASE_DIR / 'bench_database.sqlite3')
+    config = sqlite_database(path, tuned=tuned)
+    connection.close()
+    connection.settings_dict['OPTIONS'] = config.get('OPTIONS', {})
+    connection.settings_dict['CONN_MAX_AGE'] = config.get('CONN_MAX_AGE', 0)
+
+    with temporary_database(test_name=path):
+        user, stone_ids = seed(args.stones)
+        results = {'reads': [], 'writes': [], 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + args.seconds
+        threads = [
+            threading.Thread(target=worker, args=(
+                user, stone_ids, deadline, args.write_rate, args.seed + i, results, lock
+            ))
+            for i in range(args.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    reads, writes = results['reads'], results['writes']
+    print(
+        f'{name:>8}: {(len(reads) + len(writes)) / args.seconds:8.0f} ops/s '
+        f'({len(reads)} reads, {len(writes)} writes, {results["locked"]} locked), '
+        f'read p95 {percentile(reads, 95) * 1000:.1f} ms, write p95 {percentile(writes, 95) * 1000:.1f} ms'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--stones', type=int, default=2000)
+    parser.add_argument('--write-rate', type=float, default=0.2, help='Share of operations that write')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    if connection.vendor != 'sqlite':
+        raise SystemExit('This benchmark compares SQLite configurations')
+    run('default', False, args)
+    run('tuned', True, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput and memory of the streaming exports.
+
+    python -m benchmarks.bench_export --rows 1000000
+
+Seeds the requested number of order items (one order per five items) into a
+test database, then streams every dataset to /dev/null, sampling RSS as it
+goes. Flat RSS across the run is the point of the streaming design.
+"""
+import argparse
+from decimal import Decimal
+from .common import Timer, rss_mb, setup_django, temporary_database
+
+
+def seed(rows, batch_size=5000):
+    from django.contrib.auth.models import User
+    from store.models import Category, Order, OrderItem, Stone
+
+    user = User.objects.create_user('bench', password='bench')
+    category = Category.objects.create(name_en='Marble', name_fa='مرمر', slug='marble')
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ {i}', category=category, description_en='',
+              description_fa='', origin='Isfahan, Iran', price=Decimal('85.00'))
+        for i in range(50)
+    ])
+
+    order_count = max(rows // 5, 1)
+    for start in range(0, order_count, batch_size):
+        Order.objects.bulk_create([
+            Order(user=user, order_number=f'ORD-{i:010d}', total_amount=Decimal('425.00'),
+                  status='paid', shipping_address='Street', shipping_city='Tehran',
+                  shipping_postal_code='1234567890', shipping_phone='+989120000000')
+            for i in range(start, min(start + batch_size, order_count))
+        ])
+
+    order_ids = list(Order.objects.values_list('id', flat=True))
+    for start in range(0, rows, batch_size):
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order_ids[i // 5 % len(order_ids)], stone=stones[i % len(stones)],
+                      quantity=1, price=Decimal('85.00'), selected_finish='Polished')
+            for i in range(start, min(start + batch_size, rows))
+        ])
+
+
+def run(dataset, output):
+    from store.exports import stream_export
+
+    samples = []
+    size = 0
+    with Timer() as timer, open('/dev/null', 'w') as sink:
+        for i, chunk in enumerate(stream_export(dataset, output)):
+            sink.write(chunk)
+            size += len(chunk)
+            if i % 200 == 0:
+                samples.append(rss_mb())
+    return timer.elapsed, size, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Order items to seed')
+    args = parser.parse_args()
+
+    setup_django()
+    from store.models import Order, OrderItem
+
+    with temporary_database():
+        with Timer() as timer:
+            seed(args.rows)
+        print(f'Seeded {args.rows} order items in {timer.elapsed:.1f}s, RSS {rss_mb():.0f} MB')
+
+        counts = {'orders': Order.objects.count(), 'order_items': OrderItem.objects.count()}
+        for dataset, count in counts.items():
+            for output in ('csv', 'jsonl'):
+                elapsed, size, samples = run(dataset, output)
+                print(
+                    f'{dataset:<12} {output:<5} {count:>9} rows  {elapsed:6.2f}s  '
+                    f'{count / elapsed:>9.0f} rows/s  {size / 2 ** 20:7.1f} MB out  '
+                    f'RSS min/max {min(samples):.0f}/{max(samples):.0f} MB'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Overhead of the per-request instrumentation in store/instrumentation.py.
+
+    python -m benchmarks.bench_instrumentation --requests 200 --rounds 5
+
+Serves the same catalog requests through the WSGI handler with the
+instrumentation removed, with Server-Timing on (sampling off, the default),
+and with every request profiled, and prints the mean time per request
+(the best of --rounds interleaved runs, to keep drift out of the difference).
+The catalog response cache is disabled so each request queries, serializes
+and renders; --cache measures cache hits instead, the cheapest requests and
+so the worst case for relative overhead.
+"""
+import argparse
+import sys
+from io import BytesIO
+from .bench_asgi import seed
+from .common import Timer, setup_django, temporary_database
+
+
+def environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+    }
+
+
+def mean_request_time(path, requests):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    application = WSGIHandler()
+    status = []
+    b''.join(application(environ(path), lambda s, h: status.append(s)))
+    if status[0] != '200 OK':
+        raise SystemExit(f'{path} returned {status[0]}')
+    with Timer() as timer:
+        for _ in range(requests):
+            b''.join(application(environ(path), lambda s, h: None))
+    return timer.elapsed / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per run')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--cache', action='store_true', help='Keep the catalog response cache enabled')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from store.instrumentation import record_query
+
+    settings.DEBUG = False
+    if not args.cache:
+        settings.CACHES['catalog'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    middleware = list(settings.MIDDLEWARE)
+
+    def configure(timing, sample_rate=0):
+        settings.SERVER_TIMING = timing
+        settings.REQUEST_PROFILE_SAMPLE_RATE = sample_rate
+        settings.MIDDLEWARE = middleware if timing else [
+            name for name in middleware if name != 'store.instrumentation.ServerTimingMiddleware'
+        ]
+        if timing and record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+        if not timing and record_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(record_query)
+
+    with temporary_database():
+        seed(200, 50)
+        print(f'{args.rounds} x {args.requests} requests each, response cache {"on" if args.cache else "off"}')
+        for path in ['/api/categories/', '/api/stones/', '/api/projects/']:
+            configs = [('off', False, 0), ('on', True, 0), ('profiling every request', True, 1)]
+            best = {label: float('inf') for label, _, _ in configs}
+            for _ in range(args.rounds):
+                for label, timing, sample_rate in configs:
+                    configure(timing, sample_rate)
+                    best[label] = min(best[label], mean_request_time(path, args.requests))
+            baseline = best['off']
+            print(path)
+            for label, elapsed in best.items():
+                print(f'  {label:<24} {elapsed * 1000:7.3f} ms  ({(elapsed - baseline) * 1e6:+6.0f} us)')
+        configure(True)
+
+
+if __name__ == '__main__':
+    main()
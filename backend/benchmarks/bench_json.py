@@ -0,0 +1,138 @@
+"""
+JSON rendering and parsing: DRF's stdlib-based classes vs store/renderers.py.
+
+    python -m benchmarks.bench_json --stones 200 --orders 100 --rounds 50
+
+Serializes a stone list (StoneSerializer, with category, images and videos)
+and an order history (OrderSerializer, with user and items holding nested
+stones) once, then times rendering that data to JSON bytes and parsing the
+bytes back, with JSONRenderer/JSONParser and with FastJSONRenderer/
+FastJSONParser. Also checks that both renderers produce identical bytes, for
+the payloads and for raw Decimal, datetime and lazy translation values.
+"""
+import argparse
+import datetime
+import io
+from decimal import Decimal
+from .common import Timer, setup_django, temporary_database
+
+
+def seed(stones, orders, items):
+    from django.contrib.auth.models import User
+    from store.models import Category, Order, OrderItem, Stone, StoneImage, StoneVideo
+
+    categories = [
+        Category.objects.create(name_en=f'Category {i}', name_fa=f'دسته {i}', slug=f'category-{i}')
+        for i in range(5)
+    ]
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ مرمر {i}', category=categories[i % 5],
+              description_en='Polished marble with grey veining, suitable for floors and cladding. ' * 3,
+              description_fa='مرمر صیقلی با رگه‌های خاکستری، مناسب برای کف و نما. ' * 3,
+              origin='Isfahan, Iran', price=Decimal('85.50') + i, density='2.7 g/cm3', porosity='0.3%',
+              compressive_strength='120 MPa', flexural_strength='15 MPa')
+        for i in range(stones)
+    ])
+    StoneImage.objects.bulk_create([
+        StoneImage(stone=stone, image=f'stones/{stone.pk}-{j}.jpg', alt_text=stone.name_en, is_primary=j == 0, order=j)
+        for stone in stones for j in range(2)
+    ])
+    StoneVideo.objects.bulk_create([
+        StoneVideo(stone=stone, video_url=f'https://example.com/{stone.pk}.mp4', is_primary=True) for stone in stones
+    ])
+    user = User.objects.create_user('bench', 'bench@example.com', 'bench-password', first_name='Bench')
+    created = Order.objects.bulk_create([
+        Order(user=user, order_number=f'ORD-{i:06d}', tracking_code=f'TRK-{i:06d}', status='paid',
+              total_amount=Decimal('1234.50'), payment_id=f'A{i:035d}', payment_status='paid',
+              shipping_address='No. 12, Valiasr Street', shipping_city='Tehran',
+              shipping_postal_code='1234567890', shipping_phone='09120000000')
+        for i in range(orders)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, stone=stones[(i + j) % len(stones)], quantity=10 + j, price=Decimal('85.50'),
+                  selected_finish='Polished', selected_thickness='2cm')
+        for i, order in enumerate(created) for j in range(items)
+    ])
+
+
+def payloads():
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+    from store.models import Order, Stone
+    from store.serializers import OrderSerializer, StoneSerializer
+
+    context = {'request': Request(RequestFactory().get('/api/'))}
+    stones = Stone.objects.select_related('category').prefetch_related('images', 'videos')
+    orders = Order.objects.select_related('user').prefetch_related(
+        'items__stone__category', 'items__stone__images', 'items__stone__videos'
+    )
+    return {
+        'StoneSerializer': StoneSerializer(stones, many=True, context=context).data,
+        'OrderSerializer': OrderSerializer(orders, many=True, context=context).data,
+    }
+
+
+def check_identical(data):
+    from django.utils import timezone
+    from django.utils.translation import gettext_lazy
+    from rest_framework.renderers import JSONRenderer
+    from store.renderers import FastJSONRenderer
+
+    samples = dict(data, raw={
+        'price': Decimal('85.50'),
+        'created_at': timezone.now(),
+        'naive': datetime.datetime(2024, 3, 20, 12, 30, 15, 123456),
+        'date': datetime.date(2024, 3, 20),
+        'label': gettext_lazy('Pending'),
+        'line_separator': 'a\u2028b',
+    })
+    for name, value in samples.items():
+        if JSONRenderer().render(value) != FastJSONRenderer().render(value):
+            raise SystemExit(f'{name}: FastJSONRenderer output differs from JSONRenderer')
+
+
+def best_of(rounds, func, *args):
+    best = float('inf')
+    for _ in range(rounds):
+        with Timer() as timer:
+            func(*args)
+        best = min(best, timer.elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stones', type=int, default=200)
+    parser.add_argument('--orders', type=int, default=100)
+    parser.add_argument('--items', type=int, default=4, help='Items per order')
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from store import renderers
+
+    if renderers.orjson is None:
+        print('orjson is not installed; FastJSONRenderer falls back to the stdlib and matches JSONRenderer')
+
+    with temporary_database():
+        seed(args.stones, args.orders, args.items)
+        data = payloads()
+    check_identical(data)
+
+    context = {'encoding': 'utf-8'}
+    for name, value in data.items():
+        body = JSONRenderer().render(value)
+        print(f'{name} ({len(value)} objects, {len(body) / 1024:.0f} KB)')
+        for label, renderer, parser_ in [
+            ('stdlib', JSONRenderer(), JSONParser()),
+            ('orjson', renderers.FastJSONRenderer(), renderers.FastJSONParser()),
+        ]:
+            render = best_of(args.rounds, renderer.render, value)
+            parse = best_of(args.rounds, lambda: parser_.parse(io.BytesIO(body), parser_context=context))
+            print(f'  {label:<8} render {render * 1000:7.2f} ms   parse {parse * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
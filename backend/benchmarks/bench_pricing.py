@@ -0,0 +1,91 @@
+"""
+Throughput of the quote estimation engine.
+
+    python -m benchmarks.bench_pricing --quotes 5000 --items 8
+
+Seeds quotes with random stones, finishes and thicknesses plus a few volume
+tiers and surcharges into a test database, then measures pricing alone
+(rules cached, lines in memory) and the full bulk re-estimation that runs
+when prices change (read, price, bulk update).
+"""
+import argparse
+import random
+from decimal import Decimal
+from .common import Timer, setup_django, temporary_database
+
+
+FINISHES = ['Polished', 'Honed', 'Brushed', '']
+THICKNESSES = ['2cm', '3cm', '']
+
+
+def seed(quotes, items, batch_size=2000):
+    from store.models import Category, PriceSurcharge, Quote, QuoteItem, Stone, VolumeTier
+
+    rng = random.Random(1)
+    categories = [
+        Category.objects.create(name_en=f'Category {i}', name_fa=f'دسته {i}', slug=f'category-{i}')
+        for i in range(4)
+    ]
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ {i}', category=categories[i % 4], description_en='',
+              description_fa='', origin='Isfahan, Iran', price=Decimal(rng.randint(40, 400)))
+        for i in range(100)
+    ])
+    VolumeTier.objects.bulk_create(
+        [VolumeTier(category=None, min_quantity=q, discount_percent=d) for q, d in [(50, 5), (200, 10)]]
+        + [VolumeTier(category=categories[0], min_quantity=q, discount_percent=d) for q, d in [(20, 4), (100, 12)]]
+    )
+    PriceSurcharge.objects.bulk_create([
+        PriceSurcharge(kind='finish', value='Honed', percent=5),
+        PriceSurcharge(kind='finish', value='Brushed', percent=8),
+        PriceSurcharge(kind='thickness', value='3cm', percent=15),
+    ])
+
+    for start in range(0, quotes, batch_size):
+        created = Quote.objects.bulk_create([
+            Quote(name='Bench', email='bench@example.com', project_type='commercial',
+                  project_location='Tehran', timeline='3 months')
+            for _ in range(start, min(start + batch_size, quotes))
+        ])
+        QuoteItem.objects.bulk_create([
+            QuoteItem(quote=quote, stone=rng.choice(stones), quantity=rng.randint(1, 60),
+                      selected_finish=rng.choice(FINISHES), selected_thickness=rng.choice(THICKNESSES))
+            for quote in created
+            for _ in range(items)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quotes', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=8, help='Items per quote')
+    args = parser.parse_args()
+
+    setup_django()
+    from store.models import Quote, QuoteItem
+    from store.pricing import estimate_quotes, get_rules, price_lines
+
+    with temporary_database():
+        with Timer() as timer:
+            seed(args.quotes, args.items)
+        print(f'Seeded {args.quotes} quotes x {args.items} items in {timer.elapsed:.1f}s')
+
+        rules = get_rules()
+        lines = {}
+        rows = QuoteItem.objects.values_list(
+            'quote_id', 'stone__price', 'stone__category_id', 'quantity', 'selected_finish', 'selected_thickness'
+        )
+        for quote_id, *line in rows:
+            lines.setdefault(quote_id, []).append(line)
+        with Timer() as timer:
+            for quote_lines in lines.values():
+                price_lines(quote_lines, rules)
+        print(f'price_lines     {len(lines) / timer.elapsed:>10.0f} quotes/s  (in memory)')
+
+        with Timer() as timer:
+            estimated = estimate_quotes(Quote.objects.all())
+        print(f'estimate_quotes {estimated / timer.elapsed:>10.0f} quotes/s  (read, price, bulk update)')
+
+
+if __name__ == '__main__':
+    main()
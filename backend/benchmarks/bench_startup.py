@@ -0,0 +1,85 @@
+"""
+Worker startup time and memory: full profile vs API-only profile.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Starts a fresh interpreter per run and profile, like a new server worker,
+and measures django.setup(), loading the WSGI handler (middleware), the
+first /api/categories/ request (URLconf, views, serializers), the number
+of imported modules and the resident memory afterwards. Prints the median
+of the runs. Both profiles use the same throwaway migrated database.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from .common import setup_django
+
+PROFILES = {
+    'full': 'config.settings',
+    'api': 'config.settings_api',
+}
+
+WORKER = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+handler = time.perf_counter()
+from io import BytesIO
+status = []
+body = b''.join(application({
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/categories/', 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+}, lambda s, h: status.append(s)))
+request = time.perf_counter()
+from benchmarks.common import rss_mb
+print(json.dumps({
+    'status': status[0], 'setup': setup - start, 'handler': handler - setup,
+    'request': request - handler, 'modules': len(sys.modules), 'rss': rss_mb(),
+}))
+"""
+
+
+def run_worker(settings_module, db_name):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module, DB_NAME=db_name, PYTHONPATH=os.getcwd())
+    output = subprocess.run([sys.executable, '-c', WORKER], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, 'startup.sqlite3')
+        os.environ['DB_NAME'] = db_name
+        setup_django()
+        from django.core.management import call_command
+
+        call_command('migrate', verbosity=0)
+
+        print(f'median of {args.runs} fresh workers')
+        print(f'{"profile":<8} {"setup":>9} {"handler":>9} {"1st req":>9} {"total":>9} {"modules":>8} {"RSS":>9}')
+        for name, settings_module in PROFILES.items():
+            runs = [run_worker(settings_module, db_name) for _ in range(args.runs)]
+            if runs[0]['status'] != '200 OK':
+                print(f'{name}: /api/categories/ returned {runs[0]["status"]}')
+            median = {key: statistics.median(run[key] for run in runs) for key in ('setup', 'handler', 'request', 'modules', 'rss')}
+            total = median['setup'] + median['handler'] + median['request']
+            print(
+                f'{name:<8} {median["setup"] * 1000:7.0f}ms {median["handler"] * 1000:7.0f}ms '
+                f'{median["request"] * 1000:7.0f}ms {total * 1000:7.0f}ms {median["modules"]:8.0f} {median["rss"]:7.1f}MB'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Shared helpers for the benchmark scripts in this package.
+
+Run benchmarks from the backend directory, e.g.::
+
+    python -m benchmarks.bench_export --rows 1000000
+
+Each benchmark works on a throwaway test database, never on db.sqlite3.
+"""
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+
+def setup_django(settings_module='config.settings'):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+@contextmanager
+def temporary_database(keepdb=False, test_name=None):
+    """
+    Create the test database for the duration of the block. Pass test_name
+    to override TEST['NAME'], e.g. to put a SQLite test database in a file
+    that several threads can open with their own connections.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    if test_name:
+        connection.settings_dict['TEST']['NAME'] = test_name
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+        if test_name and not keepdb:
+            # Connections still open in worker threads leave the WAL files behind
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(test_name + suffix):
+                    os.remove(test_name + suffix)
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,151 @@
+"""
+Concurrent checkout stress test for stock reservations.
+
+    python -m benchmarks.stress_checkout --threads 16 --attempts 200
+
+Many threads check out random carts against a handful of scarce stones at
+the same time, the same way CartViewSet.checkout does (order, items and
+reservation in one short transaction), and some of them cancel again so
+stock is handed back while others are still reserving. Afterwards every
+stock row must satisfy
+
+    initial - available == held + committed reservations,  available >= 0
+
+i.e. nothing was oversold and no unit was lost. SQLite runs on a file test
+database with IMMEDIATE transactions so the threads really contend; point
+DJANGO_SETTINGS_MODULE at a PostgreSQL configuration to test row locking there.
+"""
+import argparse
+import random
+import threading
+from decimal import Decimal
+from .common import Timer, setup_django, temporary_database
+
+
+def seed(stones, stock):
+    from django.contrib.auth.models import User
+    from store.models import Category, Stone, StoneStock
+
+    user = User.objects.create_user('bench', password='bench')
+    category = Category.objects.create(name_en='Marble', name_fa='مرمر', slug='marble')
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {i}', name_fa=f'سنگ {i}', category=category, description_en='',
+              description_fa='', origin='Isfahan, Iran', price=Decimal('85.00'))
+        for i in range(stones)
+    ])
+    # Half the stones are tracked per finish, the other half with one blank row
+    StoneStock.objects.bulk_create(
+        [StoneStock(stone=stone, selected_finish='Polished', available=stock) for stone in stones[::2]]
+        + [StoneStock(stone=stone, available=stock) for stone in stones[1::2]]
+    )
+    return user, stones
+
+
+def worker(user, stones, attempts, cancel_rate, seed, results, lock):
+    from django.db import connection, transaction
+    from store.inventory import OutOfStock, reserve_stock
+    from store.models import Order, OrderItem
+
+    rng = random.Random(seed)
+    counts = {'reserved': 0, 'out_of_stock': 0, 'cancelled': 0}
+    try:
+        for _ in range(attempts):
+            items = [
+                OrderItem(stone=stone, quantity=rng.randint(1, 3), price=stone.price, selected_finish='Polished')
+                for stone in rng.sample(stones, rng.randint(1, 3))
+            ]
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        user=user, total_amount=sum(item.price * item.quantity for item in items),
+                        shipping_address='Street', shipping_city='Tehran',
+                        shipping_postal_code='1234567890', shipping_phone='+989120000000'
+                    )
+                    for item in items:
+                        item.order = order
+                    OrderItem.objects.bulk_create(items)
+                    reserve_stock(order, items)
+            except OutOfStock:
+                counts['out_of_stock'] += 1
+                continue
+            counts['reserved'] += 1
+
+            if rng.random() < cancel_rate:
+                order.mark_cancelled('cancelled')
+                counts['cancelled'] += 1
+            else:
+                order.mark_paid()
+    finally:
+        connection.close()
+        with lock:
+            for key, value in counts.items():
+                results[key] += value
+
+
+def check(stock):
+    from django.db.models import Sum
+    from store.models import StoneStock, StockReservation
+
+    problems = []
+    totals = dict(
+        StockReservation.objects.exclude(status='released')
+        .values('stock_id').annotate(quantity=Sum('quantity')).values_list('stock_id', 'quantity')
+    )
+    for row in StoneStock.objects.order_by('pk'):
+        reserved = totals.get(row.pk, 0)
+        if row.available < 0 or stock - row.available != reserved:
+            problems.append(f'{row}: {reserved} reserved from {stock}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=100, help='Checkouts per thread')
+    parser.add_argument('--stones', type=int, default=6)
+    parser.add_argument('--stock', type=int, default=50, help='Initial units per stock row')
+    parser.add_argument('--cancel-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    test_name = None
+    if connection.vendor == 'sqlite':
+        test_name = str(settings.BASE_DIR / 'stress_checkout.sqlite3')
+        connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=30)
+
+    with temporary_database(test_name=test_name):
+        user, stones = seed(args.stones, args.stock)
+        results = {'reserved': 0, 'out_of_stock': 0, 'cancelled': 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(
+                user, stones, args.attempts, args.cancel_rate, args.seed + i, results, lock
+            ))
+            for i in range(args.threads)
+        ]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        total = args.threads * args.attempts
+        print(
+            f'{total} checkouts on {args.threads} threads in {timer.elapsed:.1f}s: '
+            f"{results['reserved']} reserved ({results['cancelled']} cancelled again), "
+            f"{results['out_of_stock']} out of stock"
+        )
+        if results['reserved'] + results['out_of_stock'] != total:
+            raise SystemExit('Some checkouts failed with unexpected errors')
+        problems = check(args.stock)
+        if problems:
+            raise SystemExit('Stock mismatch:\n  ' + '\n  '.join(problems))
+        print('OK: no stock oversold or lost')
+
+
+if __name__ == '__main__':
+    main()
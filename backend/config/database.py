@@ -0,0 +1,98 @@
+"""
+Database configuration, driven by environment variables.
+
+    DB_ENGINE           sqlite (default) or postgresql
+    DB_NAME             database name, or the SQLite file path (default: db.sqlite3)
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE     seconds to keep connections open between requests (default: 60)
+    DB_POOL_MAX_SIZE    PostgreSQL only: use a psycopg connection pool of this size
+                        instead of persistent connections (needs psycopg[pool])
+    DB_POOL_MIN_SIZE    PostgreSQL only: connections the pool keeps open (default: 2)
+    DB_SQLITE_TUNING    set to 0 to open SQLite without the PRAGMAs below
+    DB_REPLICAS         comma-separated read replicas for catalog reads (store/routing.py):
+                        SQLite file paths, or PostgreSQL standby hosts as host[:port]
+"""
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# checkout writes; synchronous=NORMAL is durable across application crashes
+# in WAL mode and only risks the last transactions on power loss.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,           # ms to wait for a lock instead of failing with "database is locked"
+    'cache_size': -64000,           # KiB of page cache per connection (negative = size in KiB)
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+
+def sqlite_database(name, tuned=True, conn_max_age=60):
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    if tuned:
+        config['OPTIONS'] = {
+            'init_command': ''.join(f'PRAGMA {pragma}={value};' for pragma, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock when a transaction starts, so concurrent writers
+            # queue on busy_timeout instead of failing on a lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        }
+        config['CONN_MAX_AGE'] = conn_max_age
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def postgresql_database(environ):
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': environ.get('DB_NAME', 'stone_store'),
+        'USER': environ.get('DB_USER', ''),
+        'PASSWORD': environ.get('DB_PASSWORD', ''),
+        'HOST': environ.get('DB_HOST', ''),
+        'PORT': environ.get('DB_PORT', ''),
+        'OPTIONS': {},
+    }
+    if environ.get('DB_POOL_MAX_SIZE'):
+        # Pooled connections are returned to the pool after each request, which
+        # Django requires to go with CONN_MAX_AGE = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(environ['DB_POOL_MAX_SIZE']),
+            'timeout': 10,
+        }
+        config['CONN_MAX_AGE'] = 0
+    else:
+        config['CONN_MAX_AGE'] = int(environ.get('DB_CONN_MAX_AGE', 60))
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def database_from_env(environ, base_dir):
+    engine = environ.get('DB_ENGINE', 'sqlite')
+    if engine == 'postgresql':
+        return postgresql_database(environ)
+    if engine != 'sqlite':
+        raise ValueError(f'Unsupported DB_ENGINE: {engine}')
+    return sqlite_database(
+        environ.get('DB_NAME', base_dir / 'db.sqlite3'),
+        tuned=environ.get('DB_SQLITE_TUNING', '1') != '0',
+        conn_max_age=int(environ.get('DB_CONN_MAX_AGE', 60)),
+    )
+
+
+def replicas_from_env(environ, primary):
+    """Replica aliases (replica1, replica2, ...) configured like the primary"""
+    replicas = {}
+    for number, location in enumerate(filter(None, environ.get('DB_REPLICAS', '').split(',')), start=1):
+        location = location.strip()
+        if primary['ENGINE'] == 'django.db.backends.sqlite3':
+            config = sqlite_database(location, tuned='OPTIONS' in primary, conn_max_age=primary.get('CONN_MAX_AGE', 0))
+        else:
+            host, _, port = location.partition(':')
+            config = {**primary, 'HOST': host, 'PORT': port or primary['PORT'], 'OPTIONS': dict(primary['OPTIONS'])}
+        # Tests run against the primary only; replica reads see the same data
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{number}'] = config
+    return replicas
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_from_env, replicas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,12 +50,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "store.instrumentation.ServerTimingMiddleware",
+    "store.nplusone.NPlusOneMiddleware",
+    "store.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "store.routing.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -80,12 +87,22 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Tuned SQLite by default; see config/database.py for the DB_* environment variables
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_from_env(os.environ, BASE_DIR),
 }
+DATABASES.update(replicas_from_env(os.environ, DATABASES["default"]))
+
+# Catalog reads go to a healthy replica unless the client has just written
+DATABASE_ROUTERS = ["store.routing.ReplicaRouter"]
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != "default"]
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = 5
+# Cache holding pins of authenticated users; shared, as their next request may go to any process
+REPLICA_PIN_CACHE = "shared"
+# Seconds between replica health checks, and the replication lag that fails one
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+REPLICA_MAX_LAG = 10
 
 
 # Password validation
@@ -146,15 +163,73 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'store.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # orjson-backed when installed, same output as DRF's JSONRenderer/JSONParser
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'store.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
 
+# Seconds a resolved API token (user and profile) is served from the cache
+AUTH_TOKEN_CACHE_TTL = 60
+# Cache holding resolved tokens; it must be shared by all processes, or a token
+# revoked in one keeps working in the others until the TTL runs out
+AUTH_TOKEN_CACHE = "shared"
+
+# Responses smaller than this many bytes are sent uncompressed (store/compression.py)
+COMPRESSION_MIN_SIZE = 1024
+
+# Server-Timing headers and per-endpoint latency histograms (store/instrumentation.py)
+SERVER_TIMING = True
+# Fraction of API requests run under cProfile (0 disables), and how many of the
+# slowest profiles each process keeps in REQUEST_PROFILE_DIR
+REQUEST_PROFILE_SAMPLE_RATE = float(os.environ.get("REQUEST_PROFILE_SAMPLE_RATE", 0))
+REQUEST_PROFILE_KEEP = 20
+REQUEST_PROFILE_DIR = BASE_DIR / "profiles"
+# Queries at least this slow are logged with their EXPLAIN plan (store/querylog.py);
+# None turns the log off. The last SLOW_QUERY_LOG_SIZE are kept per process.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 200
+# Report requests that run the same query with NPLUSONE_THRESHOLD or more different
+# parameter sets, with the stack of the repeated access (store/nplusone.py).
+# "log", "warn" or "raise"; off when unset. For development and staging.
+NPLUSONE_MODE = os.environ.get("NPLUSONE_MODE") or None
+NPLUSONE_THRESHOLD = 5
+
+# Caches
+# "shared" is seen by every server process: Redis when CACHE_REDIS_URL is set
+# (needs the redis package), otherwise files under .cache/. "catalog" keeps a
+# small in-process LRU in front of it for catalog responses (store/caching.py).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["CACHE_REDIS_URL"],
+    } if os.environ.get("CACHE_REDIS_URL") else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".cache",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "catalog": {
+        "BACKEND": "store.cache_backends.TieredCache",
+        "OPTIONS": {"SHARED": "shared", "LOCAL_MAX_ENTRIES": 200, "LOCAL_TIMEOUT": 60},
+    },
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -213,6 +288,34 @@ ZARINPAL_MERCHANT_ID = 'sandbox'  # Replace with your actual merchant ID
 ZARINPAL_SANDBOX = True
 ZARINPAL_CALLBACK_URL = 'http://localhost:8000/api/payment/callback/'
 
+# Base URL of a local gateway simulator (python manage.py run_mock_gateway), e.g. 'http://127.0.0.1:8010'.
+# When set, the real ZarinPal client talks to it instead of ZarinPal.
+ZARINPAL_API_BASE = None
+
+# Maximum concurrent gateway verifications per ASGI event loop (async callback path)
+PAYMENT_VERIFY_CONCURRENCY = 100
+
+# Seconds an unpaid order holds its reserved stock before release_expired_reservations frees it
+STOCK_RESERVATION_TIMEOUT = 30 * 60
+
+# Longest each process reuses the quote pricing rules (volume tiers, surcharges); a rule change reloads them sooner
+PRICING_RULES_TTL = 5 * 60
+
+# Email, used by the notification worker (python manage.py send_notifications).
+# For local testing run python manage.py run_mock_smtp, which listens on localhost:1025.
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = 'Stone Store <no-reply@stonestore.local>'
+
+# Addresses told about new quotes; when empty, every active staff user with an email
+NOTIFICATION_STAFF_EMAILS = []
+# Notifications claimed and sent over one SMTP connection at a time
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_MAX_ATTEMPTS = 5
+# Seconds before a failed send is retried
+NOTIFICATION_RETRY_DELAY = 60
+
 # Mock payment for development (set to True to use mock instead of real ZarinPal)
 USE_MOCK_PAYMENT = True
 
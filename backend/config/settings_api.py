@@ -0,0 +1,59 @@
+"""
+API-only profile: serves /api/ and the payment callback, without the admin.
+
+    DJANGO_SETTINGS_MODULE=config.settings_api gunicorn config.wsgi
+
+Leaves out the admin, jazzmin, sessions, messages and static files, along
+with their middleware, so each worker imports less and starts faster.
+API clients authenticate with tokens, so session and CSRF handling is not
+needed. Run migrations, collectstatic and the admin with the full profile
+(config.settings); the database and caches are the same.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django_filters",
+    "rest_framework",
+    "rest_framework.authtoken",
+    "corsheaders",
+    "store",
+]
+
+MIDDLEWARE = [
+    "corsheaders.middleware.CorsMiddleware",
+    "store.instrumentation.ServerTimingMiddleware",
+    "store.nplusone.NPlusOneMiddleware",
+    "store.compression.CompressionMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.locale.LocaleMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "store.routing.ReplicaRoutingMiddleware",
+]
+
+ROOT_URLCONF = "config.urls_api"
+
+# Still needed for the payment result page and notification emails
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "DIRS": [BASE_DIR / "templates"],
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+            ],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'store.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.FastJSONRenderer',
+    ],
+}
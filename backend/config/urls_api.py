@@ -0,0 +1,15 @@
+"""
+URL configuration for the API-only profile (config.settings_api).
+"""
+
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+
+urlpatterns = [
+    path("", include("store.urls")),
+]
+
+# Serve media files in development
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,15 +1,66 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from .order_states import ORDER_TRANSITIONS, transition_orders
+from .pricing import estimate_quotes
 from .models import (
     UserProfile, Category, Stone, StoneImage, StoneVideo, Project, ProjectImage, 
-    ProjectVideo, ProjectStone, Cart, CartItem, Quote, QuoteItem, Order, OrderItem
+    ProjectVideo, ProjectStone, Cart, CartItem, Quote, QuoteItem, Order, OrderItem,
+    DailyStoneSales, DailyCategorySales, DailyCitySales, DailyPaymentTypeSales,
+    StoneStock, StockReservation, VolumeTier, PriceSurcharge, Notification
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the database's row estimate instead of COUNT(*) for
+    unfiltered changelists of large tables. Filtered querysets, small tables and
+    databases without statistics (run ANALYZE) still get an exact count.
+    """
+    ESTIMATE_THRESHOLD = 10000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is not None and not queryset.query.where:
+            estimate = self.estimated_count(queryset)
+            if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+    
+    @staticmethod
+    def estimated_count(queryset):
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+        if not row or row[0] is None:
+            return None
+        estimate = int(str(row[0]).split()[0])
+        return estimate if estimate > 0 else None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables that grow without bound"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
     can_delete = False
@@ -30,6 +81,12 @@ class StoneVideoInline(admin.TabularInline):
     extra = 1
 
 
+class StoneStockInline(admin.TabularInline):
+    model = StoneStock
+    extra = 0
+    readonly_fields = ['updated_at']
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name_display', 'slug', 'created_at']
@@ -47,11 +104,12 @@ class CategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Stone)
-class StoneAdmin(admin.ModelAdmin):
+class StoneAdmin(LargeTableAdmin):
     list_display = ['name_display', 'category', 'origin', 'price_display', 'is_active', 'created_at']
     list_filter = ['category', 'origin', 'is_active', 'created_at']
+    list_select_related = ['category']
     search_fields = ['name_en', 'name_fa', 'description_en', 'description_fa']
-    inlines = [StoneImageInline, StoneVideoInline]
+    inlines = [StoneImageInline, StoneVideoInline, StoneStockInline]
     fieldsets = (
         ('Basic Information', {
             'fields': ('name_en', 'name_fa', 'category', 'description_en', 'description_fa'),
@@ -100,6 +158,7 @@ class ProjectVideoInline(admin.TabularInline):
 class ProjectStoneInline(admin.TabularInline):
     model = ProjectStone
     extra = 1
+    autocomplete_fields = ['stone']
 
 
 @admin.register(Project)
@@ -160,34 +219,43 @@ class ProjectAdmin(admin.ModelAdmin):
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ['stone']
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ['user', 'created_at', 'updated_at', 'is_active']
     list_filter = ['is_active', 'created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email']
+    autocomplete_fields = ['user']
     inlines = [CartItemInline]
 
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     list_display = ['cart', 'stone', 'quantity', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['cart__user', 'stone']
     search_fields = ['cart__user__username', 'stone__name_en']
+    autocomplete_fields = ['cart', 'stone']
 
 
 class QuoteItemInline(admin.TabularInline):
     model = QuoteItem
     extra = 0
+    autocomplete_fields = ['stone']
+    readonly_fields = ['estimated_unit_price', 'estimated_total']
 
 
 @admin.register(Quote)
-class QuoteAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'project_type', 'status', 'created_at']
+class QuoteAdmin(LargeTableAdmin):
+    list_display = ['name', 'email', 'project_type', 'status', 'estimated_total', 'created_at']
     list_filter = ['status', 'project_type', 'created_at']
     search_fields = ['name', 'email', 'company', 'project_type']
     inlines = [QuoteItemInline]
+    readonly_fields = ['estimated_total', 'estimated_at']
+    actions = ['re_estimate']
     fieldsets = (
         ('Contact Information', {
             'fields': ('name', 'email', 'company', 'phone')
@@ -196,22 +264,213 @@ class QuoteAdmin(admin.ModelAdmin):
             'fields': ('project_type', 'project_location', 'timeline', 'additional_notes')
         }),
         ('Status', {
-            'fields': ('status',)
+            'fields': ('status', 'estimated_total', 'estimated_at')
         }),
     )
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        estimate_quotes(Quote.objects.filter(pk=form.instance.pk))
+    
+    def re_estimate(self, request, queryset):
+        estimated = estimate_quotes(queryset)
+        self.message_user(request, f'{estimated} quote(s) re-estimated.')
+    re_estimate.short_description = 'Re-estimate selected quotes'
 
 
 @admin.register(QuoteItem)
-class QuoteItemAdmin(admin.ModelAdmin):
-    list_display = ['quote', 'stone', 'quantity', 'notes']
+class QuoteItemAdmin(LargeTableAdmin):
+    list_display = ['quote', 'stone', 'quantity', 'selected_finish', 'selected_thickness', 'estimated_total']
     list_filter = ['quote__status']
+    list_select_related = ['quote', 'stone']
     search_fields = ['quote__name', 'stone__name_en']
+    autocomplete_fields = ['quote', 'stone']
+
+
+def order_transition_action(target):
+    """Build an admin action moving the selected orders to target in one set-based operation"""
+    def action(modeladmin, request, queryset):
+        selected = queryset.count()
+        moved = transition_orders(queryset, target)
+        modeladmin.message_user(
+            request,
+            f'{moved} order(s) marked as {target}; {selected - moved} skipped because the transition is not allowed.'
+        )
+    action.__name__ = f'mark_{target}'
+    action.short_description = f'Mark selected orders as {target}'
+    return action
+
+
+def is_open(order):
+    """Whether an order's lines and totals may still be edited; once paid, the sales rollups count them"""
+    return order is None or order.status == 'pending'
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    autocomplete_fields = ['stone']
+    
+    def has_add_permission(self, request, obj):
+        return is_open(obj) and super().has_add_permission(request, obj)
+    
+    def has_change_permission(self, request, obj=None):
+        return is_open(obj) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        return is_open(obj) and super().has_delete_permission(request, obj)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['order_number', 'user', 'status', 'payment_status', 'total_amount', 'tracking_code', 'created_at']
+    list_filter = ['status', 'payment_type', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['order_number', 'tracking_code', 'user__username']
+    autocomplete_fields = ['user']
+    inlines = [OrderItemInline]
+    # Status only changes through the transition actions, which run the state machine's receivers
+    readonly_fields = ['status', 'tracking_code', 'payment_status', 'payment_date']
+    actions = [order_transition_action(target) for target in ORDER_TRANSITIONS if target != 'pending']
+    
+    def get_readonly_fields(self, request, obj=None):
+        if is_open(obj):
+            return self.readonly_fields
+        # What the sales rollups are keyed and summed on
+        return [*self.readonly_fields, 'total_amount', 'payment_type', 'shipping_city']
+    
+    def has_delete_permission(self, request, obj=None):
+        # Cancelling releases held stock and takes paid orders out of the rollups;
+        # deleting any other order would silently drop its reservations
+        return (obj is None or obj.status == 'cancelled') and super().has_delete_permission(request, obj)
+    
+    def get_actions(self, request):
+        # Bulk delete would bypass the per-order check above
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ['order_number', 'stone', 'quantity', 'price', 'selected_finish', 'selected_thickness']
+    list_filter = ['order__status']
+    list_select_related = ['order', 'stone']
+    search_fields = ['order__order_number', 'stone__name_en']
+    autocomplete_fields = ['order', 'stone']
+    
+    def has_change_permission(self, request, obj=None):
+        return (obj is None or is_open(obj.order)) and super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        # Lines of cancelled orders go when their order is deleted
+        deletable = obj is None or is_open(obj.order) or obj.order.status == 'cancelled'
+        return deletable and super().has_delete_permission(request, obj)
+    
+    def get_actions(self, request):
+        # Bulk delete would bypass the per-order check above
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'order':
+            kwargs['queryset'] = Order.objects.filter(status='pending')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def order_number(self, obj):
+        return obj.order.order_number
+    order_number.short_description = 'Order'
+    order_number.admin_order_field = 'order__order_number'
+
+
+@admin.register(VolumeTier)
+class VolumeTierAdmin(admin.ModelAdmin):
+    list_display = ['category', 'min_quantity', 'discount_percent']
+    list_filter = ['category']
+    list_select_related = ['category']
+
+
+@admin.register(PriceSurcharge)
+class PriceSurchargeAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'value', 'percent']
+    list_filter = ['kind']
+    search_fields = ['value']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(LargeTableAdmin):
+    """Reservations are created at checkout and settled by store.inventory"""
+    list_display = ['order', 'stock', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['order__user', 'stock__stone']
+    search_fields = ['order__order_number', 'stock__stone__name_en']
+    readonly_fields = ['order', 'stock', 'quantity', 'status', 'expires_at', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    """Email outbox; rows are written by store.notifications and sent by send_notifications"""
+    list_display = ['event', 'object_id', 'recipient', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'event']
+    search_fields = ['recipient']
+    readonly_fields = [
+        'event', 'object_id', 'recipient', 'status', 'attempts', 'last_error', 'created_at', 'claimed_at', 'sent_at'
+    ]
+    actions = ['requeue']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def requeue(self, request, queryset):
+        requeued = queryset.filter(status='failed').update(status='queued', attempts=0, last_error='')
+        self.message_user(request, f'{requeued} notification(s) queued again.')
+    requeue.short_description = 'Queue selected failed notifications again'
+
+
+class SalesRollupAdmin(LargeTableAdmin):
+    """Read-only view of a rollup table; rows are maintained by store.reporting"""
+    date_hierarchy = 'date'
+    list_filter = ['date']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        # Only rebuild_rollups may change these rows
+        return False
+
+
+@admin.register(DailyStoneSales)
+class DailyStoneSalesAdmin(SalesRollupAdmin):
+    list_display = ['date', 'stone', 'order_count', 'quantity', 'revenue']
+    list_select_related = ['stone']
+
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(SalesRollupAdmin):
+    list_display = ['date', 'category', 'order_count', 'quantity', 'revenue']
+    list_select_related = ['category']
+
+
+@admin.register(DailyCitySales)
+class DailyCitySalesAdmin(SalesRollupAdmin):
+    list_display = ['date', 'shipping_city', 'order_count', 'quantity', 'revenue']
+    search_fields = ['shipping_city']
+
+
+@admin.register(DailyPaymentTypeSales)
+class DailyPaymentTypeSalesAdmin(SalesRollupAdmin):
+    list_display = ['date', 'payment_type', 'order_count', 'quantity', 'revenue']
+    list_filter = ['date', 'payment_type']
 
 
 # Re-register UserAdmin
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
-
-# Register other models
-admin.site.register(Order)
-admin.site.register(OrderItem)
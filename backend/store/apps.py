@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "store"
+
+    def ready(self):
+        # Connect signal receivers that live outside models.py
+        from . import (  # noqa: F401
+            authentication, caching, instrumentation, inventory, notifications, nplusone, pricing, querylog, reporting,
+            routing,
+        )
@@ -0,0 +1,233 @@
+"""
+Async views for the ASGI deployment (config/asgi.py).
+
+They do the same work as their synchronous counterparts in views.py, but
+await network and database I/O, so thousands of in-flight requests cost
+coroutines instead of worker threads.
+"""
+import math
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .caching import aget_or_build, aresponse_cache_key
+from .compression import payload_response, precompress
+from .instrumentation import measure, serializing
+from .models import Order
+from .payment import ZarinPalPayment, verification_slot
+from .renderers import dumps
+from .routing import read_from_replica
+from .views import CategoryViewSet, ProjectViewSet, StoneViewSet, processed_payment_result
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPaymentCallbackView(View):
+    """Handle ZarinPal payment callbacks without blocking a worker on verification"""
+
+    async def get(self, request):
+        return await self.callback(request, request.GET)
+
+    async def post(self, request):
+        return await self.callback(request, request.POST)
+
+    async def callback(self, request, params):
+        authority = params.get('Authority')
+        status_param = params.get('Status')
+
+        if not authority:
+            return JsonResponse({'error': 'Missing Authority parameter'}, status=400)
+
+        try:
+            order = await Order.objects.aget(payment_id=authority)
+        except Order.DoesNotExist:
+            return render(request, 'payment/payment_result.html', {
+                'success': False,
+                'message': 'سفارش یافت نشد'
+            })
+
+        # Check if order is already processed
+        if order.status != 'pending':
+            return processed_payment_result(request, order)
+
+        try:
+            if status_param != 'OK':
+                # Payment was cancelled by user
+                if not await sync_to_async(order.mark_cancelled)('cancelled'):
+                    await order.arefresh_from_db()
+                    return processed_payment_result(request, order)
+                return render(request, 'payment/payment_result.html', {
+                    'success': False,
+                    'message': 'پرداخت توسط کاربر لغو شد',
+                    'order_number': order.order_number
+                })
+
+            async with verification_slot():
+                verification_result = await ZarinPalPayment().averify_payment(authority, order.total_amount)
+
+            if verification_result['success']:
+                # A duplicate callback or reservation expiry may have moved the order while we verified
+                if not await sync_to_async(order.mark_paid)():
+                    await order.arefresh_from_db()
+                    return processed_payment_result(request, order)
+                return render(request, 'payment/payment_result.html', {
+                    'success': True,
+                    'message': 'پرداخت با موفقیت انجام شد',
+                    'order_number': order.order_number,
+                    'ref_id': verification_result['ref_id']
+                })
+
+            if not await sync_to_async(order.mark_cancelled)('failed'):
+                await order.arefresh_from_db()
+                return processed_payment_result(request, order)
+            return render(request, 'payment/payment_result.html', {
+                'success': False,
+                'message': 'تأیید پرداخت ناموفق بود',
+                'order_number': order.order_number
+            })
+        except Exception as e:
+            return render(request, 'payment/payment_result.html', {
+                'success': False,
+                'message': f'خطا در پردازش پرداخت: {str(e)}'
+            })
+
+
+class AsyncCatalogView(View):
+    """
+    Read-only catalog endpoint served with the async ORM.
+
+    Mirrors a ReadOnlyModelViewSet from views.py: same queryset, serializer,
+    filter fields, search, ordering, pagination and response cache, and the
+    same JSON. The queryset must prefetch everything the serializer touches,
+    since serializing runs on the event loop where lazy queries are refused.
+    """
+    viewset = None
+    basename = None
+
+    async def get(self, request, pk=None):
+        viewset = self.viewset()
+        action = 'list' if pk is None else 'retrieve'
+        if settings.REPLICA_DATABASES:
+            # The API-only profile has no AuthenticationMiddleware; token clients read as anonymous here
+            user = await request.auser() if hasattr(request, 'auser') else AnonymousUser()
+            await sync_to_async(read_from_replica)(request, user)
+
+        async def build():
+            if pk is None:
+                data = await self.list_data(Request(request), viewset)
+            else:
+                data = await self.retrieve_data(Request(request), viewset, pk)
+            # The same bytes the DRF viewset sends
+            with measure('render'):
+                return precompress(dumps(data))
+
+        try:
+            timeout = viewset.cache_timeouts.get(action)
+            if timeout:
+                key, store = await aresponse_cache_key(f'{self.basename}-async', action, viewset.cache_models, request)
+                payload, hit = await aget_or_build(key, build, timeout, store=store)
+            else:
+                payload, hit = await build(), False
+        except Http404 as e:
+            return self.json({'detail': str(e)}, status=404)
+        except ValidationError as e:
+            return self.json(e.message_dict, status=400)
+
+        response = payload_response(request, payload)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    def json(self, data, status=200):
+        return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+    async def filter_queryset(self, request, viewset):
+        queryset = viewset.queryset.all()
+        model = queryset.model
+        errors = {}
+        for name in getattr(viewset, 'filterset_fields', []):
+            value = request.query_params.get(name)
+            if value in (None, ''):
+                continue
+            field = model._meta.get_field(name)
+            try:
+                if field.is_relation:
+                    valid = await field.related_model._default_manager.filter(pk=value).aexists()
+                else:
+                    field.to_python(value)
+                    valid = True
+            except (ValueError, ValidationError):
+                valid = False
+            if valid:
+                queryset = queryset.filter(**{name: value})
+            else:
+                errors[name] = ['Select a valid choice. That choice is not one of the available choices.'
+                                if field.is_relation else 'Enter a valid value.']
+        if errors:
+            raise ValidationError(errors)
+
+        # Search and ordering only build the query, so DRF's own backends apply unchanged
+        for backend in (SearchFilter, OrderingFilter):
+            queryset = backend().filter_queryset(request, queryset, viewset)
+        return queryset
+
+    async def list_data(self, request, viewset):
+        queryset = await self.filter_queryset(request, viewset)
+        page_size = api_settings.PAGE_SIZE
+        count = await queryset.acount()
+        page_count = max(1, math.ceil(count / page_size))
+        page = request.query_params.get('page', 1)
+        try:
+            page = page_count if page == 'last' else int(page)
+        except ValueError:
+            raise Http404('Invalid page.')
+        if not 1 <= page <= page_count:
+            raise Http404('Invalid page.')
+
+        offset = (page - 1) * page_size
+        objects = [obj async for obj in queryset[offset:offset + page_size].aiterator(chunk_size=page_size)]
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+        serializer = viewset.serializer_class(objects, many=True, context={'request': request})
+        with serializing(serializer):
+            results = serializer.data
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', page + 1) if page < page_count else None,
+            'previous': previous,
+            'results': results,
+        }
+
+    async def retrieve_data(self, request, viewset, pk):
+        try:
+            obj = await viewset.queryset.aget(pk=pk)
+        except viewset.queryset.model.DoesNotExist:
+            raise Http404(f'No {viewset.queryset.model._meta.object_name} matches the given query.')
+        serializer = viewset.serializer_class(obj, context={'request': request})
+        with serializing(serializer):
+            return serializer.data
+
+
+class AsyncCategoryView(AsyncCatalogView):
+    viewset = CategoryViewSet
+    basename = 'category'
+
+
+class AsyncStoneView(AsyncCatalogView):
+    viewset = StoneViewSet
+    basename = 'stone'
+
+
+class AsyncProjectView(AsyncCatalogView):
+    viewset = ProjectViewSet
+    basename = 'project'
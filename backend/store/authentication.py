@@ -0,0 +1,79 @@
+"""
+Token authentication with a cache in front of the token lookup.
+
+DRF's TokenAuthentication queries the token and its user on every request.
+CachedTokenAuthentication keeps the resolved user, with its profile, in the
+AUTH_TOKEN_CACHE cache for AUTH_TOKEN_CACHE_TTL seconds, so repeated calls
+from the same client skip the query. That cache is shared by every process,
+so dropping an entry revokes it everywhere. Entries are dropped when the
+token is deleted or replaced (logout, rotation) and whenever the user or
+profile is saved, which covers deactivation. They are dropped again once the
+change commits, since until then other requests still read the old rows and
+may cache them anew.
+"""
+import hashlib
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .models import UserProfile
+
+
+def token_cache_key(key):
+    # Hash the token so the raw credential never appears in a shared cache
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_cache():
+    # Revocations must reach every process, so never a process-local cache
+    return caches[settings.AUTH_TOKEN_CACHE]
+
+
+def forget_keys(keys):
+    cache_keys = [token_cache_key(key) for key in keys]
+    token_cache().delete_many(cache_keys)
+    # Again after commit, so no request can re-cache the rows this change replaces
+    transaction.on_commit(lambda: token_cache().delete_many(cache_keys))
+
+
+def forget_tokens(user_id):
+    forget_keys(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        user = token_cache().get(cache_key)
+        if user is None:
+            try:
+                token = self.get_model().objects.select_related('user__profile').get(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            user = token.user
+            token_cache().set(cache_key, user, settings.AUTH_TOKEN_CACHE_TTL)
+        # request.auth stays a Token, as with TokenAuthentication, without loading it
+        return (user, Token(key=key, user=user))
+
+
+@receiver([post_save, post_delete], sender=Token)
+def forget_token(sender, instance, **kwargs):
+    forget_keys([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def forget_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    # New users have no token yet, and a login only stamps last_login, which
+    # the cached user does not need to reflect. A new profile must replace
+    # the cached "no profile" though.
+    if (created and sender is User) or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    forget_tokens(instance.pk if sender is User else instance.user_id)
@@ -0,0 +1,235 @@
+"""
+Response caching for the public catalog.
+
+Catalog responses are stored in the ``catalog`` cache (a TieredCache: an
+in-process LRU in front of the shared cache) under keys that embed a
+version per model the response is built from. Saving or deleting a stone,
+category, project or any of their media bumps that model's version once
+the transaction commits, so every cached response that depends on it is
+skipped from then on and simply ages out. Versions live only in the shared
+tier, so all processes see a bump at once.
+
+On a miss, one request per key rebuilds the response while the others wait
+briefly for its result instead of all hitting the database (BUILD_LOCK_TIMEOUT).
+TTLs are set per viewset action in ``cache_timeouts``. Entries hold the
+rendered JSON together with its gzip/Brotli variants (store/compression.py),
+so JSON hits are sent as stored bytes.
+
+Bulk changes that bypass model signals (``QuerySet.update()``,
+``bulk_create()``) need ``invalidate_catalog()`` or the ``clear_catalog_cache``
+command.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import random
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+from .compression import payload_response, precompress
+from .instrumentation import measure
+from .models import Category, Project, ProjectImage, ProjectStone, ProjectVideo, Stone, StoneImage, StoneVideo
+from .renderers import dumps
+from .routing import current_replica
+
+CATALOG_MODELS = [Category, Stone, StoneImage, StoneVideo, Project, ProjectImage, ProjectVideo, ProjectStone]
+# Seconds a rebuilding request holds the lock, and the most other requests wait for it
+BUILD_LOCK_TIMEOUT = 10
+BUILD_POLL_INTERVAL = 0.05
+
+
+def catalog_cache():
+    return caches['catalog']
+
+
+def versions_cache():
+    # Versions must never be served from a process-local copy
+    cache = catalog_cache()
+    return getattr(cache, 'shared', cache)
+
+
+def version_key(model):
+    return f'catalog-version:{model._meta.label_lower}'
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def model_versions(models):
+    """
+    The current version of each model. Versions are millisecond timestamps
+    of the last change, so a version lost to eviction is replaced by a newer
+    one rather than reused.
+    """
+    cache = versions_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, now_ms(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_versions(models):
+    cache = versions_cache()
+    keys = [version_key(model) for model in models]
+    current = cache.get_many(keys)
+    now = now_ms()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def invalidate_catalog():
+    bump_versions(CATALOG_MODELS)
+
+
+def get_or_build(key, build, timeout, store=True):
+    """
+    Return (value, hit). On a miss, only the request that takes the build
+    lock calls build(); the others poll for its result and fall back to
+    building themselves if it does not arrive. build() returning None means
+    "do not cache".
+    """
+    cache = catalog_cache()
+    value = cache.get(key)
+    if value is not None:
+        return value, True
+
+    lock_key = f'{key}:lock'
+    locks = versions_cache()
+    if locks.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+        try:
+            value = build()
+            if value is not None and store:
+                # Spread expiry so entries filled together do not all expire together
+                cache.set(key, value, int(timeout * random.uniform(0.9, 1.1)))
+        finally:
+            locks.delete(lock_key)
+        return value, False
+
+    deadline = time.monotonic() + BUILD_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+        if not locks.has_key(lock_key):
+            break
+    return build(), False
+
+
+def response_cache_key(basename, action, models, request):
+    """Return (key, store) for a catalog response"""
+    versions = model_versions(models)
+    # Absolute URLs in the response depend on the host; translated fields on the language
+    fingerprint = hashlib.sha1(
+        f'{request.build_absolute_uri()}|{getattr(request, "LANGUAGE_CODE", "")}'.encode()
+    ).hexdigest()
+    key = f'catalog:payload:{basename}:{action}:{"-".join(map(str, versions))}:{fingerprint}'
+    # A lagging replica may not have the latest change yet; do not pin its answer under the new version
+    store = not (current_replica() and now_ms() - max(versions) < settings.REPLICA_MAX_LAG * 1000)
+    return key, store
+
+
+def cache_response(view_method):
+    """Cache a catalog viewset action's successful responses for cache_timeouts[action] seconds"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        timeout = self.cache_timeouts.get(self.action)
+        if not timeout:
+            return view_method(self, request, *args, **kwargs)
+
+        key, store = response_cache_key(self.basename, self.action, self.cache_models, request)
+        responses = []
+
+        def build():
+            response = view_method(self, request, *args, **kwargs)
+            responses.append(response)
+            if response.status_code != 200:
+                return None
+            with measure('render'):
+                return precompress(dumps(response.data))
+
+        payload, hit = get_or_build(key, build, timeout, store=store)
+        if payload is None:
+            return responses[0]
+        if request.accepted_renderer.format == 'json':
+            response = payload_response(request, payload)
+        elif responses:
+            response = responses[0]
+        else:
+            # The browsable API renders data, not bytes
+            response = Response(json.loads(payload['identity']))
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    return wrapper
+
+
+async def aget_or_build(key, build, timeout, store=True):
+    """get_or_build() for async views; build is a coroutine function"""
+    cache = catalog_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        return value, True
+
+    lock_key = f'{key}:lock'
+    locks = versions_cache()
+    if await locks.aadd(lock_key, 1, BUILD_LOCK_TIMEOUT):
+        try:
+            value = await build()
+            if value is not None and store:
+                await cache.aset(key, value, int(timeout * random.uniform(0.9, 1.1)))
+        finally:
+            await locks.adelete(lock_key)
+        return value, False
+
+    deadline = time.monotonic() + BUILD_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(BUILD_POLL_INTERVAL)
+        value = await cache.aget(key)
+        if value is not None:
+            return value, True
+        if not await locks.ahas_key(lock_key):
+            break
+    return await build(), False
+
+
+# Cache backends do file or network I/O; keep it off the request's ORM thread
+aresponse_cache_key = sync_to_async(response_cache_key, thread_sensitive=False)
+
+
+class CatalogCacheMixin:
+    """Cache list and retrieve; cache_models lists every model the responses are built from"""
+    cache_models = ()
+    cache_timeouts = {}
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Stone)
+@receiver([post_save, post_delete], sender=StoneImage)
+@receiver([post_save, post_delete], sender=StoneVideo)
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=ProjectImage)
+@receiver([post_save, post_delete], sender=ProjectVideo)
+@receiver([post_save, post_delete], sender=ProjectStone)
+def invalidate_model(sender, **kwargs):
+    # After commit, so no request can cache the old rows under the new version
+    transaction.on_commit(lambda: bump_versions([sender]))
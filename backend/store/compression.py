@@ -0,0 +1,140 @@
+"""
+Response compression.
+
+CompressionMiddleware gzips responses of at least COMPRESSION_MIN_SIZE bytes,
+or compresses them with Brotli when the ``brotli`` package is installed and
+the client accepts ``br``. Only text and JSON responses to safe requests are
+compressed: responses to logins, checkouts and other writes carry tokens next
+to data the client sent, which compression would leak (BREACH).
+
+Catalog responses are cached already compressed (see ``precompress()`` and
+store/caching.py), so a cache hit sends stored bytes without rendering or
+compressing anything. These get higher compression levels, since each body is
+compressed once per cache fill rather than once per response.
+"""
+import gzip
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from rest_framework.permissions import SAFE_METHODS
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+# Levels for responses compressed as they are sent, and for cached payloads
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 9
+
+_accept_encoding_re = _lazy_re_compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def accepted_encodings(request):
+    """The encodings the client accepts that we can produce, best first"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        match = _accept_encoding_re.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+        if quality > 0:
+            accepted.add(match[1].lower())
+    encodings = []
+    if brotli is not None and 'br' in accepted:
+        encodings.append('br')
+    if 'gzip' in accepted:
+        encodings.append('gzip')
+    return encodings
+
+
+def compress(content, encoding, precompress=False):
+    if encoding == 'br':
+        return brotli.compress(content, quality=PRECOMPRESS_BROTLI_QUALITY if precompress else BROTLI_QUALITY)
+    # mtime=0 so the same content always compresses to the same bytes
+    return gzip.compress(content, compresslevel=PRECOMPRESS_GZIP_LEVEL if precompress else GZIP_LEVEL, mtime=0)
+
+
+def precompress(content):
+    """
+    A cacheable payload: the content and, if it is large enough, its
+    compressed variants, keyed by encoding ('identity', 'gzip', 'br').
+    """
+    payload = {'identity': content}
+    if len(content) >= settings.COMPRESSION_MIN_SIZE:
+        for encoding in ('gzip', 'br') if brotli is not None else ('gzip',):
+            compressed = compress(content, encoding, precompress=True)
+            if len(compressed) < len(content):
+                payload[encoding] = compressed
+    return payload
+
+
+def payload_response(request, payload, content_type='application/json'):
+    """Send a precompress() payload in the best encoding the client accepts"""
+    response = HttpResponse(payload['identity'], content_type=content_type)
+    if len(payload) > 1:
+        patch_vary_headers(response, ('Accept-Encoding',))
+        for encoding in accepted_encodings(request):
+            if encoding in payload:
+                response.content = payload[encoding]
+                response['Content-Encoding'] = encoding
+                break
+    return response
+
+
+def is_compressible(request, response):
+    return (
+        request.method in SAFE_METHODS
+        and not response.streaming
+        and not response.has_header('Content-Encoding')
+        and response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+        and len(response.content) >= settings.COMPRESSION_MIN_SIZE
+    )
+
+
+def compress_response(request, response):
+    if not is_compressible(request, response):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encodings = accepted_encodings(request)
+    if not encodings:
+        return response
+    compressed = compress(response.content, encodings[0])
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encodings[0]
+    # The body differs from the uncompressed one, so a strong ETag no longer matches it
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+class CompressionMiddleware:
+    """Compress text and JSON responses; place it above middleware that reads or changes the body"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        # Compressing a response body takes well under a millisecond; no thread hop
+        return compress_response(request, await self.get_response(request))
@@ -0,0 +1,132 @@
+"""
+Streaming CSV/JSONL exports of orders, quotes and the stone catalog.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and encoded
+in small batches, so memory stays flat regardless of how many rows are
+exported. Used by the staff export endpoint and the ``export_data`` command.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.utils import timezone
+from .models import Order, OrderItem, Quote, QuoteItem, Stone
+
+
+CHUNK_SIZE = 2000
+
+# Rows are encoded and handed to the consumer in batches of this many
+BATCH_ROWS = 500
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class ExportSpec:
+    """A dataset: its model, exported columns and filter fields"""
+
+    def __init__(self, model, columns, date_field, status_field=None):
+        self.model = model
+        self.columns = columns
+        self.date_field = date_field
+        self.status_field = status_field
+
+    def rows(self, since=None, until=None, status=None, chunk_size=CHUNK_SIZE):
+        queryset = self.model.objects.all()
+        # Compare against day boundaries rather than __date so the date column's index is usable
+        if since:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': _day_start(since)})
+        if until:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': _day_start(until + timedelta(days=1))})
+        if status and self.status_field:
+            queryset = queryset.filter(**{self.status_field: status})
+        return queryset.order_by('pk').values_list(*self.columns).iterator(chunk_size=chunk_size)
+
+
+DATASETS = {
+    'orders': ExportSpec(
+        Order,
+        ['id', 'order_number', 'tracking_code', 'user__username', 'status', 'total_amount',
+         'payment_type', 'payment_id', 'payment_status', 'payment_date',
+         'shipping_city', 'shipping_postal_code', 'shipping_phone', 'created_at'],
+        date_field='created_at', status_field='status',
+    ),
+    'order_items': ExportSpec(
+        OrderItem,
+        ['id', 'order_id', 'order__order_number', 'order__status', 'stone_id', 'stone__name_en',
+         'quantity', 'price', 'selected_finish', 'selected_thickness', 'order__created_at'],
+        date_field='order__created_at', status_field='order__status',
+    ),
+    'quotes': ExportSpec(
+        Quote,
+        ['id', 'user_id', 'name', 'email', 'company', 'phone', 'project_type', 'project_location',
+         'timeline', 'status', 'created_at'],
+        date_field='created_at', status_field='status',
+    ),
+    'quote_items': ExportSpec(
+        QuoteItem,
+        ['id', 'quote_id', 'quote__name', 'quote__status', 'stone_id', 'stone__name_en', 'quantity',
+         'quote__created_at'],
+        date_field='quote__created_at', status_field='quote__status',
+    ),
+    'stones': ExportSpec(
+        Stone,
+        ['id', 'name_en', 'name_fa', 'category_id', 'category__slug', 'origin', 'price', 'is_active',
+         'created_at', 'updated_at'],
+        date_field='created_at',
+    ),
+}
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _batched(rows, encode):
+    batch = []
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) >= BATCH_ROWS:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    yield from _batched(rows, lambda row: writer.writerow([_plain(value) for value in row]))
+
+
+def stream_jsonl(columns, rows):
+    yield from _batched(
+        rows,
+        lambda row: json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n'
+    )
+
+
+def stream_export(dataset, output='csv', **filters):
+    """Yield the encoded export of dataset as text chunks"""
+    spec = DATASETS[dataset]
+    rows = spec.rows(**filters)
+    if output == 'jsonl':
+        return stream_jsonl(spec.columns, rows)
+    return stream_csv(spec.columns, rows)
@@ -0,0 +1,295 @@
+"""
+Per-request performance instrumentation.
+
+ServerTimingMiddleware measures, for every request:
+
+- db: time and count of SQL queries, on every database alias,
+- serialize: time in to_representation() of serializers made by a view's
+  get_serializer(), including the queries it triggers,
+- render: time rendering the response body (and compressing cached catalog
+  payloads),
+- gateway: time waiting for the payment gateway,
+- total: time through the middleware stack below this middleware,
+
+and sends them in a ``Server-Timing`` header, which browser dev tools show
+per request. serialize and render need InstrumentedViewMixin on the view.
+Totals also go into per-endpoint latency histograms, kept per process and
+served to staff at /api/metrics/timings/.
+
+With REQUEST_PROFILE_SAMPLE_RATE above 0, that fraction of DRF requests is
+run under cProfile, and the REQUEST_PROFILE_KEEP slowest are kept as
+.prof files in REQUEST_PROFILE_DIR, e.g. ``python -m pstats <file>``.
+With sampling off, the cost is a few timer calls per request and per query.
+Set SERVER_TIMING = False to take the middleware out entirely.
+"""
+import cProfile
+import functools
+import heapq
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.response import SimpleTemplateResponse
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+METRICS = ('db', 'serialize', 'render', 'gateway')
+
+_state = ContextVar('request_timings', default=None)
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+_profiles = []
+_profiles_lock = threading.Lock()
+
+
+class RequestTimings:
+    """Seconds spent per metric, and how many times each was entered, for one request"""
+
+    def __init__(self, request):
+        self.request = request
+        # Class name of the serializer currently building the response, if any
+        self.serializer = None
+        self.durations = dict.fromkeys(METRICS, 0.0)
+        self.counts = dict.fromkeys(METRICS, 0)
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+        self.counts[name] += 1
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's metric"""
+    timings = _state.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def serializing(serializer):
+    """measure('serialize'), also noting which serializer is running for the slow query log"""
+    timings = _state.get()
+    if timings is None:
+        yield
+        return
+    outer = timings.serializer
+    timings.serializer = type(getattr(serializer, 'child', serializer)).__name__
+    try:
+        with measure('serialize'):
+            yield
+    finally:
+        timings.serializer = outer
+
+
+def current_origin():
+    """(endpoint, serializer) of the request running in this context, or (None, None)"""
+    timings = _state.get()
+    if timings is None:
+        return None, None
+    return endpoint_name(timings.request), timings.serializer
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _state.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Connections are per thread, and async views query from sync_to_async threads
+    if settings.SERVER_TIMING and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def server_timing(timings, total):
+    entries = [f'db;dur={timings.durations["db"] * 1000:.1f};desc="{timings.counts["db"]} queries"']
+    entries += [
+        f'{name};dur={timings.durations[name] * 1000:.1f}'
+        for name in METRICS[1:] if timings.counts[name]
+    ]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return f'{request.method} {match.view_name if match else "<unresolved>"}'
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.durations = dict.fromkeys(METRICS, 0.0)
+
+    def add(self, timings, total):
+        ms = total * 1000
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += total
+        self.queries += timings.counts['db']
+        for name in METRICS:
+            self.durations[name] += timings.durations[name]
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of requests (None: above the last bound)"""
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= fraction * self.count:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total * 1000 / self.count, 2),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'avg_queries': round(self.queries / self.count, 2),
+            **{f'avg_{name}_ms': round(self.durations[name] * 1000 / self.count, 2) for name in METRICS},
+            'buckets': dict(zip([*map(str, BUCKETS_MS), 'inf'], self.buckets)),
+        }
+
+
+def record_request(request, timings, total):
+    name = endpoint_name(request)
+    with _endpoints_lock:
+        stats = _endpoints.get(name)
+        if stats is None:
+            stats = _endpoints[name] = EndpointStats()
+        stats.add(timings, total)
+
+
+def timing_stats():
+    """This process's per-endpoint latency histograms, slowest total time first"""
+    with _endpoints_lock:
+        endpoints = {name: stats.as_dict() for name, stats in _endpoints.items()}
+    return {
+        'pid': os.getpid(),
+        'bucket_bounds_ms': list(BUCKETS_MS),
+        'endpoints': dict(sorted(endpoints.items(), key=lambda item: -item[1]['count'] * item[1]['avg_ms'])),
+    }
+
+
+def keep_profile(profiler, duration, request):
+    """Dump the profile if it is among the REQUEST_PROFILE_KEEP slowest, dropping the fastest kept one"""
+    with _profiles_lock:
+        if len(_profiles) >= settings.REQUEST_PROFILE_KEEP and duration <= _profiles[0][0]:
+            return
+        os.makedirs(settings.REQUEST_PROFILE_DIR, exist_ok=True)
+        view = endpoint_name(request).replace(' ', '-').replace(':', '-')
+        path = os.path.join(
+            settings.REQUEST_PROFILE_DIR, f'{duration * 1000:.0f}ms-{view}-{os.getpid()}-{time.time_ns()}.prof'
+        )
+        profiler.dump_stats(path)
+        heapq.heappush(_profiles, (duration, path))
+        if len(_profiles) > settings.REQUEST_PROFILE_KEEP:
+            _, dropped = heapq.heappop(_profiles)
+            try:
+                os.remove(dropped)
+            except OSError:
+                pass
+
+
+class ServerTimingMiddleware:
+    """Time each request; place it near the top so total covers the other middleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings(request)
+        token = _state.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings(request)
+        token = _state.set(timings)
+        start = time.perf_counter()
+        try:
+            # Queries run in sync_to_async threads, which see this context's timings
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        response['Server-Timing'] = server_timing(timings, total)
+        record_request(request, timings, total)
+        return response
+
+
+class InstrumentedViewMixin:
+    """For DRF views: time serializers and rendering, and profile sampled requests"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _state.get() is not None:
+            # .data calls to_representation on the outermost serializer once
+            to_representation = serializer.to_representation
+
+            @functools.wraps(to_representation)
+            def timed_to_representation(*args, **kwargs):
+                with serializing(serializer):
+                    return to_representation(*args, **kwargs)
+
+            serializer.to_representation = timed_to_representation
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Django would render it after the view returns, out of reach of the timers
+        if _state.get() is not None and isinstance(response, SimpleTemplateResponse) and not response.is_rendered:
+            with measure('render'):
+                response.render()
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        rate = settings.REQUEST_PROFILE_SAMPLE_RATE
+        if not rate or _state.get() is None or random.random() >= rate:
+            return super().dispatch(request, *args, **kwargs)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            profiler.disable()
+            keep_profile(profiler, time.perf_counter() - start, request)
@@ -0,0 +1,110 @@
+"""
+Stock levels and checkout reservations.
+
+A stone is only stock-tracked when it has StoneStock rows. A cart line uses
+the row for its exact finish/thickness, falling back to the stone's blank
+(any variant) row. Reserving is one conditional
+``UPDATE ... SET available = available - n WHERE available >= n`` per stock
+row, so there is no read-then-write race: if any row cannot cover its
+quantity, OutOfStock is raised and the caller's transaction rolls back.
+
+Held reservations are committed when their order is paid. Stock is handed
+back when the order is cancelled, including when it stays unpaid past
+STOCK_RESERVATION_TIMEOUT.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Order, StoneStock, StockReservation
+from .order_states import orders_transitioned, transition_orders
+
+
+class OutOfStock(Exception):
+    def __init__(self, stone):
+        self.stone = stone
+        super().__init__(f'Insufficient stock for stone: {stone.name_en}')
+
+
+def _stock_rows_for(lines):
+    """Map each line to its StoneStock row (or None when untracked) with one query"""
+    stone_ids = {line.stone_id for line in lines}
+    stocks = {
+        (stock.stone_id, stock.selected_finish, stock.selected_thickness): stock
+        for stock in StoneStock.objects.filter(stone_id__in=stone_ids)
+    }
+    return [
+        stocks.get((line.stone_id, line.selected_finish, line.selected_thickness))
+        or stocks.get((line.stone_id, '', ''))
+        for line in lines
+    ]
+
+
+def reserve_stock(order, lines):
+    """
+    Reserve stock for an order's lines (objects with stone, quantity,
+    selected_finish and selected_thickness). Must run inside a transaction;
+    raises OutOfStock, leaving the rollback to the caller.
+    """
+    needed = defaultdict(int)
+    stones = {}
+    for line, stock in zip(lines, _stock_rows_for(lines)):
+        if stock is not None:
+            needed[stock.pk] += line.quantity
+            stones[stock.pk] = line.stone
+
+    # Fixed lock order keeps concurrent checkouts from deadlocking on PostgreSQL
+    for stock_id in sorted(needed):
+        quantity = needed[stock_id]
+        updated = StoneStock.objects.filter(pk=stock_id, available__gte=quantity).update(
+            available=F('available') - quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            raise OutOfStock(stones[stock_id])
+
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TIMEOUT)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, stock_id=stock_id, quantity=quantity, expires_at=expires_at)
+        for stock_id, quantity in needed.items()
+    ])
+
+
+def release_reservations(reservations):
+    """Hand reservations back to stock, set-based. Returns the number released."""
+    with transaction.atomic():
+        # Lock first: PostgreSQL does not allow FOR UPDATE together with GROUP BY
+        reservation_ids = list(
+            reservations.exclude(status='released').select_for_update().values_list('pk', flat=True)
+        )
+        if not reservation_ids:
+            return 0
+        locked = StockReservation.objects.filter(pk__in=reservation_ids)
+        returned = locked.values('stock_id').annotate(quantity=Sum('quantity')).order_by('stock_id')
+        for row in returned:
+            StoneStock.objects.filter(pk=row['stock_id']).update(
+                available=F('available') + row['quantity'], updated_at=timezone.now()
+            )
+        return locked.update(status='released')
+
+
+def release_expired_reservations(now=None):
+    """
+    Cancel pending orders whose reservations have expired, which hands
+    their stock back. Returns the number of orders cancelled.
+    """
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status='held', expires_at__lte=now).values('order_id')
+    expired_orders = Order.objects.filter(status='pending', pk__in=expired)
+    return transition_orders(expired_orders, 'cancelled', payment_status='expired')
+
+
+@receiver(orders_transitioned)
+def settle_reservations(sender, source, target, order_ids, **kwargs):
+    reservations = StockReservation.objects.filter(order_id__in=order_ids)
+    if target == 'paid':
+        reservations.filter(status='held').update(status='committed')
+    elif target == 'cancelled':
+        release_reservations(reservations)
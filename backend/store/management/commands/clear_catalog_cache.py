@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.caching import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Invalidate every cached catalog response, e.g. after bulk imports that bypass model signals'
+
+    def handle(self, *args, **options):
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS('Catalog cache invalidated'))
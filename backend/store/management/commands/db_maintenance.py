@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Refresh planner statistics, reclaim space and report table and index usage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='Refresh the statistics the query planner uses')
+        parser.add_argument('--vacuum', action='store_true', help='Reclaim free pages (rewrites the SQLite file)')
+        parser.add_argument('--stats', action='store_true', help='Print table and index statistics')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+        # Without flags, do the routine nightly run
+        if not (options['analyze'] or options['vacuum'] or options['stats']):
+            options.update(analyze=True, stats=True)
+
+        sqlite = connection.vendor == 'sqlite'
+        with connection.cursor() as cursor:
+            if options['vacuum']:
+                self.stdout.write('Vacuuming...')
+                # VACUUM cannot run inside a transaction on either backend
+                cursor.execute('VACUUM' if sqlite else 'VACUUM (ANALYZE)')
+            if options['analyze']:
+                self.stdout.write('Analyzing...')
+                cursor.execute('ANALYZE')
+                if sqlite:
+                    cursor.execute('PRAGMA optimize')
+            if options['stats']:
+                self.sqlite_stats(cursor) if sqlite else self.postgresql_stats(cursor)
+
+        self.stdout.write(self.style.SUCCESS('Database maintenance finished'))
+
+    def sqlite_stats(self, cursor):
+        settings = {}
+        for pragma in ('journal_mode', 'page_size', 'page_count', 'freelist_count'):
+            cursor.execute(f'PRAGMA {pragma}')
+            settings[pragma] = cursor.fetchone()[0]
+        size = settings['page_size'] * settings['page_count'] / 2 ** 20
+        free = settings['page_size'] * settings['freelist_count'] / 2 ** 20
+        self.stdout.write(f"Journal mode {settings['journal_mode']}, {size:.1f} MB on disk, {free:.1f} MB free")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if not cursor.fetchone():
+            self.stdout.write(self.style.WARNING('No statistics yet, run with --analyze'))
+            return
+        # The first number in "stat" is the row count; rows with idx = NULL describe tables without indexes
+        cursor.execute('SELECT tbl, idx, stat FROM sqlite_stat1 ORDER BY tbl, idx')
+        table = None
+        for tbl, index, stat in cursor.fetchall():
+            if tbl != table:
+                table = tbl
+                self.stdout.write(f'{table}: ~{stat.split()[0]} rows')
+            if index is not None:
+                self.stdout.write(f'  {index}: {stat}')
+
+    def postgresql_stats(self, cursor):
+        cursor.execute("""
+            SELECT relname, n_live_tup, n_dead_tup, seq_scan, idx_scan, last_analyze, last_autoanalyze
+            FROM pg_stat_user_tables ORDER BY n_live_tup DESC
+        """)
+        for table, live, dead, seq_scan, idx_scan, analyzed, autoanalyzed in cursor.fetchall():
+            last = max(filter(None, (analyzed, autoanalyzed)), default=None)
+            analyzed = f'analyzed {last:%Y-%m-%d %H:%M}' if last else 'never analyzed'
+            self.stdout.write(f'{table}: ~{live} rows, {dead} dead, {seq_scan} seq / {idx_scan or 0} index scans, {analyzed}')
+
+        # Indexes never used since the statistics were reset only slow down writes
+        cursor.execute("""
+            SELECT s.relname, s.indexrelname, pg_size_pretty(pg_relation_size(s.indexrelid))
+            FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid
+            WHERE s.idx_scan = 0 AND NOT i.indisunique
+            ORDER BY pg_relation_size(s.indexrelid) DESC
+        """)
+        for table, index, size in cursor.fetchall():
+            self.stdout.write(self.style.WARNING(f'Unused index {index} on {table} ({size})'))
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from store.models import Quote
+from store.pricing import OPEN_STATUSES, estimate_quotes, reprice_stale_quotes
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored quote price estimates, e.g. after price or rule changes or bulk price imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Include completed and cancelled quotes')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only open quotes marked stale by a price or rule change')
+        parser.add_argument('--loop', action='store_true', help='With --stale, keep running instead of exiting')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop (default: 60)')
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            while True:
+                estimated = reprice_stale_quotes()
+                self.stdout.write(f'Re-estimated {estimated} stale quote(s)')
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+            return
+
+        quotes = Quote.objects.all()
+        if not options['all']:
+            quotes = quotes.filter(status__in=OPEN_STATUSES)
+
+        self.stdout.write('Estimating quotes...')
+        estimated = estimate_quotes(quotes)
+        self.stdout.write(self.style.SUCCESS(f'Successfully estimated {estimated} quote(s)!'))
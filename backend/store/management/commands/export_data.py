@@ -0,0 +1,35 @@
+import sys
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from store.exports import CHUNK_SIZE, DATASETS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream orders, quotes or the stone catalog to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--output-format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--since', help='Only rows created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only rows created on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only orders/quotes (or their items) in this status')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else None
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        chunks = stream_export(
+            options['dataset'], options['output_format'],
+            since=since, until=until, status=options['status'], chunk_size=options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Exported {options['dataset']} to {options['output']}"))
+        else:
+            sys.stdout.writelines(chunks)
@@ -0,0 +1,53 @@
+import csv
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from store.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users from a CSV file (username, email, first_name, last_name, phone, address)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(str(e))
+        if rows and 'username' not in rows[0]:
+            raise CommandError('The CSV needs at least a username column')
+
+        created = skipped = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            existing = set(User.objects.filter(username__in=[row['username'] for row in batch]).values_list('username', flat=True))
+            new_rows = [row for row in batch if row['username'] not in existing]
+            skipped += len(batch) - len(new_rows)
+
+            with transaction.atomic():
+                # Imported users set a password through the reset flow
+                users = [
+                    User(
+                        username=row['username'],
+                        email=row.get('email', ''),
+                        first_name=row.get('first_name', ''),
+                        last_name=row.get('last_name', ''),
+                        password='!',
+                    )
+                    for row in new_rows
+                ]
+                users = User.objects.bulk_create(users)
+                # Profiles are only needed for users with profile data; the rest get one lazily
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, phone=row.get('phone') or None, address=row.get('address') or None)
+                    for user, row in zip(users, new_rows)
+                    if row.get('phone') or row.get('address')
+                ])
+            created += len(users)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {created} user(s), skipped {skipped} existing'))
@@ -0,0 +1,24 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from store.reporting import ROLLUPS, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup tables from orders (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        self.stdout.write('Rebuilding sales rollups...')
+        rebuild_rollups(since=since)
+        for name, (model, key) in ROLLUPS.items():
+            self.stdout.write(f'  {name}: {model.objects.count()} rows')
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt sales rollups!'))
@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from store.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid orders whose stock reservations have expired and return their stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop (default: 60)')
+
+    def handle(self, *args, **options):
+        while True:
+            cancelled = release_expired_reservations()
+            self.stdout.write(f'Released reservations of {cancelled} expired order(s)')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
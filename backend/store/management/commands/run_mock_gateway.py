@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.mock_gateway import GatewayConfig, MockGatewayServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local ZarinPal gateway simulator for load testing the checkout and callback flow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8010)
+        parser.add_argument('--latency', default='fixed:0',
+                            help='Gateway latency in ms: fixed:N, uniform:LO,HI, normal:MEAN,SD or lognormal:MU,SIGMA')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of API calls answered with a gateway error payload')
+        parser.add_argument('--server-error-rate', type=float, default=0.0,
+                            help='Fraction of API calls answered with HTTP 503')
+        parser.add_argument('--pay-success-rate', type=float, default=1.0,
+                            help='Fraction of StartPay visits that complete the payment')
+        parser.add_argument('--callback-mode', choices=['redirect', 'push', 'both'], default='redirect',
+                            help='Redirect the browser to the callback, push it server-to-server, or both')
+        parser.add_argument('--callback-delay', default='fixed:0',
+                            help='Delay before pushed callbacks, same format as --latency')
+        parser.add_argument('--duplicate-rate', type=float, default=0.0,
+                            help='Fraction of pushed callbacks delivered twice')
+        parser.add_argument('--drop-rate', type=float, default=0.0,
+                            help='Fraction of pushed callbacks never delivered')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--verbose-requests', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        try:
+            config = GatewayConfig(
+                latency=options['latency'],
+                error_rate=options['error_rate'],
+                server_error_rate=options['server_error_rate'],
+                pay_success_rate=options['pay_success_rate'],
+                callback_mode=options['callback_mode'],
+                callback_delay=options['callback_delay'],
+                duplicate_rate=options['duplicate_rate'],
+                drop_rate=options['drop_rate'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        server = MockGatewayServer((options['host'], options['port']), config,
+                                   verbose=options['verbose_requests'])
+        self.stdout.write(self.style.SUCCESS(f'Mock ZarinPal gateway listening on {server.base_url}'))
+        self.stdout.write(f'Set ZARINPAL_API_BASE = "{server.base_url}" and USE_MOCK_PAYMENT = False')
+        self.stdout.write(f'Counters: {server.base_url}/__stats__')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Final counters: {server.state.snapshot()}')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.mock_smtp import MockSMTPServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local debugging SMTP server that prints or counts notification emails instead of sending them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--latency', default='fixed:0',
+                            help='Delay per SMTP command in ms: fixed:N, uniform:LO,HI, normal:MEAN,SD or lognormal:MU,SIGMA')
+        parser.add_argument('--fail-rate', type=float, default=0.0,
+                            help='Fraction of recipients rejected with a temporary 451 error')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--quiet', action='store_true', help='Only count messages instead of printing them')
+
+    def handle(self, *args, **options):
+        try:
+            server = MockSMTPServer(
+                (options['host'], options['port']),
+                latency=options['latency'],
+                fail_rate=options['fail_rate'],
+                seed=options['seed'],
+                verbose=not options['quiet'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Mock SMTP server listening on {options["host"]}:{options["port"]}'))
+        self.stdout.write(f'Set EMAIL_HOST = "{options["host"]}" and EMAIL_PORT = {options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Final counters: {server.state.snapshot()}')
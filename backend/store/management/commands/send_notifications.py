@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from store.notifications import queue_stats, send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails in batches over pooled SMTP connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting once the queue is empty')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when the queue is empty (default: 5)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Notifications per SMTP connection (default: NOTIFICATION_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = send_batch(options['batch_size'])
+                if not sent and not failed:
+                    break
+                total_sent += sent
+                total_failed += failed
+            if total_sent or total_failed or not options['loop']:
+                stats = queue_stats()
+                self.stdout.write(
+                    f"Sent {total_sent}, failed {total_failed}; queued {stats['queued']}, "
+                    f"p95 latency {stats['latency_p95']}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary into the SQLite stand-in replicas (DB_REPLICAS) for local testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep copying, which simulates replication lag')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between copies with --loop (default: 2)')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replicas configured, set DB_REPLICAS')
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Only SQLite stand-in replicas can be synced; PostgreSQL standbys use streaming replication')
+
+        while True:
+            start = time.perf_counter()
+            source = sqlite3.connect(connections['default'].settings_dict['NAME'])
+            try:
+                for alias in settings.REPLICA_DATABASES:
+                    target = sqlite3.connect(connections[alias].settings_dict['NAME'], timeout=30)
+                    try:
+                        # The backup API copies a consistent snapshot while both sides stay in use
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(f'Synced {len(settings.REPLICA_DATABASES)} replica(s) in {(time.perf_counter() - start) * 1000:.0f} ms')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
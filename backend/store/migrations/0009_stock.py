@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:24
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoneStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_finish', models.CharField(blank=True, max_length=100)),
+                ('selected_thickness', models.CharField(blank=True, max_length=100)),
+                ('available', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('stone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='store.stone')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('status', models.CharField(choices=[('held', 'Held'), ('committed', 'Committed'), ('released', 'Released')], default='held', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='store.order')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.stonestock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stonestock',
+            constraint=models.UniqueConstraint(fields=('stone', 'selected_finish', 'selected_thickness'), name='unique_stone_stock_variant'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='store_stock_status_0aac22_idx'),
+        ),
+    ]
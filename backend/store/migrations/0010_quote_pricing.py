@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:29
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='estimated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='estimated_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='quoteitem',
+            name='estimated_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='quoteitem',
+            name='estimated_unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='quoteitem',
+            name='selected_finish',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='quoteitem',
+            name='selected_thickness',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='PriceSurcharge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('finish', 'Finish'), ('thickness', 'Thickness')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5)),
+            ],
+            options={
+                'ordering': ['kind', 'value'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'value'), name='unique_price_surcharge')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VolumeTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('discount_percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('category', models.ForeignKey(blank=True, help_text='Leave empty to apply to categories without tiers of their own', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='volume_tiers', to='store.category')),
+            ],
+            options={
+                'ordering': ['category', 'min_quantity'],
+                'constraints': [models.UniqueConstraint(fields=('category', 'min_quantity'), name='unique_volume_tier')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:39
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicates(apps, schema_editor):
+    """Keep the earliest row of each (event, object_id, recipient) so the constraint can be added"""
+    Notification = apps.get_model('store', 'Notification')
+    keep = Notification.objects.values('event', 'object_id', 'recipient').annotate(first=Min('id')).values('first')
+    Notification.objects.exclude(pk__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_notifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('event', 'object_id', 'recipient'), name='unique_notification'),
+        ),
+    ]
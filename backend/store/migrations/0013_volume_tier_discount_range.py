@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_notification_dedup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='volumetier',
+            name='discount_percent',
+            field=models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)]),
+        ),
+    ]
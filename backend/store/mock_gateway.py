@@ -0,0 +1,330 @@
+"""
+Local ZarinPal gateway simulator for load testing.
+
+Speaks the ZarinPal v4 request/verify JSON protocol and the StartPay
+redirect, so the real ``ZarinPalPayment`` HTTP client, its timeouts and the
+callback view are exercised end to end. Point the store at it with
+``ZARINPAL_API_BASE = 'http://127.0.0.1:8010'`` and ``USE_MOCK_PAYMENT = False``,
+then run ``python manage.py run_mock_gateway``.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.parse import urlencode, urlparse
+from urllib.request import urlopen
+
+
+REQUEST_PATH = '/pg/v4/payment/request.json'
+VERIFY_PATH = '/pg/v4/payment/verify.json'
+START_PAY_PREFIX = '/pg/StartPay/'
+STATS_PATH = '/__stats__'
+
+
+class LatencyModel:
+    """
+    Latency distribution in milliseconds, parsed from a spec such as
+    ``fixed:50``, ``uniform:20,200``, ``normal:120,40`` or ``lognormal:4.5,0.6``.
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, spec='fixed:0'):
+        kind, _, params = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f'Unknown latency distribution: {kind}')
+        try:
+            self.params = [float(p) for p in params.split(',') if p]
+        except ValueError:
+            raise ValueError(f'Invalid latency parameters: {params}')
+        expected = 1 if kind == 'fixed' else 2
+        if len(self.params) != expected:
+            raise ValueError(f'{kind} latency takes {expected} parameter(s)')
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng=random):
+        """Return a delay in seconds"""
+        if self.kind == 'fixed':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(*self.params)
+        elif self.kind == 'normal':
+            ms = rng.gauss(*self.params)
+        else:
+            ms = rng.lognormvariate(*self.params)
+        return max(ms, 0) / 1000.0
+
+
+class GatewayConfig:
+    """Behaviour knobs of the simulated gateway"""
+
+    def __init__(self, latency='fixed:0', error_rate=0.0, server_error_rate=0.0,
+                 pay_success_rate=1.0, callback_mode='redirect', callback_delay='fixed:0',
+                 duplicate_rate=0.0, drop_rate=0.0, seed=None):
+        if callback_mode not in ('redirect', 'push', 'both'):
+            raise ValueError(f'Unknown callback mode: {callback_mode}')
+        for name, rate in (('error_rate', error_rate), ('server_error_rate', server_error_rate),
+                           ('pay_success_rate', pay_success_rate),
+                           ('duplicate_rate', duplicate_rate), ('drop_rate', drop_rate)):
+            if not 0 <= rate <= 1:
+                raise ValueError(f'{name} must be between 0 and 1')
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.pay_success_rate = pay_success_rate
+        self.callback_mode = callback_mode
+        self.callback_delay = LatencyModel(callback_delay)
+        self.duplicate_rate = duplicate_rate
+        self.drop_rate = drop_rate
+        self.seed = seed
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def derive_rng(self):
+        """
+        Return a private RNG for one connection. Streams are numbered in the
+        order connections arrive, so a seeded run draws the same sequence per
+        connection no matter how handler threads interleave.
+        """
+        if self.seed is None:
+            return random.Random()
+        with self._lock:
+            stream = self._streams
+            self._streams += 1
+        return random.Random(f'{self.seed}:{stream}')
+
+
+class GatewayState:
+    """Thread-safe store of issued authorities and delivery counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payments = {}
+        self.stats = Counter()
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['payments'] = len(self.payments)
+        return stats
+
+
+class GatewayRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'MockZarinPal/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.rng = self.server.config.derive_rng()
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_payload(self, code, message):
+        self._send_json({'data': [], 'errors': {'code': code, 'message': message, 'validations': []}})
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def _simulate_gateway(self):
+        """
+        Apply latency and injected failures. Returns True when the request
+        was already answered with a failure.
+        """
+        time.sleep(self.config.latency.sample(self.rng))
+        roll = self.rng.random()
+        if roll < self.config.server_error_rate:
+            self.state.incr('server_errors')
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return True
+        if roll < self.config.server_error_rate + self.config.error_rate:
+            self.state.incr('gateway_errors')
+            self._send_error_payload(-1, 'Simulated gateway error')
+            return True
+        return False
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        # Read the body before any reply: on a kept-alive connection an unread
+        # body would be parsed as the next request line
+        data = self._read_json()
+        if path == REQUEST_PATH:
+            self.state.incr('requests')
+            if not self._simulate_gateway():
+                self._handle_request(data)
+        elif path == VERIFY_PATH:
+            self.state.incr('verifies')
+            if not self._simulate_gateway():
+                self._handle_verify(data)
+        else:
+            self._send_json({'errors': {'code': -404, 'message': 'Not found'}}, status=404)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith(START_PAY_PREFIX):
+            self._handle_start_pay(path[len(START_PAY_PREFIX):].strip('/'))
+        elif path == STATS_PATH:
+            self._send_json(self.state.snapshot())
+        else:
+            self._send_json({'errors': {'code': -404, 'message': 'Not found'}}, status=404)
+
+    def _handle_request(self, data):
+        if not data or not data.get('merchant_id') or not data.get('callback_url'):
+            self._send_error_payload(-9, 'The input params invalid, validation error.')
+            return
+        try:
+            amount = int(data.get('amount', 0))
+        except (TypeError, ValueError):
+            amount = 0
+        if amount <= 0:
+            self._send_error_payload(-9, 'The input params invalid, validation error.')
+            return
+
+        authority = f'A{self.rng.getrandbits(140):035X}'
+        with self.state.lock:
+            self.state.payments[authority] = {
+                'amount': amount,
+                'callback_url': data['callback_url'],
+                'status': 'created',
+                'ref_id': None,
+            }
+        self._send_json({
+            'data': {'code': 100, 'message': 'Success', 'authority': authority, 'fee_type': 'Merchant', 'fee': 0},
+            'errors': [],
+        })
+
+    def _handle_verify(self, data):
+        authority = (data or {}).get('authority')
+        with self.state.lock:
+            payment = self.state.payments.get(authority)
+            if payment is None:
+                code = -54
+            elif payment['status'] not in ('paid', 'verified'):
+                code = -51
+            elif str(payment['amount']) != str((data or {}).get('amount')):
+                code = -50
+            elif payment['status'] == 'verified':
+                code = 101
+            else:
+                payment['status'] = 'verified'
+                payment['ref_id'] = self.rng.randint(10 ** 8, 10 ** 9)
+                code = 100
+
+        if code not in (100, 101):
+            self.state.incr('verify_failures')
+            self._send_error_payload(code, 'Simulated verification failure')
+            return
+        self._send_json({
+            'data': {
+                'code': code,
+                'message': 'Verified' if code == 100 else 'Already verified',
+                'card_hash': f'{self.rng.getrandbits(128):032X}',
+                'card_pan': '502229******5995',
+                'ref_id': payment['ref_id'],
+                'fee_type': 'Merchant',
+                'fee': 0,
+            },
+            'errors': [],
+        })
+
+    def _handle_start_pay(self, authority):
+        with self.state.lock:
+            payment = self.state.payments.get(authority)
+            if payment is not None and payment['status'] == 'created':
+                paid = self.rng.random() < self.config.pay_success_rate
+                payment['status'] = 'paid' if paid else 'failed'
+        if payment is None:
+            self._send_json({'errors': {'code': -54, 'message': 'Invalid authority'}}, status=404)
+            return
+
+        self.state.incr('start_pays')
+        status = 'OK' if payment['status'] in ('paid', 'verified') else 'NOK'
+        callback = f"{payment['callback_url']}?{urlencode({'Authority': authority, 'Status': status})}"
+
+        if self.config.callback_mode in ('push', 'both'):
+            self.server.schedule_callbacks(callback, self.rng)
+
+        if self.config.callback_mode in ('redirect', 'both'):
+            self.send_response(302)
+            self.send_header('Location', callback)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self._send_json({'authority': authority, 'status': status})
+
+
+class MockGatewayServer(ThreadingHTTPServer):
+    """Threaded HTTP server hosting the simulated gateway"""
+
+    daemon_threads = True
+
+    def __init__(self, address, config=None, verbose=False):
+        super().__init__(address, GatewayRequestHandler)
+        self.config = config or GatewayConfig()
+        self.state = GatewayState()
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def schedule_callbacks(self, url, rng):
+        """
+        Deliver a server-to-server callback, possibly dropped or duplicated,
+        after a delay drawn from the callback delay distribution. ``rng`` is
+        the calling handler's own generator.
+        """
+        if rng.random() < self.config.drop_rate:
+            self.state.incr('callbacks_dropped')
+            return
+        copies = 2 if rng.random() < self.config.duplicate_rate else 1
+        if copies > 1:
+            self.state.incr('callbacks_duplicated')
+        for _ in range(copies):
+            delay = self.config.callback_delay.sample(rng)
+            timer = threading.Timer(delay, self._deliver_callback, args=(url,))
+            timer.daemon = True
+            timer.start()
+
+    def _deliver_callback(self, url):
+        started = time.monotonic()
+        try:
+            with urlopen(url, timeout=30) as response:
+                response.read()
+            self.state.incr('callbacks_delivered')
+        except (URLError, OSError):
+            self.state.incr('callbacks_failed')
+        self.state.incr('callback_ms_total', int((time.monotonic() - started) * 1000))
+
@@ -0,0 +1,115 @@
+"""
+Local debugging SMTP server for the notification worker.
+
+Accepts mail like a real relay, including reusing one connection for many
+messages, and prints or counts it instead of delivering it. Latency and
+transient failures (451 replies) can be injected to exercise the worker's
+batching and retries. Run ``python manage.py run_mock_smtp`` and point
+EMAIL_HOST/EMAIL_PORT at it.
+"""
+import random
+import socketserver
+import threading
+import time
+from collections import Counter
+from email import message_from_bytes, policy
+from .mock_gateway import LatencyModel
+
+
+class SMTPState:
+    """Counters shared by all connections"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class SMTPRequestHandler(socketserver.StreamRequestHandler):
+    """One SMTP session; commands are handled until QUIT or disconnect"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        server.state.incr('connections')
+        self.reply(f'220 {server.server_name} mock SMTP ready')
+        sender, recipients = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+            command = command.upper()
+            time.sleep(server.latency.sample(server.rng) / 1000)
+
+            if command in ('EHLO', 'HELO'):
+                self.reply(f'250-{server.server_name}' if command == 'EHLO' else f'250 {server.server_name}')
+                if command == 'EHLO':
+                    self.reply('250-8BITMIME')
+                    self.reply('250 SMTPUTF8')
+            elif command == 'MAIL':
+                sender, recipients = argument.partition(':')[2].strip(), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                if server.rng.random() < server.fail_rate:
+                    server.state.incr('rejected')
+                    self.reply('451 Temporary failure, try again later')
+                else:
+                    recipients.append(argument.partition(':')[2].strip())
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                if not recipients:
+                    self.reply('503 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.receive(sender, recipients)
+                sender, recipients = None, []
+                self.reply('250 OK queued')
+            elif command == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def receive(self, sender, recipients):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        self.server.state.incr('messages')
+        self.server.state.incr('recipients', len(recipients))
+        if self.server.verbose:
+            message = message_from_bytes(b''.join(lines), policy=policy.default)
+            print(f'--- {sender} -> {", ".join(recipients)}: {message["Subject"]}')
+            print(message.get_body(('plain',)).get_content().strip())
+
+
+class MockSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency='fixed:0', fail_rate=0.0, seed=None, verbose=False):
+        super().__init__(address, SMTPRequestHandler)
+        self.server_name = 'localhost'
+        self.latency = LatencyModel(latency)
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.verbose = verbose
+        self.state = SMTPState()
@@ -1,12 +1,19 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 
 
 class UserProfile(models.Model):
-    """Extended user profile with additional fields"""
+    """
+    Extended user profile with additional fields.
+    
+    Profiles are created lazily, the first time a profile field is written
+    (see for_user), and saving an existing profile writes only the fields
+    that changed since it was loaded.
+    """
+    TRACKED_FIELDS = ('phone', 'address')
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
@@ -15,20 +22,35 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
-
-
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Create UserProfile when User is created"""
-    if created:
-        UserProfile.objects.create(user=instance)
-
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save UserProfile when User is saved"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+    
+    @classmethod
+    def for_user(cls, user):
+        """The user's profile, or a new unsaved one if they have none yet"""
+        try:
+            return user.profile
+        except cls.DoesNotExist:
+            return cls(user=user)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: getattr(instance, name) for name in cls.TRACKED_FIELDS if name in instance.__dict__
+        }
+        return instance
+    
+    def changed_fields(self):
+        loaded = getattr(self, '_loaded_values', {})
+        return [name for name in self.TRACKED_FIELDS if name not in loaded or loaded[name] != getattr(self, name)]
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and 'update_fields' not in kwargs and not kwargs.get('force_insert'):
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed + ['updated_at']
+        super().save(*args, **kwargs)
+        self._loaded_values = {name: getattr(self, name) for name in self.TRACKED_FIELDS}
 
 
 class MultilingualTextField(models.Model):
@@ -58,10 +80,10 @@ class Stone(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='stones')
     description_en = models.TextField()
     description_fa = models.TextField()
-    origin = models.CharField(max_length=100)
+    origin = models.CharField(max_length=100, db_index=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    is_active = models.BooleanField(default=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    is_active = models.BooleanField(default=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     # Technical data
@@ -70,6 +92,14 @@ class Stone(models.Model):
     compressive_strength = models.CharField(max_length=50, blank=True)
     flexural_strength = models.CharField(max_length=50, blank=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets store.pricing see a price change on save without reading the row again
+        if 'price' in instance.__dict__:
+            instance._loaded_price = instance.price
+        return instance
+    
     def __str__(self):
         return self.name_en
 
@@ -147,9 +177,9 @@ class ProjectStone(models.Model):
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts')
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
-    is_active = models.BooleanField(default=True)
+    is_active = models.BooleanField(default=True, db_index=True)
     
     def __str__(self):
         return f"Cart for {self.user.username}"
@@ -162,7 +192,7 @@ class CartItem(models.Model):
     selected_finish = models.CharField(max_length=100, blank=True)
     selected_thickness = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     def __str__(self):
         return f"{self.quantity}x {self.stone.name_en}"
@@ -185,8 +215,11 @@ class Quote(models.Model):
     project_location = models.CharField(max_length=200)
     timeline = models.CharField(max_length=100)
     additional_notes = models.TextField(blank=True)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    # Maintained by store.pricing; null while any item's stone has no price
+    estimated_total = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    estimated_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -197,7 +230,11 @@ class QuoteItem(models.Model):
     quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='items')
     stone = models.ForeignKey(Stone, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    selected_finish = models.CharField(max_length=100, blank=True)
+    selected_thickness = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
+    estimated_unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    estimated_total = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
     
     def __str__(self):
         return f"{self.quantity}x {self.stone.name_en} for {self.quote.name}"
@@ -227,11 +264,11 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     order_number = models.CharField(max_length=50, unique=True)
     tracking_code = models.CharField(max_length=50, unique=True, blank=True, null=True)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     
     # Payment information
-    payment_type = models.CharField(max_length=20, choices=PAYMENT_TYPE_CHOICES, default='zarinpal')
+    payment_type = models.CharField(max_length=20, choices=PAYMENT_TYPE_CHOICES, default='zarinpal', db_index=True)
     payment_id = models.CharField(max_length=100, blank=True)  # ZarinPal payment ID
     payment_status = models.CharField(max_length=20, default='pending')
     payment_date = models.DateTimeField(null=True, blank=True)
@@ -242,7 +279,7 @@ class Order(models.Model):
     shipping_postal_code = models.CharField(max_length=20)
     shipping_phone = models.CharField(max_length=20)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -259,6 +296,30 @@ class Order(models.Model):
             self.tracking_code = f"TRK-{uuid.uuid4().hex[:10].upper()}"
         
         super().save(*args, **kwargs)
+    
+    def mark_paid(self):
+        """
+        Record a verified payment and close the customer's active cart.
+        Returns False, changing nothing, when the order already left pending.
+        """
+        from .order_states import transition_order
+        
+        with transaction.atomic():
+            if not transition_order(self, 'paid', payment_status='completed', payment_date=timezone.now()):
+                return False
+            
+            cart = Cart.objects.filter(user_id=self.user_id, is_active=True).first()
+            if cart:
+                cart.items.all().delete()
+                cart.is_active = False
+                cart.save()
+        return True
+    
+    def mark_cancelled(self, payment_status):
+        """Cancel the order after a failed or abandoned payment; False when it already left pending"""
+        from .order_states import transition_order
+        
+        return transition_order(self, 'cancelled', payment_status=payment_status)
 
 
 class OrderItem(models.Model):
@@ -271,4 +332,180 @@ class OrderItem(models.Model):
     notes = models.TextField(blank=True)
     
     def __str__(self):
-        return f"{self.quantity}x {self.stone.name_en} in Order {self.order.order_number}"
\ No newline at end of file
+        return f"{self.quantity}x {self.stone.name_en} in Order {self.order.order_number}"
+
+
+class StoneStock(models.Model):
+    """Sellable quantity of a stone; blank finish/thickness covers every variant without its own row"""
+    stone = models.ForeignKey(Stone, on_delete=models.CASCADE, related_name='stock_levels')
+    selected_finish = models.CharField(max_length=100, blank=True)
+    selected_thickness = models.CharField(max_length=100, blank=True)
+    available = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['stone', 'selected_finish', 'selected_thickness'], name='unique_stone_stock_variant'
+            )
+        ]
+    
+    def __str__(self):
+        variant = ' / '.join(filter(None, [self.selected_finish, self.selected_thickness])) or 'any variant'
+        return f"Stone #{self.stone_id} ({variant}): {self.available}"
+
+
+class StockReservation(models.Model):
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    stock = models.ForeignKey(StoneStock, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+    
+    def __str__(self):
+        return f"{self.quantity} of stock #{self.stock_id} for order #{self.order_id} ({self.status})"
+
+
+class VolumeTier(models.Model):
+    """Discount for ordering at least min_quantity units of a category within one quote"""
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name='volume_tiers', null=True, blank=True,
+        help_text='Leave empty to apply to categories without tiers of their own'
+    )
+    min_quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # Over 100 would make quote prices negative
+    discount_percent = models.DecimalField(
+        max_digits=5, decimal_places=2, validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    
+    class Meta:
+        ordering = ['category', 'min_quantity']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'min_quantity'], name='unique_volume_tier')
+        ]
+    
+    def __str__(self):
+        return f"{self.category or 'All categories'}: {self.min_quantity}+ units -{self.discount_percent}%"
+
+
+class PriceSurcharge(models.Model):
+    """Percentage added to the unit price for a finish or thickness"""
+    KIND_CHOICES = [
+        ('finish', 'Finish'),
+        ('thickness', 'Thickness'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    value = models.CharField(max_length=100)
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+    
+    class Meta:
+        ordering = ['kind', 'value']
+        constraints = [models.UniqueConstraint(fields=['kind', 'value'], name='unique_price_surcharge')]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.value}: +{self.percent}%"
+
+
+class SalesRollup(models.Model):
+    """Abstract daily sales aggregate, maintained by store.reporting"""
+    date = models.DateField()
+    order_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        abstract = True
+        ordering = ['-date']
+
+
+class DailyStoneSales(SalesRollup):
+    stone = models.ForeignKey(Stone, on_delete=models.CASCADE, related_name='daily_sales')
+    
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Daily stone sales'
+        constraints = [models.UniqueConstraint(fields=['date', 'stone'], name='unique_daily_stone_sales')]
+    
+    def __str__(self):
+        return f"{self.date} stone #{self.stone_id}"
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Daily category sales'
+        constraints = [models.UniqueConstraint(fields=['date', 'category'], name='unique_daily_category_sales')]
+    
+    def __str__(self):
+        return f"{self.date} category #{self.category_id}"
+
+
+class DailyCitySales(SalesRollup):
+    shipping_city = models.CharField(max_length=100)
+    
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Daily city sales'
+        constraints = [models.UniqueConstraint(fields=['date', 'shipping_city'], name='unique_daily_city_sales')]
+    
+    def __str__(self):
+        return f"{self.date} {self.shipping_city}"
+
+
+class DailyPaymentTypeSales(SalesRollup):
+    payment_type = models.CharField(max_length=20, choices=Order.PAYMENT_TYPE_CHOICES)
+    
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Daily payment type sales'
+        constraints = [models.UniqueConstraint(fields=['date', 'payment_type'], name='unique_daily_payment_type_sales')]
+    
+    def __str__(self):
+        return f"{self.date} {self.payment_type}"
+
+
+class Notification(models.Model):
+    """Outbox row for one email, written with the event it reports and sent by send_notifications"""
+    EVENT_CHOICES = [
+        ('quote_submitted', 'Quote submitted'),
+        ('order_paid', 'Order paid'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    event = models.CharField(max_length=30, choices=EVENT_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    recipient = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['sent_at']),
+        ]
+        constraints = [
+            # An event is reported to each recipient once, however often it is enqueued
+            models.UniqueConstraint(fields=['event', 'object_id', 'recipient'], name='unique_notification')
+        ]
+    
+    def __str__(self):
+        return f"{self.get_event_display()} #{self.object_id} to {self.recipient}"
@@ -0,0 +1,174 @@
+"""
+Email notifications: staff hear about new quotes, customers about paid orders.
+
+Events are written to the Notification outbox in the same transaction as
+the change they report, so a rolled-back quote or payment never sends
+anything and a committed one is never lost. ``send_notifications`` claims
+queued rows in batches, renders them and sends each batch over one SMTP
+connection; no request ever waits on SMTP. Failed sends are retried after
+NOTIFICATION_RETRY_DELAY seconds, up to NOTIFICATION_MAX_ATTEMPTS times.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import Notification, Order, Quote
+from .order_states import orders_transitioned
+
+
+# Event -> (model of object_id, relations the templates use)
+EVENTS = {
+    'quote_submitted': (Quote, ['items__stone']),
+    'order_paid': (Order, ['items__stone']),
+}
+
+# Rows left in 'sending' this long belong to a worker that died mid-batch and are queued again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def staff_recipients():
+    if settings.NOTIFICATION_STAFF_EMAILS:
+        return list(settings.NOTIFICATION_STAFF_EMAILS)
+    return list(User.objects.filter(is_staff=True, is_active=True).exclude(email='').values_list('email', flat=True))
+
+
+def enqueue(event, targets):
+    """Queue one notification per (object_id, recipient) pair, skipping pairs already queued or sent"""
+    Notification.objects.bulk_create([
+        Notification(event=event, object_id=object_id, recipient=recipient) for object_id, recipient in targets
+    ], ignore_conflicts=True)
+
+
+def notify_quote_submitted(quote):
+    enqueue('quote_submitted', [(quote.pk, email) for email in staff_recipients()])
+
+
+@receiver(orders_transitioned)
+def notify_orders_paid(sender, source, target, order_ids, **kwargs):
+    if target == 'paid':
+        enqueue('order_paid', Order.objects.filter(pk__in=order_ids).exclude(user__email='').values_list('pk', 'user__email'))
+
+
+def claim_batch(batch_size):
+    """Mark up to batch_size due notifications as sending and return them"""
+    now = timezone.now()
+    retry_before = now - timedelta(seconds=settings.NOTIFICATION_RETRY_DELAY)
+    with transaction.atomic():
+        Notification.objects.filter(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT).update(status='queued')
+        notification_ids = list(
+            Notification.objects.filter(status='queued')
+            .filter(Q(attempts=0) | Q(claimed_at__lt=retry_before))
+            .order_by('created_at', 'pk')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        Notification.objects.filter(pk__in=notification_ids).update(
+            status='sending', claimed_at=now, attempts=F('attempts') + 1
+        )
+    return list(Notification.objects.filter(pk__in=notification_ids).order_by('created_at', 'pk'))
+
+
+def _load_objects(notifications):
+    """The objects the notifications refer to, one query set per event"""
+    object_ids = defaultdict(set)
+    for notification in notifications:
+        object_ids[notification.event].add(notification.object_id)
+    return {
+        event: EVENTS[event][0].objects.prefetch_related(*EVENTS[event][1]).in_bulk(ids)
+        for event, ids in object_ids.items()
+    }
+
+
+def render(notification, obj):
+    context = {'object': obj, 'recipient': notification.recipient}
+    subject = render_to_string(f'notifications/{notification.event}_subject.txt', context)
+    body = render_to_string(f'notifications/{notification.event}.txt', context)
+    return EmailMessage(' '.join(subject.split()), body, settings.DEFAULT_FROM_EMAIL, [notification.recipient])
+
+
+def _record_failures(failures):
+    for notification, error in failures:
+        final = notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS
+        Notification.objects.filter(pk=notification.pk).update(
+            status='failed' if final else 'queued', last_error=str(error)[:1000]
+        )
+
+
+def send_batch(batch_size=None):
+    """
+    Claim, render and send one batch over a single SMTP connection.
+    Returns (sent, failed) counts; (0, 0) means nothing was due.
+    """
+    notifications = claim_batch(batch_size or settings.NOTIFICATION_BATCH_SIZE)
+    if not notifications:
+        return 0, 0
+
+    objects = _load_objects(notifications)
+    sent = []
+    failures = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        _record_failures([(notification, e) for notification in notifications])
+        return 0, len(notifications)
+
+    try:
+        for notification in notifications:
+            obj = objects[notification.event].get(notification.object_id)
+            if obj is None:
+                # The quote or order was deleted; nothing left to report
+                notification.attempts = settings.NOTIFICATION_MAX_ATTEMPTS
+                failures.append((notification, 'Object no longer exists'))
+                continue
+            try:
+                connection.send_messages([render(notification, obj)])
+            except Exception as e:
+                failures.append((notification, e))
+                # Drop a possibly broken session; the next send reconnects
+                connection.close()
+            else:
+                sent.append(notification.pk)
+    finally:
+        connection.close()
+
+    Notification.objects.filter(pk__in=sent).update(status='sent', sent_at=timezone.now(), last_error='')
+    _record_failures(failures)
+    return len(sent), len(failures)
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """Queue depth and delivery latency (seconds from event to send) over the last window"""
+    now = timezone.now()
+    counts = dict(
+        Notification.objects.filter(status__in=['queued', 'sending', 'failed'])
+        .values_list('status').annotate(count=Count('id')).order_by()
+    )
+    oldest = Notification.objects.filter(status='queued').aggregate(oldest=Min('created_at'))['oldest']
+
+    latency = ExpressionWrapper(F('sent_at') - F('created_at'), output_field=DurationField())
+    # One query, so the count and the percentile always describe the same rows
+    latencies = list(
+        Notification.objects.filter(sent_at__gte=now - window).annotate(latency=latency)
+        .order_by('latency').values_list('latency', flat=True)
+    )
+    sent = len(latencies)
+    average = sum(latencies, timedelta()) / sent if sent else None
+    p95 = latencies[min(int(sent * 0.95), sent - 1)] if sent else None
+
+    return {
+        'queued': counts.get('queued', 0),
+        'sending': counts.get('sending', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_queued_age': (now - oldest).total_seconds() if oldest else None,
+        'window_seconds': window.total_seconds(),
+        'sent': sent,
+        'latency_avg': average.total_seconds() if average is not None else None,
+        'latency_p95': p95.total_seconds() if p95 is not None else None,
+    }
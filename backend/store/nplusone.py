@@ -0,0 +1,178 @@
+"""
+N+1 query detection, for development and staging.
+
+With NPLUSONE_MODE set, NPlusOneMiddleware fingerprints every query a
+request runs (``querylog.normalize()``: values become ``?``) and notes its
+parameters. A fingerprint run with NPLUSONE_THRESHOLD different parameter
+sets in one request almost always means a relation is loaded once per row: ``item.stone`` on items fetched without
+select_related(), or ``obj.videos.filter(...)`` in a loop or a
+SerializerMethodField, which bypasses prefetched rows. A statement repeated
+with the same values is not an N+1 and is left alone. The detector then
+records the stack of that access, from the innermost line of store code to
+the ORM call, and the serializer fields it happened in, e.g.
+``CartSerializer.items > CartItemSerializer.stone``.
+
+NPLUSONE_MODE decides what happens next:
+
+- "log": a warning from the ``store.nplusone`` logger when the request ends,
+- "warn": an NPlusOneWarning when the request ends, which ``-W error``
+  turns into an error,
+- "raise": NPlusOneError, raised in place of the repeated query, so the
+  request fails with the lazy access in its traceback.
+
+Each fingerprint is reported once per request. Detection costs a regex pass
+per query; keep it off in production.
+"""
+import logging
+import os
+import sys
+import traceback
+import warnings
+from contextvars import ContextVar
+import django
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import Serializer
+from .instrumentation import endpoint_name
+from .querylog import is_app_code, normalize
+
+logger = logging.getLogger(__name__)
+
+MODES = ('log', 'warn', 'raise')
+# Statements that can repeat per row; transaction control and EXPLAIN are left out
+CHECKED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+_state = ContextVar('request_queries', default=None)
+_django_db = os.path.join(os.path.dirname(django.__file__), 'db') + os.sep
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def access_stack():
+    """The stack from the innermost line of store code to the ORM call that made the query"""
+    frames = traceback.extract_stack()
+    ours = [i for i, frame in enumerate(frames) if is_app_code(frame.filename)]
+    start = ours[-1] if ours else 0
+    end = next((i for i in range(start, len(frames)) if frames[i].filename.startswith(_django_db)), len(frames) - 1)
+    return traceback.StackSummary.from_list(frames[start:end + 1])
+
+
+def serializer_path():
+    """Serializer fields being represented, outermost first, e.g. 'CartSerializer.items > CartItemSerializer.stone'"""
+    fields = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == 'to_representation':
+            serializer, field = frame.f_locals.get('self'), frame.f_locals.get('field')
+            if isinstance(serializer, Serializer) and field is not None:
+                fields.append(f'{type(serializer).__name__}.{field.field_name}')
+        frame = frame.f_back
+    return ' > '.join(reversed(fields)) or None
+
+
+class RepeatedQuery:
+    def __init__(self, sql, stack, serializer):
+        self.sql = sql
+        self.stack = stack
+        self.serializer = serializer
+
+    def describe(self, endpoint, count, distinct):
+        lines = [f'N+1 query in {endpoint}: {count} runs with {distinct} different values of {self.sql}']
+        if self.serializer:
+            lines.append(f'Serializer fields: {self.serializer}')
+        lines.append('Stack (most recent call last):')
+        lines.extend(line.rstrip('\n') for line in self.stack.format())
+        return '\n'.join(lines)
+
+
+class RequestQueries:
+    """Runs and parameter sets per query fingerprint, and the ones that reached the threshold, for one request"""
+
+    def __init__(self, request):
+        self.request = request
+        self.counts = {}
+        # Distinct parameter sets per fingerprint, as reprs: parameters may hold lists
+        self.values = {}
+        self.repeated = {}
+
+    def record(self, sql, params):
+        normalized = normalize(sql)
+        self.counts[normalized] = self.counts.get(normalized, 0) + 1
+        values = self.values.setdefault(normalized, set())
+        values.add(repr(params))
+        if len(values) != settings.NPLUSONE_THRESHOLD or normalized in self.repeated:
+            return
+        repeated = self.repeated[normalized] = RepeatedQuery(normalized, access_stack(), serializer_path())
+        if settings.NPLUSONE_MODE == 'raise':
+            raise NPlusOneError(repeated.describe(endpoint_name(self.request), self.counts[normalized], len(values)))
+
+    def report(self):
+        for normalized, repeated in self.repeated.items():
+            message = repeated.describe(
+                endpoint_name(self.request), self.counts[normalized], len(self.values[normalized])
+            )
+            if settings.NPLUSONE_MODE == 'warn':
+                warnings.warn(message, NPlusOneWarning)
+            else:
+                logger.warning(message)
+
+
+def detect_repeats(execute, sql, params, many, context):
+    queries = _state.get()
+    if queries is not None and not many and sql.lstrip()[:6].upper() in CHECKED_STATEMENTS:
+        # Before executing, so "raise" stops the repeated query itself
+        queries.record(sql, params)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_nplusone_detector(sender, connection, **kwargs):
+    # Connections are per thread, and async views query from sync_to_async threads
+    if settings.NPLUSONE_MODE and detect_repeats not in connection.execute_wrappers:
+        connection.execute_wrappers.append(detect_repeats)
+
+
+class NPlusOneMiddleware:
+    """Watch each request's queries for N+1 patterns; only active with NPLUSONE_MODE set"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_MODE:
+            raise MiddlewareNotUsed
+        if settings.NPLUSONE_MODE not in MODES:
+            raise ImproperlyConfigured(f'NPLUSONE_MODE must be one of: {", ".join(MODES)}')
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = RequestQueries(request)
+        token = _state.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        queries.report()
+        return response
+
+    async def __acall__(self, request):
+        queries = RequestQueries(request)
+        token = _state.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        queries.report()
+        return response
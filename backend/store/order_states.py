@@ -0,0 +1,119 @@
+"""
+Order status state machine.
+
+Defines which status changes are allowed and applies them either to a single
+order or, set-based, to any number of orders at once. Every applied change
+sends one ``orders_transitioned`` signal per (source, target) pair, carrying
+the ids of all orders that moved. The signal is sent inside the transaction
+so receivers can keep derived data consistent; receivers with side effects
+outside the database should defer them with ``transaction.on_commit``.
+"""
+import uuid
+from collections import defaultdict
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from .models import Order
+
+
+ORDER_TRANSITIONS = {
+    'pending': {'paid', 'cancelled'},
+    'paid': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+
+# Orders in these statuses must carry a tracking code
+TRACKED_STATUSES = {'paid', 'processing', 'shipped', 'delivered'}
+
+BATCH_SIZE = 500
+
+# Sent with sender=Order, source, target and order_ids inside the transaction applying the change
+orders_transitioned = Signal()
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def can_transition(source, target):
+    return target in ORDER_TRANSITIONS.get(source, ())
+
+
+def allowed_sources(target):
+    """Statuses from which an order may move to target"""
+    if target not in ORDER_TRANSITIONS:
+        raise InvalidTransition(f'Unknown order status: {target}')
+    return [source for source, targets in ORDER_TRANSITIONS.items() if target in targets]
+
+
+def new_tracking_code():
+    return f"TRK-{uuid.uuid4().hex[:10].upper()}"
+
+
+def transition_order(order, target, **fields):
+    """
+    Move a single order to target, also setting any extra fields.
+
+    The change is one UPDATE conditional on the status the order was loaded
+    with, so when another request moved it first (a duplicate payment
+    callback, reservation expiry) nothing is written, no signal is sent and
+    False is returned. Raises InvalidTransition when the state machine does
+    not allow it.
+    """
+    source = order.status
+    if not can_transition(source, target):
+        raise InvalidTransition(f'Cannot move order {order.order_number} from {source} to {target}')
+
+    values = {'status': target, 'updated_at': timezone.now(), **fields}
+    if target in TRACKED_STATUSES and not order.tracking_code:
+        values['tracking_code'] = new_tracking_code()
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, status=source).update(**values):
+            return False
+        for attr, value in values.items():
+            setattr(order, attr, value)
+        orders_transitioned.send(sender=Order, source=source, target=target, order_ids=[order.pk])
+    return True
+
+
+def transition_orders(queryset, target, **fields):
+    """
+    Move every order in queryset that may legally reach target, set-based.
+
+    Orders whose current status does not allow the change are left alone.
+    Missing tracking codes are allocated with one bulk update and status
+    changes are applied with one UPDATE per batch. Returns the number of
+    orders moved.
+    """
+    sources = allowed_sources(target)
+
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(status__in=sources)
+            .select_for_update()
+            .order_by('pk')
+            .values_list('pk', 'status', 'tracking_code')
+        )
+        if not rows:
+            return 0
+
+        if target in TRACKED_STATUSES:
+            untracked = [Order(pk=pk, tracking_code=new_tracking_code()) for pk, _, code in rows if not code]
+            Order.objects.bulk_update(untracked, ['tracking_code'], batch_size=BATCH_SIZE)
+
+        by_source = defaultdict(list)
+        for pk, source, _ in rows:
+            by_source[source].append(pk)
+
+        now = timezone.now()
+        for source, order_ids in by_source.items():
+            for start in range(0, len(order_ids), BATCH_SIZE):
+                Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE], status=source).update(
+                    status=target, updated_at=now, **fields
+                )
+            orders_transitioned.send(sender=Order, source=source, target=target, order_ids=order_ids)
+
+    return len(rows)
@@ -1,8 +1,51 @@
-import requests
+import asyncio
 import json
 import uuid
+import weakref
+from urllib.parse import urlencode, urljoin
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
+from .instrumentation import measure
+
+
+# Per event loop state for the async callback path: a pooled HTTP client and
+# a semaphore bounding concurrent verifications
+_async_clients = weakref.WeakKeyDictionary()
+_verify_semaphores = weakref.WeakKeyDictionary()
+
+
+def _load_httpx():
+    # Imported on first use, so workers that never verify asynchronously don't load it
+    try:
+        import httpx
+    except ImportError:  # optional, only needed for the async callback path
+        return None
+    return httpx
+
+
+def _get_async_client():
+    httpx = _load_httpx()
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limit = getattr(settings, 'PAYMENT_VERIFY_CONCURRENCY', 100)
+        client = httpx.AsyncClient(limits=httpx.Limits(max_connections=limit))
+        _async_clients[loop] = client
+    return client
+
+
+def verification_slot():
+    """
+    Semaphore limiting how many verifications run at once on this event loop,
+    so a burst of callbacks queues instead of flooding the gateway
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _verify_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(getattr(settings, 'PAYMENT_VERIFY_CONCURRENCY', 100))
+        _verify_semaphores[loop] = semaphore
+    return semaphore
 
 
 class ZarinPalPayment:
@@ -10,8 +53,15 @@ class ZarinPalPayment:
         self.merchant_id = settings.ZARINPAL_MERCHANT_ID
         self.sandbox = settings.ZARINPAL_SANDBOX
         self.callback_url = settings.ZARINPAL_CALLBACK_URL
+        api_base = getattr(settings, 'ZARINPAL_API_BASE', None)
         
-        if self.sandbox:
+        if api_base:
+            # Local gateway simulator speaking the v4 protocol (see run_mock_gateway)
+            api_base = api_base.rstrip('/')
+            self.request_url = f"{api_base}/pg/v4/payment/request.json"
+            self.verify_url = f"{api_base}/pg/v4/payment/verify.json"
+            self.start_pay_url = f"{api_base}/pg/StartPay/"
+        elif self.sandbox:
             self.request_url = "https://sandbox.zarinpal.com/pg/rest/WebGate/PaymentRequest.json"
             self.verify_url = "https://sandbox.zarinpal.com/pg/rest/WebGate/PaymentVerification.json"
             self.start_pay_url = "https://sandbox.zarinpal.com/pg/StartPay/"
@@ -40,11 +90,14 @@ class ZarinPalPayment:
             }
         }
         
+        import requests  # loaded on first use, it is slow to import
+
         try:
             print(f"Making payment request to: {self.request_url}")
             print(f"Payment data: {data}")
             
-            response = requests.post(self.request_url, json=data, timeout=10)
+            with measure('gateway'):
+                response = requests.post(self.request_url, json=data, timeout=10)
             print(f"Response status: {response.status_code}")
             print(f"Response headers: {response.headers}")
             
@@ -57,15 +110,18 @@ class ZarinPalPayment:
             
             print(f"Response text: {response.text}")
             result = response.json()
+            # ZarinPal sends an empty list for whichever of data/errors is unused
+            result_data = result.get('data') or {}
+            result_errors = result.get('errors') or {}
             
-            if result.get('data', {}).get('code') == 100:
+            if result_data.get('code') == 100:
                 return {
                     'success': True,
-                    'authority': result['data']['authority'],
-                    'payment_url': f"{self.start_pay_url}{result['data']['authority']}"
+                    'authority': result_data['authority'],
+                    'payment_url': f"{self.start_pay_url}{result_data['authority']}"
                 }
             else:
-                error_msg = result.get('errors', {}).get('message', 'Payment request failed')
+                error_msg = result_errors.get('message', 'Payment request failed')
                 print(f"Payment failed: {error_msg}")
                 return {
                     'success': False,
@@ -101,8 +157,14 @@ class ZarinPalPayment:
         # Generate a fake authority code
         mock_authority = str(uuid.uuid4()).replace('-', '')[:32]
         
-        # Create a mock payment URL that shows payment page
-        mock_payment_url = f"http://localhost:8000/payment/mock/?authority={mock_authority}&amount={amount}&description={description}&order_id={order_id}"
+        # Create a mock payment URL that shows payment page, on the same host as the callback
+        query = urlencode({
+            'authority': mock_authority,
+            'amount': amount,
+            'description': description,
+            'order_id': order_id
+        })
+        mock_payment_url = f"{urljoin(self.callback_url, '/payment/mock/')}?{query}"
         
         return {
             'success': True,
@@ -124,24 +186,12 @@ class ZarinPalPayment:
             "authority": authority
         }
         
+        import requests
+
         try:
-            response = requests.post(self.verify_url, json=data, timeout=10)
-            result = response.json()
-            
-            if result.get('data', {}).get('code') == 100:
-                return {
-                    'success': True,
-                    'ref_id': result['data']['ref_id'],
-                    'card_pan': result['data'].get('card_pan', ''),
-                    'card_hash': result['data'].get('card_hash', ''),
-                    'fee_type': result['data'].get('fee_type', ''),
-                    'fee': result['data'].get('fee', 0)
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': result.get('errors', {}).get('message', 'Payment verification failed')
-                }
+            with measure('gateway'):
+                response = requests.post(self.verify_url, json=data, timeout=10)
+            return self._parse_verify_result(response.json())
         except requests.RequestException as e:
             return {
                 'success': False,
@@ -153,6 +203,61 @@ class ZarinPalPayment:
                 'error': f'Unexpected error: {str(e)}'
             }
     
+    async def averify_payment(self, authority, amount):
+        """
+        Verify payment with ZarinPal without blocking the event loop
+        """
+        if getattr(settings, 'USE_MOCK_PAYMENT', False):
+            return self._verify_mock_payment(authority, amount)
+        
+        httpx = _load_httpx()
+        if httpx is None:
+            # No async HTTP client installed, fall back to a worker thread
+            return await sync_to_async(self.verify_payment, thread_sensitive=False)(authority, amount)
+        
+        data = {
+            "merchant_id": self.merchant_id,
+            "amount": int(amount),
+            "authority": authority
+        }
+        
+        try:
+            with measure('gateway'):
+                response = await _get_async_client().post(self.verify_url, json=data, timeout=10)
+            return self._parse_verify_result(response.json())
+        except httpx.HTTPError as e:
+            return {
+                'success': False,
+                'error': f'Network error: {str(e)}'
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Unexpected error: {str(e)}'
+            }
+    
+    def _parse_verify_result(self, result):
+        """
+        Turn a verify response body into the result dict used by the callback views
+        """
+        result_data = result.get('data') or {}
+        result_errors = result.get('errors') or {}
+        
+        # 101 means the authority was already verified, e.g. by a duplicate callback
+        if result_data.get('code') in (100, 101):
+            return {
+                'success': True,
+                'ref_id': result_data['ref_id'],
+                'card_pan': result_data.get('card_pan', ''),
+                'card_hash': result_data.get('card_hash', ''),
+                'fee_type': result_data.get('fee_type', ''),
+                'fee': result_data.get('fee', 0)
+            }
+        return {
+            'success': False,
+            'error': result_errors.get('message', 'Payment verification failed')
+        }
+    
     def _verify_mock_payment(self, authority, amount):
         """
         Mock payment verification for development/testing
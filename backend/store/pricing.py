@@ -0,0 +1,255 @@
+"""
+Quote price estimation.
+
+A line's unit price is the stone's list price plus the percentage surcharges
+for its finish and thickness, less the volume discount of the deepest tier
+its category reaches within the quote (units of that category summed over
+all of the quote's lines). Categories without tiers of their own use the
+catch-all tiers.
+
+Estimates are stored on QuoteItem and Quote when a quote is submitted, so
+listing them never prices anything live. Changing a stone's price or a rule
+only marks the affected open quotes stale (estimated_at is cleared); the
+``estimate_quotes --stale`` job recomputes them in bulk. The rule tables are
+loaded once per process and reused until the rules' shared version moves
+(bumped when a rule change commits, see store.caching) or PRICING_RULES_TTL
+seconds pass.
+"""
+import time
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .caching import bump_versions, model_versions
+from .models import PriceSurcharge, Quote, QuoteItem, Stone, VolumeTier
+
+
+# Quotes whose estimates are kept current when prices or rules change
+OPEN_STATUSES = ['pending', 'in_progress']
+
+BATCH_SIZE = 500
+
+RULE_MODELS = [VolumeTier, PriceSurcharge]
+
+CENTS = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+class PricingRules:
+    """In-memory snapshot of the VolumeTier and PriceSurcharge tables"""
+
+    def __init__(self, tiers, surcharges, version=None):
+        # category_id (None for the catch-all) -> [(min_quantity, discount_percent)], deepest first
+        self.tiers = tiers
+        # (kind, value) -> percent
+        self.surcharges = surcharges
+        # Versions of RULE_MODELS the tables were read under
+        self.version = version
+
+    @classmethod
+    def load(cls, version=None):
+        # Read the version first: a change committed while loading leaves it behind
+        version = version or model_versions(RULE_MODELS)
+        tiers = defaultdict(list)
+        rows = VolumeTier.objects.order_by('-min_quantity').values_list('category_id', 'min_quantity', 'discount_percent')
+        for category_id, min_quantity, discount_percent in rows:
+            tiers[category_id].append((min_quantity, discount_percent))
+        surcharges = {
+            (kind, value): percent
+            for kind, value, percent in PriceSurcharge.objects.values_list('kind', 'value', 'percent')
+        }
+        return cls(dict(tiers), surcharges, version)
+
+    def discount(self, category_id, quantity):
+        for min_quantity, discount_percent in self.tiers.get(category_id, self.tiers.get(None, ())):
+            if quantity >= min_quantity:
+                return discount_percent
+        return 0
+
+    def surcharge(self, finish, thickness):
+        return self.surcharges.get(('finish', finish), 0) + self.surcharges.get(('thickness', thickness), 0)
+
+
+# (rules, monotonic time loaded)
+_cached_rules = (None, 0.0)
+
+
+def get_rules():
+    global _cached_rules
+    rules, loaded_at = _cached_rules
+    version = model_versions(RULE_MODELS)
+    if rules is None or rules.version != version or time.monotonic() - loaded_at > settings.PRICING_RULES_TTL:
+        rules = PricingRules.load(version)
+        _cached_rules = (rules, time.monotonic())
+    return rules
+
+
+def clear_rules():
+    global _cached_rules
+    _cached_rules = (None, 0.0)
+
+
+def price_lines(lines, rules=None):
+    """
+    Price one quote's lines, given as (price, category_id, quantity, finish,
+    thickness) tuples. Returns (unit_price, line_total) per line; both are
+    None for a stone without a price.
+    """
+    rules = rules or get_rules()
+    units = defaultdict(int)
+    for _, category_id, quantity, _, _ in lines:
+        units[category_id] += quantity
+
+    priced = []
+    for price, category_id, quantity, finish, thickness in lines:
+        if price is None:
+            priced.append((None, None))
+            continue
+        factor = (HUNDRED + rules.surcharge(finish, thickness)) * (HUNDRED - rules.discount(category_id, units[category_id]))
+        unit_price = (price * factor / (HUNDRED * HUNDRED)).quantize(CENTS, rounding=ROUND_HALF_UP)
+        priced.append((unit_price, unit_price * quantity))
+    return priced
+
+
+def _quote_total(priced):
+    """Sum of the line totals, or None when any line could not be priced"""
+    if any(total is None for _, total in priced):
+        return None
+    return sum((total for _, total in priced), Decimal('0.00'))
+
+
+def estimate_items(items, rules=None):
+    """
+    Set the estimates on one quote's unsaved QuoteItems, whose stones must be
+    loaded. Returns the quote's estimated total.
+    """
+    priced = price_lines([
+        (item.stone.price, item.stone.category_id, item.quantity, item.selected_finish, item.selected_thickness)
+        for item in items
+    ], rules)
+    for item, (unit_price, total) in zip(items, priced):
+        item.estimated_unit_price = unit_price
+        item.estimated_total = total
+    return _quote_total(priced)
+
+
+def _update_rows(model, fields, rows):
+    """
+    Write (value, ..., pk) rows with one executemany. Much cheaper than
+    bulk_update, whose per-row CASE expressions cost more than the pricing.
+    """
+    if not rows:
+        return
+    quote_name = connection.ops.quote_name
+    model_fields = [model._meta.get_field(name) for name in fields]
+    assignments = ', '.join(f'{quote_name(field.column)} = %s' for field in model_fields)
+    sql = f'UPDATE {quote_name(model._meta.db_table)} SET {assignments} WHERE {quote_name(model._meta.pk.column)} = %s'
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(model_fields, values)] + [pk]
+        for *values, pk in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def estimate_quotes(quotes, batch_size=BATCH_SIZE, rules=None):
+    """
+    Recompute and store the estimates of every quote in the queryset, a batch
+    at a time: one read per batch, then only the items whose estimate changed
+    are written. Returns the number of quotes estimated.
+    """
+    rules = rules or get_rules()
+    quote_ids = list(quotes.order_by('pk').values_list('pk', flat=True))
+    now = timezone.now()
+
+    for start in range(0, len(quote_ids), batch_size):
+        batch = quote_ids[start:start + batch_size]
+        with transaction.atomic():
+            # Lock the quotes before reading their lines, so a price change
+            # committed meanwhile marks them stale after this write, not before
+            list(Quote.objects.select_for_update().filter(pk__in=batch).values_list('pk', flat=True))
+            lines = defaultdict(list)
+            rows = QuoteItem.objects.filter(quote_id__in=batch).order_by('pk').values_list(
+                'pk', 'quote_id', 'estimated_unit_price', 'estimated_total',
+                'stone__price', 'stone__category_id', 'quantity', 'selected_finish', 'selected_thickness'
+            )
+            for pk, quote_id, unit_price, total, *line in rows:
+                lines[quote_id].append(((pk, unit_price, total), line))
+
+            items = []
+            estimated = []
+            for quote_id in batch:
+                quote_lines = lines.get(quote_id, [])
+                priced = price_lines([line for _, line in quote_lines], rules)
+                items.extend(
+                    (unit_price, total, pk)
+                    for ((pk, *current), _), (unit_price, total) in zip(quote_lines, priced)
+                    if current != [unit_price, total]
+                )
+                estimated.append((_quote_total(priced), now, quote_id))
+
+            _update_rows(QuoteItem, ['estimated_unit_price', 'estimated_total'], items)
+            _update_rows(Quote, ['estimated_total', 'estimated_at'], estimated)
+
+    return len(quote_ids)
+
+
+def mark_quotes_stale(stone_ids=None):
+    """
+    Clear estimated_at on open quotes, optionally only those containing the
+    given stones, so the next reprice_stale_quotes() pass picks them up.
+    One UPDATE, cheap enough to run inside the request that changed a price.
+    """
+    quotes = Quote.objects.filter(status__in=OPEN_STATUSES, estimated_at__isnull=False)
+    if stone_ids is not None:
+        quotes = quotes.filter(pk__in=QuoteItem.objects.filter(stone_id__in=stone_ids).values('quote_id'))
+    return quotes.update(estimated_at=None)
+
+
+def reprice_stale_quotes(batch_size=BATCH_SIZE):
+    """
+    Re-estimate the open quotes marked stale. The rules are read afresh, since
+    they may have been changed by another process. Returns the number of
+    quotes estimated.
+    """
+    quotes = Quote.objects.filter(status__in=OPEN_STATUSES, estimated_at__isnull=True)
+    return estimate_quotes(quotes, batch_size, rules=PricingRules.load())
+
+
+@receiver(pre_save, sender=Stone)
+def note_price_change(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'price' not in update_fields):
+        instance._price_changed = False
+        return
+    # Compared with the price the instance was loaded with (Stone.from_db);
+    # an instance built by hand has none, so it counts as a change
+    instance._price_changed = not hasattr(instance, '_loaded_price') or instance._loaded_price != instance.price
+
+
+@receiver(post_save, sender=Stone)
+def mark_quotes_stale_for_stone(sender, instance, created, **kwargs):
+    if getattr(instance, '_price_changed', False):
+        mark_quotes_stale([instance.pk])
+    if 'price' in instance.__dict__:
+        instance._loaded_price = instance.price
+
+
+@receiver([post_save, post_delete], sender=VolumeTier)
+@receiver([post_save, post_delete], sender=PriceSurcharge)
+def mark_quotes_stale_for_rules(sender, **kwargs):
+    clear_rules()
+    mark_quotes_stale()
+    transaction.on_commit(publish_rule_change)
+
+
+def publish_rule_change():
+    """
+    Make every process reload its rules, then mark open quotes stale again:
+    those priced elsewhere with the old rules until now were not there to be
+    marked when the change was saved.
+    """
+    bump_versions(RULE_MODELS)
+    mark_quotes_stale()
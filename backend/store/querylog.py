@@ -0,0 +1,210 @@
+"""
+Slow query log.
+
+Every database connection gets an execute wrapper that times each query.
+Queries taking at least SLOW_QUERY_THRESHOLD_MS are recorded with:
+
+- a fingerprint of the SQL: literals and placeholders become ``?`` and
+  IN lists ``(...)``, so the same ORM query with other values matches,
+- where it came from: the endpoint and serializer of the request (with
+  ServerTimingMiddleware enabled), and the innermost frame in our own code,
+- its EXPLAIN plan (EXPLAIN QUERY PLAN on SQLite), captured for SELECTs at
+  most once per fingerprint every EXPLAIN_INTERVAL seconds.
+
+The last SLOW_QUERY_LOG_SIZE queries are kept in a ring buffer, and totals
+per fingerprint in a table capped at MAX_FINGERPRINTS, per process. Staff
+see both at /api/metrics/slow-queries/. Each slow query is also logged as
+a warning by the ``store.querylog`` logger.
+
+Times are those of cursor.execute(); rows a backend fetches lazily (SQLite
+steps through results as they are read) are not included.
+"""
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.regex_helper import _lazy_re_compile
+from .instrumentation import current_origin
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a fingerprint's plan is captured again
+EXPLAIN_INTERVAL = 600
+MAX_FINGERPRINTS = 500
+SQL_PREVIEW_LENGTH = 2000
+
+_string_literal_re = _lazy_re_compile(r"'(?:[^']|'')*'")
+_number_re = _lazy_re_compile(r'\b\d+(?:\.\d+)?\b')
+_placeholder_re = _lazy_re_compile(r'%s|%\(\w+\)s|\?')
+_in_list_re = _lazy_re_compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_whitespace_re = _lazy_re_compile(r'\s+')
+
+_explaining = ContextVar('explaining', default=False)
+_lock = threading.Lock()
+_recent = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+_fingerprints = {}
+_code_root = os.path.dirname(os.path.abspath(__file__))
+# Execute wrappers and timers sit between the ORM and the code that made the query
+_skipped_files = {
+    os.path.join(_code_root, name) for name in ('querylog.py', 'instrumentation.py', 'routing.py', 'nplusone.py')
+}
+
+
+def normalize(sql):
+    sql = _string_literal_re.sub('?', sql)
+    sql = _placeholder_re.sub('?', sql)
+    sql = _number_re.sub('?', sql)
+    sql = _in_list_re.sub('(...)', sql)
+    return _whitespace_re.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def is_app_code(filename):
+    """Whether a frame's file is in this app, leaving out the query wrappers"""
+    return filename.startswith(_code_root) and filename not in _skipped_files
+
+
+def code_location():
+    """The innermost caller in this app, e.g. 'views.py:123 in list'"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if is_app_code(filename):
+            return f'{os.path.relpath(filename, _code_root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params):
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    token = _explaining.set(True)
+    try:
+        # On PostgreSQL in a savepoint, so a failing EXPLAIN cannot break the caller's
+        # transaction. SQLite needs none, and would take the write lock for it.
+        with (transaction.atomic(using=connection.alias) if connection.vendor == 'postgresql' else nullcontext()):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in rows)
+
+
+def record_slow_query(connection, sql, params, many, duration):
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    endpoint, serializer = current_origin()
+    now = time.monotonic()
+    with _lock:
+        stats = _fingerprints.get(key)
+        needs_plan = stats is None or now - stats['plan_captured'] >= EXPLAIN_INTERVAL
+    plan = None
+    if needs_plan and not many and sql.lstrip()[:6].upper() == 'SELECT':
+        plan = explain(connection, sql, params)
+
+    entry = {
+        'at': timezone.now().isoformat(),
+        'duration_ms': round(duration * 1000, 2),
+        'database': connection.alias,
+        'fingerprint': key,
+        'sql': sql[:SQL_PREVIEW_LENGTH],
+        'endpoint': endpoint,
+        'serializer': serializer,
+        'location': code_location(),
+        'plan': plan,
+    }
+    with _lock:
+        _recent.append(entry)
+        stats = _fingerprints.get(key)
+        if stats is None:
+            if len(_fingerprints) >= MAX_FINGERPRINTS:
+                # Make room by dropping the fingerprint that has cost the least
+                del _fingerprints[min(_fingerprints, key=lambda k: _fingerprints[k]['total_ms'])]
+            stats = _fingerprints[key] = {
+                'fingerprint': key, 'sql': normalized[:SQL_PREVIEW_LENGTH], 'count': 0, 'total_ms': 0.0,
+                'max_ms': 0.0, 'endpoints': set(), 'plan': None, 'plan_captured': float('-inf'),
+            }
+        stats['count'] += 1
+        stats['total_ms'] += entry['duration_ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+        stats['last_seen'] = entry['at']
+        if endpoint:
+            stats['endpoints'].add(endpoint)
+        if plan is not None:
+            stats['plan'] = plan
+            stats['plan_captured'] = now
+    logger.warning(
+        'Slow query (%.0f ms, %s) from %s: %s', entry['duration_ms'], key,
+        endpoint or entry['location'] or 'unknown', normalized[:200]
+    )
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - start
+    if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS and not _explaining.get():
+        try:
+            record_slow_query(context['connection'], sql, params, many, duration)
+        except Exception:
+            # Never fail the query because logging it did
+            logger.exception('Could not record a slow query')
+    return result
+
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    # Connections are per thread, so each one gets the wrapper as it opens
+    if settings.SLOW_QUERY_THRESHOLD_MS is not None and log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
+
+
+def slow_query_stats(limit=50):
+    """Fingerprints by total time, most expensive first, and the most recent slow queries"""
+    with _lock:
+        fingerprints = sorted(_fingerprints.values(), key=lambda stats: -stats['total_ms'])[:limit]
+        fingerprints = [
+            {
+                **{k: v for k, v in stats.items() if k != 'plan_captured'},
+                'total_ms': round(stats['total_ms'], 2),
+                'avg_ms': round(stats['total_ms'] / stats['count'], 2),
+                'endpoints': sorted(stats['endpoints']),
+            }
+            for stats in fingerprints
+        ]
+        recent = list(_recent)[::-1][:limit]
+    return {
+        'pid': os.getpid(),
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+        'fingerprints': fingerprints,
+        'recent': recent,
+    }
+
+
+def clear_slow_queries():
+    with _lock:
+        _recent.clear()
+        _fingerprints.clear()
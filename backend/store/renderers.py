@@ -0,0 +1,79 @@
+"""
+JSON renderer and parser backed by orjson when it is installed.
+
+    REST_FRAMEWORK = {
+        'DEFAULT_RENDERER_CLASSES': ['store.renderers.FastJSONRenderer', ...],
+        'DEFAULT_PARSER_CLASSES': ['store.renderers.FastJSONParser', ...],
+    }
+
+Both produce and accept what DRF's JSONRenderer and JSONParser do, byte for
+byte. Types orjson does not know (Decimal, lazy translation strings,
+timedelta, querysets...) and datetimes, which DRF writes with a "Z" suffix,
+go through DRF's JSONEncoder. Anything orjson cannot handle exactly
+(indented output, integers beyond 64 bits, non-UTF-8 request bodies) falls
+back to the stdlib json module, as does everything when orjson is not
+installed. The one difference: NaN and infinite floats render as null
+instead of raising ValueError.
+"""
+from io import BytesIO
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json without it
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+_encoder = JSONEncoder()
+# orjson reads integers beyond 64 bits as floats, so bodies with a run of 19+ digits
+# (possibly inside a string) go to the stdlib parser. translate() is much faster than a regex.
+_digits_to_zero = bytes.maketrans(b'123456789', b'000000000')
+_long_digit_run = b'0' * 19
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+def dumps(data):
+    """Serialize data as compact UTF-8 JSON bytes, like FastJSONRenderer"""
+    return FastJSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if (self.get_indent(accepted_media_type or '', renderer_context or {})
+                or not self.compact or self.ensure_ascii or not self.strict):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits or non-string keys; a type neither encoder handles raises again here
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like DRF, escape the two characters that are valid JSON but end a line in JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if _long_digit_run in body.translate(_digits_to_zero):
+            return super().parse(BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let the stdlib parser accept what orjson does not, or report the error as DRF does
+            return super().parse(BytesIO(body), media_type, parser_context)
@@ -0,0 +1,138 @@
+"""
+Incrementally maintained daily sales rollups.
+
+Orders count towards sales while they are paid, processing, shipped or
+delivered. Whenever the order state machine moves orders into or out of
+that set, their totals are added to or subtracted from the rollup tables
+in the same transaction. ``rebuild_sales_rollups`` recomputes the tables
+from scratch for backfills. Reports read only from the rollups.
+"""
+import functools
+import operator
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.dispatch import receiver
+from .models import (
+    Order, OrderItem, DailyStoneSales, DailyCategorySales, DailyCitySales, DailyPaymentTypeSales
+)
+from .order_states import orders_transitioned
+
+
+REVENUE_STATUSES = ['paid', 'processing', 'shipped', 'delivered']
+
+BATCH_SIZE = 500
+# Buckets adjusted per UPDATE; each takes 11 query parameters and SQLite allows 999
+UPDATE_BATCH_SIZE = 80
+
+# Report name -> (rollup model, grouping key stored on it)
+ROLLUPS = {
+    'stone': (DailyStoneSales, 'stone_id'),
+    'category': (DailyCategorySales, 'category_id'),
+    'city': (DailyCitySales, 'shipping_city'),
+    'payment_type': (DailyPaymentTypeSales, 'payment_type'),
+}
+
+LINE_TOTAL = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _sales_day(prefix=''):
+    """Day an order's revenue is booked on: its payment date, or creation date when unset"""
+    return TruncDate(Coalesce(f'{prefix}payment_date', f'{prefix}created_at'))
+
+
+def aggregate_sales(orders):
+    """
+    Aggregate an Order queryset into rollup rows, keyed like ROLLUPS.
+    Every row holds date, the grouping key, order_count, quantity and revenue.
+    """
+    items = OrderItem.objects.filter(order__in=orders).annotate(date=_sales_day('order__'))
+    orders = orders.annotate(date=_sales_day())
+    # revenue comes first: once quantity is annotated, F('quantity') refers to the sum
+    item_totals = {
+        'revenue': Sum(LINE_TOTAL),
+        'order_count': Count('order_id', distinct=True),
+        'quantity': Sum('quantity'),
+    }
+
+    rows = {
+        'stone': list(items.values('date', 'stone_id').annotate(**item_totals)),
+        'category': list(items.values('date', category_id=F('stone__category_id')).annotate(**item_totals)),
+    }
+    for name in ('city', 'payment_type'):
+        key = ROLLUPS[name][1]
+        # Order totals and item quantities are summed separately so joining the
+        # items does not multiply total_amount
+        quantities = {
+            (row['date'], row['key']): row['quantity']
+            for row in items.values('date', key=F(f'order__{key}')).annotate(quantity=Sum('quantity'))
+        }
+        rows[name] = [
+            dict(row, quantity=quantities.get((row['date'], row[key]), 0))
+            for row in orders.values('date', key).annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+        ]
+    return rows
+
+
+def _adjust_buckets(model, key, rows, sign):
+    """Add sign * each row's totals to its bucket, with one UPDATE for all of them"""
+    buckets = [Q(date=row['date'], **{key: row[key]}) for row in rows]
+    model.objects.filter(functools.reduce(operator.or_, buckets)).update(**{
+        field: F(field) + Case(
+            *[When(bucket, then=Value(sign * (row[field] or 0))) for bucket, row in zip(buckets, rows)],
+            default=Value(0), output_field=model._meta.get_field(field),
+        )
+        for field in ('order_count', 'quantity', 'revenue')
+    })
+
+
+def apply_orders(order_ids, sign):
+    """Add (sign=1) or subtract (sign=-1) the given orders' sales from the rollups"""
+    with transaction.atomic():
+        for start in range(0, len(order_ids), BATCH_SIZE):
+            orders = Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE])
+            for name, rows in aggregate_sales(orders).items():
+                model, key = ROLLUPS[name]
+                # Make sure every bucket exists, then adjust it in place so
+                # concurrent transitions never overwrite each other's totals
+                model.objects.bulk_create(
+                    [model(date=row['date'], **{key: row[key]}) for row in rows],
+                    ignore_conflicts=True
+                )
+                for batch_start in range(0, len(rows), UPDATE_BATCH_SIZE):
+                    _adjust_buckets(model, key, rows[batch_start:batch_start + UPDATE_BATCH_SIZE], sign)
+
+
+def rebuild_rollups(since=None):
+    """Recompute the rollup tables from orders, optionally only from the date since onwards"""
+    orders = Order.objects.filter(status__in=REVENUE_STATUSES)
+    with transaction.atomic():
+        if since is not None:
+            orders = orders.annotate(sales_date=_sales_day()).filter(sales_date__gte=since)
+        for name, rows in aggregate_sales(orders).items():
+            model, key = ROLLUPS[name]
+            stale = model.objects.all()
+            if since is not None:
+                stale = stale.filter(date__gte=since)
+            stale.delete()
+            model.objects.bulk_create([model(**row) for row in rows], batch_size=BATCH_SIZE)
+
+
+def sales_report(name, since=None, until=None):
+    """Totals per grouping key over a date range, read only from the rollups"""
+    model, key = ROLLUPS[name]
+    rollups = model.objects.all()
+    if since:
+        rollups = rollups.filter(date__gte=since)
+    if until:
+        rollups = rollups.filter(date__lte=until)
+    return rollups.values(key).annotate(
+        order_count=Sum('order_count'), quantity=Sum('quantity'), revenue=Sum('revenue')
+    ).order_by('-revenue')
+
+
+@receiver(orders_transitioned)
+def update_sales_rollups(sender, source, target, order_ids, **kwargs):
+    sign = (target in REVENUE_STATUSES) - (source in REVENUE_STATUSES)
+    if sign:
+        apply_orders(order_ids, sign)
@@ -0,0 +1,228 @@
+"""
+Read-replica routing for catalog traffic.
+
+Views that use ReplicaReadMixin (the category, stone and project catalog)
+read from a replica in REPLICA_DATABASES. All writes, and all reads outside
+those views, go to the primary. Reads also stay on the primary:
+
+- for the rest of a request once it has written anything,
+- for REPLICA_PIN_SECONDS after a client's write request, tracked with a
+  cookie and, for authenticated users, an entry in the REPLICA_PIN_CACHE
+  cache shared by all processes (token clients often drop cookies), so a
+  client sees its own writes despite replication lag,
+- when no replica passes its health check. Replicas are checked at most
+  every REPLICA_HEALTH_CHECK_INTERVAL seconds per process, and a replica
+  that errors during a request is marked down and the request retried on
+  the primary.
+
+Nothing changes when REPLICA_DATABASES is empty.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_primary'
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE'}
+
+_state = ContextVar('replica_routing', default=None)
+_health = {}
+_health_lock = threading.Lock()
+
+
+class RoutingState:
+    """Where the current request reads from"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+
+
+def pin_key(user_id):
+    return f'db-primary:{user_id}'
+
+
+def pin_cache():
+    # The client's next request may land on any process
+    return caches[settings.REPLICA_PIN_CACHE]
+
+
+def check_replica(alias):
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            # A fresh or half-copied file has no schema yet
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+            if connection.vendor == 'postgresql':
+                cursor.execute("""
+                    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+                """)
+                lag = cursor.fetchone()[0]
+                if lag is not None and lag > settings.REPLICA_MAX_LAG:
+                    logger.warning('Replica %s is %.0fs behind the primary', alias, lag)
+                    return False
+    except DatabaseError as e:
+        logger.warning('Replica %s failed its health check: %s', alias, e)
+        connection.close()
+        return False
+    return True
+
+
+def replica_is_healthy(alias):
+    healthy, checked_at = _health.get(alias, (False, None))
+    if checked_at is not None and time.monotonic() - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return healthy
+    # One thread refreshes the result; the others keep using the last one
+    if not _health_lock.acquire(blocking=False):
+        return healthy
+    try:
+        healthy = check_replica(alias)
+        _health[alias] = (healthy, time.monotonic())
+    finally:
+        _health_lock.release()
+    return healthy
+
+
+def mark_unhealthy(alias):
+    _health[alias] = (False, time.monotonic())
+    connections[alias].close()
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.REPLICA_DATABASES if replica_is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def current_replica():
+    """The replica this request is reading from, if any"""
+    state = _state.get()
+    if state is None or state.wrote:
+        return None
+    return state.replica
+
+
+def read_from_replica(request, user):
+    """Route the rest of this request's reads to a replica, if it may use one"""
+    state = _state.get()
+    if state is None or state.pinned or state.wrote or request.method not in SAFE_METHODS:
+        return
+    if user.is_authenticated and pin_cache().get(pin_key(user.pk)):
+        return
+    state.replica = choose_replica()
+
+
+def track_writes(execute, sql, params, many, context):
+    # Statements actually run, rather than db_for_write, which Django also
+    # consults when merely assigning a foreign key on an unsaved instance
+    state = _state.get()
+    if state is not None and not state.wrote and sql.lstrip().split(None, 1)[0].upper() in WRITE_STATEMENTS:
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_write_tracking(sender, connection, **kwargs):
+    # On every connection rather than per request: connections are per thread,
+    # and async views query from sync_to_async threads the middleware never sees
+    if settings.REPLICA_DATABASES and track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_writes)
+
+
+def pin_to_primary(request, response):
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        pin_cache().set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return current_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Track reads and writes per request and pin clients that wrote to the primary"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote or request.method not in SAFE_METHODS:
+            pin_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            # Queries run in sync_to_async threads, which see this context's state
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote or request.method not in SAFE_METHODS:
+            await sync_to_async(pin_to_primary)(request, response)
+        return response
+
+
+class ReplicaReadMixin:
+    """For read-only viewsets: serve safe requests from a replica"""
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication has run on the primary by now
+        super().initial(request, *args, **kwargs)
+        read_from_replica(request, request.user)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except DatabaseError:
+            state = _state.get()
+            if state is None or state.replica is None:
+                raise
+            logger.warning('Replica %s failed, retrying on the primary', state.replica, exc_info=True)
+            mark_unhealthy(state.replica)
+            state.replica = None
+            state.pinned = True
+            return super().dispatch(request, *args, **kwargs)
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
-    Category, Stone, StoneImage, StoneVideo, Project, ProjectImage, 
+    UserProfile, Category, Stone, StoneImage, StoneVideo, Project, ProjectImage, 
     ProjectVideo, ProjectStone, Cart, CartItem, Quote, QuoteItem, Order, OrderItem
 )
 
@@ -78,7 +78,8 @@ class StoneSerializer(serializers.ModelSerializer):
         return [image.image.url for image in obj.images.all()]
     
     def get_video_url(self, obj):
-        primary_video = obj.videos.filter(is_primary=True).first()
+        # Scan the (usually prefetched) videos instead of issuing a filtered query per stone
+        primary_video = next((video for video in obj.videos.all() if video.is_primary), None)
         return primary_video.video_url if primary_video else None
 
 
@@ -192,14 +193,15 @@ class ProjectSerializer(serializers.ModelSerializer):
         return [project_stone.stone.name_en for project_stone in obj.project_stones.all()]
     
     def get_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
+        # Scan the prefetched images; a filtered query here would run once per project
+        primary_image = next((image for image in obj.images.all() if image.is_primary), None)
         return primary_image.image.url if primary_image else None
     
     def get_gallery(self, obj):
         return [image.image.url for image in obj.images.all()]
     
     def get_video(self, obj):
-        primary_video = obj.videos.filter(is_primary=True).first()
+        primary_video = next((video for video in obj.videos.all() if video.is_primary), None)
         return primary_video.video_url if primary_video else None
 
 
@@ -216,14 +218,16 @@ class UserSerializer(serializers.ModelSerializer):
         # Handle profile data
         profile_data = validated_data.pop('profile', {})
         
-        # Update user fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        # Update user fields, writing only the ones that changed
+        changed = [attr for attr, value in validated_data.items() if getattr(instance, attr) != value]
+        for attr in changed:
+            setattr(instance, attr, validated_data[attr])
+        if changed:
+            instance.save(update_fields=changed)
         
-        # Update profile fields
+        # Update profile fields; the profile is created on its first write
         if profile_data:
-            profile = instance.profile
+            profile = UserProfile.for_user(instance)
             for attr, value in profile_data.items():
                 setattr(profile, attr, value)
             profile.save()
@@ -266,7 +270,7 @@ class QuoteItemSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = QuoteItem
-        fields = ['id', 'stone', 'stone_id', 'quantity', 'notes']
+        fields = ['id', 'stone', 'stone_id', 'quantity', 'selected_finish', 'selected_thickness', 'notes']
 
 
 class QuoteSerializer(serializers.ModelSerializer):
@@ -282,6 +286,38 @@ class QuoteSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'status', 'created_at', 'updated_at']
 
 
+class QuoteStoneSerializer(serializers.ModelSerializer):
+    """Stone as listed on a quote: names and category only, no media"""
+    category = CategorySerializer(read_only=True)
+    
+    class Meta:
+        model = Stone
+        fields = ['id', 'name_en', 'name_fa', 'category', 'origin']
+        read_only_fields = fields
+
+
+class QuoteItemSummarySerializer(serializers.ModelSerializer):
+    stone = QuoteStoneSerializer(read_only=True)
+    
+    class Meta:
+        model = QuoteItem
+        fields = ['id', 'stone', 'quantity', 'selected_finish', 'selected_thickness', 'notes']
+        read_only_fields = fields
+
+
+class QuoteSummarySerializer(serializers.ModelSerializer):
+    """Quote representation for lists; expects items prefetched with their stones and categories"""
+    items = QuoteItemSummarySerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Quote
+        fields = [
+            'id', 'name', 'company', 'project_type', 'project_location', 'timeline',
+            'additional_notes', 'status', 'items', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     stone = StoneSerializer(read_only=True)
     stone_id = serializers.IntegerField(write_only=True)
@@ -302,14 +338,29 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = [
             'id', 'user', 'order_number', 'tracking_code', 'status', 'total_amount',
-            'payment_id', 'payment_status', 'payment_date',
+            'payment_type', 'payment_id', 'payment_status', 'payment_date',
             'shipping_address', 'shipping_city', 'shipping_postal_code', 'shipping_phone',
             'items', 'created_at', 'updated_at'
         ]
+        # Status and payment only change through store.order_states, which the rollups,
+        # stock settlement and notifications hang off
         read_only_fields = [
-            'id', 'user', 'order_number', 'tracking_code', 'payment_id', 'payment_status', 
-            'payment_date', 'created_at', 'updated_at'
+            'id', 'user', 'order_number', 'tracking_code', 'status', 'total_amount',
+            'payment_type', 'payment_id', 'payment_status', 'payment_date', 'created_at', 'updated_at'
+        ]
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Slim order representation for history lists; expects an item_count annotation"""
+    item_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'order_number', 'tracking_code', 'status', 'payment_status', 'total_amount',
+            'item_count', 'shipping_address', 'shipping_city', 'shipping_postal_code', 'created_at'
         ]
+        read_only_fields = fields
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
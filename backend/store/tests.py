@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import itertools
+import json
+import threading
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from http.client import HTTPConnection
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User, update_last_login
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from . import routing, urls
+from .authentication import token_cache, token_cache_key
+from .inventory import OutOfStock, release_expired_reservations, release_reservations, reserve_stock
+from .mock_gateway import REQUEST_PATH, GatewayConfig, MockGatewayServer
+from .models import (
+    Cart, CartItem, Category, DailyStoneSales, Notification, Order, OrderItem, Project, ProjectImage, ProjectStone,
+    ProjectVideo, Quote, QuoteItem, StockReservation, Stone, StoneImage, StoneStock, StoneVideo, UserProfile,
+    VolumeTier
+)
+from .notifications import claim_batch, enqueue, queue_stats, send_batch
+from .nplusone import NPlusOneError, RequestQueries
+from .order_states import transition_orders
+from .payment import ZarinPalPayment
+from .pricing import (
+    PricingRules, clear_rules, estimate_quotes, get_rules, publish_rule_change, reprice_stale_quotes
+)
+from .querylog import normalize
+from .reporting import REVENUE_STATUSES, ROLLUPS, aggregate_sales, rebuild_rollups
+from .routing import RoutingState, pin_to_primary, read_from_replica
 
-# Create your tests here.
+
+# Every cache in memory, so the tests neither read nor clear the shared file cache
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+    'catalog': {
+        'BACKEND': 'store.cache_backends.TieredCache',
+        'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 200, 'LOCAL_TIMEOUT': 60},
+    },
+}
+
+@override_settings(CACHES=TEST_CACHES)
+class UserProfileQueryTests(TestCase):
+    """Profiles are created lazily and only changed fields are written"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user('sara', email='sara@example.com', password='stone-pass-123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        # Resolve the token once so the cached path is what gets counted
+        self.client.get('/api/users/profile/')
+
+    def test_registration_does_not_create_profile(self):
+        # username check, user insert, token insert, profile lookup for the response
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/register/', {
+                'username': 'reza', 'email': 'reza@example.com', 'first_name': 'Reza', 'last_name': '',
+                'password': 'stone-pass-123', 'password_confirm': 'stone-pass-123',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['user']['phone'])
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_login(self):
+        # user lookup, token lookup, profile lookup for the response
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                '/api/auth/login/', {'username': 'sara', 'password': 'stone-pass-123'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], self.token.key)
+
+    def test_last_login_update_writes_only_the_user(self):
+        with self.assertNumQueries(1):
+            update_last_login(None, self.user)
+
+    def test_profile_patch_creates_profile_on_first_write(self):
+        self.authenticate()
+        # profile insert, token lookup to invalidate the auth cache
+        with self.assertNumQueries(2):
+            response = self.client.patch('/api/users/profile/', {'phone': '+989120000000'}, format='json')
+        self.assertEqual(response.data['phone'], '+989120000000')
+        self.assertEqual(UserProfile.objects.get(user=self.user).phone, '+989120000000')
+
+    def test_profile_patch_writes_only_changed_fields(self):
+        UserProfile.objects.create(user=self.user, phone='+989120000000', address='Tehran')
+        self.authenticate()
+        # one UPDATE each for the user and the profile, each followed by a token lookup for invalidation
+        with self.assertNumQueries(4):
+            self.client.patch('/api/users/profile/', {'phone': '+989121111111', 'first_name': 'Sara'}, format='json')
+        self.user.refresh_from_db()
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((self.user.first_name, profile.phone, profile.address), ('Sara', '+989121111111', 'Tehran'))
+
+    def test_unchanged_profile_patch_writes_nothing(self):
+        UserProfile.objects.create(user=self.user, phone='+989120000000')
+        self.authenticate()
+        with self.assertNumQueries(0):
+            response = self.client.patch(
+                '/api/users/profile/', {'phone': '+989120000000', 'email': 'sara@example.com'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+
+_serial = itertools.count()
+
+
+def create_stones(count, category):
+    """Stones with two images and a video each, like the live catalog"""
+    stones = Stone.objects.bulk_create([
+        Stone(name_en=f'Stone {n}', name_fa=f'سنگ {n}', category=category, description_en='Polished marble',
+              description_fa='مرمر صیقلی', origin='Isfahan', price=Decimal('85.50'))
+        for n in itertools.islice(_serial, count)
+    ])
+    StoneImage.objects.bulk_create([
+        StoneImage(stone=stone, image=f'stones/{stone.pk}-{i}.jpg', is_primary=i == 0, order=i)
+        for stone in stones for i in range(2)
+    ])
+    StoneVideo.objects.bulk_create([
+        StoneVideo(stone=stone, video_url=f'https://example.com/{stone.pk}.mp4', is_primary=True) for stone in stones
+    ])
+    return stones
+
+
+def create_category():
+    n = next(_serial)
+    return Category.objects.create(name_en=f'Category {n}', name_fa=f'دسته {n}', slug=f'category-{n}')
+
+
+def create_project(stones):
+    n = next(_serial)
+    project = Project.objects.create(
+        title_en=f'Project {n}', title_fa=f'پروژه {n}', description_en='Lobby', description_fa='لابی',
+        location_en='Tehran', location_fa='تهران', year='2024', category_en='Hotel', category_fa='هتل',
+    )
+    ProjectImage.objects.bulk_create([
+        ProjectImage(project=project, image=f'projects/{project.pk}-{i}.jpg', is_primary=i == 0, order=i)
+        for i in range(2)
+    ])
+    ProjectVideo.objects.create(project=project, video_url=f'https://example.com/p{project.pk}.mp4', is_primary=True)
+    ProjectStone.objects.bulk_create([ProjectStone(project=project, stone=stone, quantity=10) for stone in stones])
+    return project
+
+
+def create_order(user, stones, status='pending'):
+    n = next(_serial)
+    order = Order.objects.create(
+        user=user, status=status, total_amount=Decimal('85.50') * len(stones), payment_id=f'AUTH{n:032d}',
+        shipping_address='No. 12, Valiasr Street', shipping_city='Tehran', shipping_postal_code='1234567890',
+        shipping_phone='09120000000',
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, stone=stone, quantity=2, price=stone.price) for stone in stones
+    ])
+    return order
+
+
+def create_quote(user, stones):
+    quote = Quote.objects.create(
+        user=user, name='Sara', email='sara@example.com', project_type='Hotel', project_location='Tehran',
+        timeline='3 months',
+    )
+    QuoteItem.objects.bulk_create([QuoteItem(quote=quote, stone=stone, quantity=20) for stone in stones])
+    return quote
+
+
+def adding(create, **request):
+    """A prepare() for assertConstantQueries that calls create() once per row"""
+    def prepare(rows):
+        for _ in range(rows):
+            create()
+        return request
+    return prepare
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        else:
+            yield pattern.name
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EndpointQueryCountTests(TestCase):
+    """
+    Query budgets for every route in store/urls.py.
+
+    Endpoints returning many rows (stones, cart lines, order items...) are
+    measured with one row, then again after adding fifty: the count must not
+    change, or the endpoint queries per row. Failures list the SQL run, the
+    most repeated statement first. Every request runs with cold caches, so
+    catalog responses are measured as misses. Lower a budget when an
+    endpoint gets cheaper.
+    """
+    BUDGETS = {
+        'GET api-root': 0,
+        'GET category-list': 2,
+        'GET category-detail': 1,
+        'GET stone-list': 4,
+        'GET stone-detail': 3,
+        'GET stone-featured': 3,
+        'GET stone-by-category': 4,
+        'GET project-list': 7,
+        'GET project-detail': 6,
+        'GET project-featured': 6,
+        'GET cart-list': 6,
+        'GET cart-detail': 6,
+        'POST cart-add-item': 11,
+        'POST cart-update-item': 9,
+        'POST cart-remove-item': 3,
+        'POST cart-clear': 2,
+        'POST cart-checkout': 12,
+        'GET quote-list': 3,
+        'GET quote-detail': 4,
+        'POST quote-list': 6,
+        'POST quote-submit-quote': 11,
+        'GET quote-pipeline': 1,
+        'GET user-list': 3,
+        'GET user-detail': 2,
+        'GET user-profile': 1,
+        'GET user-quotes': 3,
+        'GET order-list': 2,
+        'GET order-detail': 4,
+        'POST order-bulk-transition': 4,
+        'POST register-list': 4,
+        'GET register-detail': 1,
+        'GET payment-callback': 26,
+        'GET sales-report-list': 1,
+        'GET export-list': 0,
+        'GET export-detail': 1,
+        'GET notification-stats-list': 3,
+        'GET timing-stats-list': 0,
+        'GET slow-query-list': 0,
+        'POST slow-query-clear': 0,
+        'POST login': 6,
+        'POST logout': 2,
+        'GET payment-async-callback': 26,
+        'GET async-category-list': 2,
+        'GET async-category-detail': 1,
+        'GET async-stone-list': 4,
+        'GET async-stone-detail': 3,
+        'GET async-project-list': 7,
+        'GET async-project-detail': 6,
+        'GET mock_payment': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sara', email='sara@example.com', password='stone-pass-123')
+        cls.staff = User.objects.create_user('admin', email='admin@example.com', is_staff=True)
+        cls.category = create_category()
+        cls.stone = create_stones(1, cls.category)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.login(self.user)
+
+    def login(self, user):
+        self.auth_user = user
+
+    def request(self, endpoint, kwargs=None, data=None, status_code=200):
+        """Call an endpoint ('METHOD route-name') with cold caches and return the queries it ran"""
+        method, name = endpoint.split()
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        clear_rules()
+        # A fresh user per request, as token authentication gives, without relations cached by earlier ones
+        self.client.force_authenticate(self.auth_user and User.objects.get(pk=self.auth_user.pk))
+        if method == 'GET':
+            call = lambda: self.client.get(reverse(name, kwargs=kwargs), data)
+        else:
+            call = lambda: getattr(self.client, method.lower())(reverse(name, kwargs=kwargs), data, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = call()
+            if response.streaming:
+                # Streaming responses query as they are read
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code, f'{endpoint}: {getattr(response, "data", response)}')
+        return queries
+
+    def report(self, queries):
+        counts = Counter(normalize(query['sql']) for query in queries)
+        return '\n'.join(f'{count:4}x {sql}' for sql, count in counts.most_common())
+
+    def assertQueryBudget(self, endpoint, kwargs=None, data=None, status_code=200):
+        budget = self.BUDGETS[endpoint]
+        queries = self.request(endpoint, kwargs, data, status_code)
+        if len(queries) > budget:
+            self.fail(f'{endpoint} ran {len(queries)} queries, budget {budget}:\n{self.report(queries)}')
+
+    def assertConstantQueries(self, endpoint, prepare, status_code=200):
+        """
+        prepare(rows) adds that many rows (stones, lines...) and returns the
+        request's kwargs and data; it is called with 1, then with 50
+        """
+        budget = self.BUDGETS[endpoint]
+        counts = []
+        for rows in (1, 50):
+            queries = self.request(endpoint, status_code=status_code, **prepare(rows))
+            counts.append(len(queries))
+        if counts[0] != counts[1] or counts[1] > budget:
+            self.fail(
+                f'{endpoint} ran {counts[0]} queries for 1 row and {counts[1]} after adding 50, '
+                f'budget {budget}:\n{self.report(queries)}'
+            )
+
+    def test_every_route_has_a_budget(self):
+        budgeted = {endpoint.split()[1] for endpoint in self.BUDGETS}
+        self.assertEqual(set(route_names(urls.urlpatterns)) - budgeted, set())
+
+    def test_api_root(self):
+        self.assertQueryBudget('GET api-root')
+
+    def test_categories(self):
+        self.assertConstantQueries('GET category-list', adding(create_category))
+        self.assertQueryBudget('GET category-detail', {'pk': self.category.pk})
+
+    def test_stones(self):
+        self.assertConstantQueries('GET stone-list', adding(lambda: create_stones(1, self.category)))
+        self.assertConstantQueries('GET stone-featured', adding(lambda: create_stones(1, self.category)))
+        self.assertQueryBudget('GET stone-detail', {'pk': self.stone.pk})
+
+    def test_stones_by_category(self):
+        self.assertConstantQueries('GET stone-by-category', adding(lambda: create_stones(2, create_category())))
+
+    def test_projects(self):
+        stones = create_stones(2, self.category)
+        self.assertConstantQueries('GET project-list', adding(lambda: create_project(stones)))
+        self.assertConstantQueries('GET project-featured', adding(lambda: create_project(stones)))
+        self.assertConstantQueries('GET project-detail', lambda rows: {
+            'kwargs': {'pk': create_project(create_stones(rows, self.category)).pk}
+        })
+
+    def fill_cart(self, rows):
+        cart, _ = Cart.objects.get_or_create(user=self.user, is_active=True)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, stone=stone, quantity=3) for stone in create_stones(rows, self.category)
+        ])
+        return cart
+
+    def test_cart(self):
+        self.assertConstantQueries('GET cart-list', adding(lambda: self.fill_cart(1)))
+        self.assertConstantQueries('GET cart-detail', lambda rows: {'kwargs': {'pk': self.fill_cart(rows).pk}})
+
+    def test_cart_item_changes(self):
+        item = self.fill_cart(1).items.get()
+        self.assertQueryBudget('POST cart-add-item', data={'stone_id': self.stone.pk, 'quantity': 2}, status_code=201)
+        self.assertQueryBudget('POST cart-update-item', data={'item_id': item.pk, 'quantity': 5})
+        self.assertQueryBudget('POST cart-remove-item', data={'item_id': item.pk})
+        self.assertConstantQueries('POST cart-clear', adding(lambda: self.fill_cart(1)))
+
+    def test_checkout(self):
+        shipping = {'address': 'No. 12, Valiasr Street', 'city': 'Tehran', 'postal_code': '1234567890', 'phone': '09120000000'}
+
+        def prepare(rows):
+            CartItem.objects.filter(cart__user=self.user).delete()
+            self.fill_cart(rows)
+            return {'data': {'shipping': shipping}}
+        self.assertConstantQueries('POST cart-checkout', prepare)
+
+    def test_quotes(self):
+        self.login(self.staff)
+        self.assertConstantQueries('GET quote-list', adding(lambda: create_quote(self.user, [self.stone] * 2)))
+        self.assertConstantQueries('GET quote-detail', lambda rows: {
+            'kwargs': {'pk': create_quote(self.user, create_stones(rows, self.category)).pk}
+        })
+        self.assertQueryBudget('GET quote-pipeline')
+
+    def test_quote_submission(self):
+        quote = {
+            'name': 'Sara', 'email': 'sara@example.com', 'project_type': 'Hotel', 'project_location': 'Tehran',
+            'timeline': '3 months',
+        }
+        self.assertQueryBudget('POST quote-list', data=quote, status_code=201)
+        self.assertConstantQueries('POST quote-submit-quote', lambda rows: {'data': {**quote, 'items': [
+            {'stone_id': stone.pk, 'quantity': 20} for stone in create_stones(rows, self.category)
+        ]}}, status_code=201)
+
+    def test_users(self):
+        self.assertQueryBudget('GET user-list')
+        self.assertQueryBudget('GET user-detail', {'pk': self.user.pk})
+        self.assertQueryBudget('GET user-profile')
+        self.assertConstantQueries('GET user-quotes', adding(lambda: create_quote(self.user, [self.stone] * 2)))
+
+    def test_orders(self):
+        self.assertConstantQueries('GET order-list', adding(lambda: create_order(self.user, [self.stone] * 2)))
+        self.assertConstantQueries('GET order-detail', lambda rows: {
+            'kwargs': {'pk': create_order(self.user, create_stones(rows, self.category)).pk}
+        })
+
+    def test_bulk_transition(self):
+        self.login(self.staff)
+
+        def prepare(rows):
+            orders = [create_order(self.user, [self.stone] * 2, status='paid') for _ in range(rows)]
+            return {'data': {'status': 'processing', 'order_ids': [order.pk for order in orders]}}
+        self.assertConstantQueries('POST order-bulk-transition', prepare)
+
+    def test_registration_and_login(self):
+        self.login(None)
+        self.assertQueryBudget('POST register-list', data={
+            'username': 'reza', 'email': 'reza@example.com', 'first_name': 'Reza', 'last_name': '',
+            'password': 'stone-pass-123', 'password_confirm': 'stone-pass-123',
+        }, status_code=201)
+        self.assertQueryBudget('GET register-detail', {'pk': self.user.pk})
+        self.assertQueryBudget('POST login', data={'username': 'sara', 'password': 'stone-pass-123'})
+        self.login(self.user)
+        self.assertQueryBudget('POST logout')
+
+    def test_payment_callbacks(self):
+        # A paid order's lines are added to the sales rollups
+        for endpoint in ('GET payment-callback', 'GET payment-async-callback'):
+            self.assertConstantQueries(endpoint, lambda rows: {'data': {
+                'Authority': create_order(self.user, create_stones(rows, self.category)).payment_id, 'Status': 'OK'
+            }})
+
+    def test_mock_payment_page(self):
+        order = create_order(self.user, [self.stone])
+        self.assertQueryBudget('GET mock_payment', data={
+            'authority': order.payment_id, 'amount': '85.50', 'description': 'Order', 'order_id': order.pk
+        })
+
+    def test_staff_reports(self):
+        self.login(self.staff)
+        self.assertQueryBudget('GET sales-report-list')
+        self.assertQueryBudget('GET export-list')
+        self.assertConstantQueries(
+            'GET export-detail', adding(lambda: create_order(self.user, [self.stone]), kwargs={'pk': 'orders'})
+        )
+        self.assertQueryBudget('GET notification-stats-list')
+        self.assertQueryBudget('GET timing-stats-list')
+        self.assertQueryBudget('GET slow-query-list')
+        self.assertQueryBudget('POST slow-query-clear', status_code=204)
+
+    def test_async_catalog(self):
+        self.login(None)
+        stones = create_stones(2, self.category)
+        self.assertConstantQueries('GET async-category-list', adding(create_category))
+        self.assertQueryBudget('GET async-category-detail', {'pk': self.category.pk})
+        self.assertConstantQueries('GET async-stone-list', adding(lambda: create_stones(1, self.category)))
+        self.assertQueryBudget('GET async-stone-detail', {'pk': self.stone.pk})
+        self.assertConstantQueries('GET async-project-list', adding(lambda: create_project(stones)))
+        self.assertConstantQueries('GET async-project-detail', lambda rows: {
+            'kwargs': {'pk': create_project(create_stones(rows, self.category)).pk}
+        })
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PaymentCallbackRaceTests(TestCase):
+    """A payment moves an order once, however many callbacks arrive and whatever expired meanwhile"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sara', email='sara@example.com')
+        cls.stone = create_stones(1, create_category())[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.order = create_order(self.user, [self.stone])
+        self.stock = StoneStock.objects.create(stone=self.stone, available=5)
+        reserve_stock(self.order, list(self.order.items.all()))
+
+    def callback(self, name):
+        return self.client.get(reverse(name), {'Authority': self.order.payment_id, 'Status': 'OK'})
+
+    def verified(self, during):
+        """Patch verification so during() runs while the gateway is being asked, then it succeeds"""
+        result = {'success': True, 'ref_id': 'REF1', 'message': 'ok'}
+
+        def verify(*args):
+            during()
+            return result
+
+        async def averify(*args):
+            await sync_to_async(during)()
+            return result
+
+        return mock.patch.multiple(ZarinPalPayment, verify_payment=verify, averify_payment=averify)
+
+    def assertDuplicateCallbackIgnored(self, name):
+        # The gateway's duplicate callback is handled while the first is still verifying
+        with self.verified(lambda: self.assertEqual(self.callback(name).status_code, 200)):
+            response = self.callback(name)
+        self.assertContains(response, 'قبلاً با موفقیت')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(Notification.objects.filter(object_id=self.order.pk, event='order_paid').count(), 1)
+        self.assertEqual(DailyStoneSales.objects.get(stone=self.stone).order_count, 1)
+
+    def assertPaymentAfterExpiryIgnored(self, name):
+        with self.verified(lambda: release_expired_reservations(now=timezone.now() + timedelta(days=1))):
+            response = self.callback(name)
+        self.assertContains(response, 'cancelled')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('cancelled', 'expired'))
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, 'released')
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.available, 5)
+        self.assertFalse(Notification.objects.filter(object_id=self.order.pk, event='order_paid').exists())
+        self.assertFalse(DailyStoneSales.objects.exists())
+
+    def test_duplicate_callbacks(self):
+        self.assertDuplicateCallbackIgnored('payment-callback')
+
+    def test_duplicate_async_callbacks(self):
+        self.assertDuplicateCallbackIgnored('payment-async-callback')
+
+    def test_payment_after_expiry(self):
+        self.assertPaymentAfterExpiryIgnored('payment-callback')
+
+    def test_async_payment_after_expiry(self):
+        self.assertPaymentAfterExpiryIgnored('payment-async-callback')
+
+    def test_transition_from_stale_copy(self):
+        first, second = Order.objects.get(pk=self.order.pk), Order.objects.get(pk=self.order.pk)
+        self.assertTrue(first.mark_paid())
+        self.assertFalse(second.mark_paid())
+        self.assertFalse(second.mark_cancelled('failed'))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('paid', 'completed'))
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, 'committed')
+
+
+class OrderAdminTests(TestCase):
+    """Order status only changes through the admin's transition actions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', email='admin@example.com')
+        cls.stone = create_stones(1, create_category())[0]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def change_form(self, order):
+        return self.client.get(reverse('admin:store_order_change', args=[order.pk]))
+
+    def test_status_is_read_only(self):
+        order = create_order(self.admin, [self.stone])
+        response = self.change_form(order)
+        self.assertNotContains(response, 'name="status"')
+        self.assertNotContains(response, 'name="tracking_code"')
+        self.assertContains(response, 'name="items-0-quantity"')
+
+    def test_lines_of_paid_order_are_read_only(self):
+        order = create_order(self.admin, [self.stone], status='paid')
+        response = self.change_form(order)
+        self.assertNotContains(response, 'name="items-0-quantity"')
+        self.assertNotContains(response, 'name="total_amount"')
+        item = order.items.get()
+        response = self.client.get(reverse('admin:store_orderitem_change', args=[item.pk]))
+        self.assertNotContains(response, 'name="quantity"')
+
+    def test_only_cancelled_orders_can_be_deleted(self):
+        order = create_order(self.admin, [self.stone])
+        StoneStock.objects.create(stone=self.stone, available=5)
+        reserve_stock(order, list(order.items.all()))
+        delete_url = reverse('admin:store_order_delete', args=[order.pk])
+        self.assertEqual(self.client.post(delete_url, {'post': 'yes'}).status_code, 403)
+        response = self.client.get(reverse('admin:store_order_changelist'))
+        self.assertNotIn('delete_selected', dict(response.context['action_form'].fields['action'].choices))
+        self.assertEqual(StoneStock.objects.get().available, 3)
+
+        transition_orders(Order.objects.filter(pk=order.pk), 'cancelled')
+        self.assertEqual(StoneStock.objects.get().available, 5)
+        self.client.post(delete_url, {'post': 'yes'})
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+
+    def test_reservation_changelist_query_count(self):
+        StoneStock.objects.create(stone=self.stone, available=100)
+        url = reverse('admin:store_stockreservation_changelist')
+
+        def changelist_queries(orders):
+            for _ in range(orders):
+                order = create_order(self.admin, [self.stone])
+                reserve_stock(order, list(order.items.all()))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(queries)
+
+        self.assertEqual(changelist_queries(1), changelist_queries(3))
+
+    def test_transition_action(self):
+        order = create_order(self.admin, [self.stone])
+        self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'mark_paid', '_selected_action': [order.pk],
+        })
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertTrue(order.tracking_code)
+
+
+class OrderApiTests(TestCase):
+    """Customers can read their orders but not rewrite them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret123')
+        cls.stone = create_stones(1, create_category())[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_status_and_total_cannot_be_written(self):
+        order = create_order(self.user, [self.stone])
+        url = reverse('order-detail', args=[order.pk])
+        for method in (self.client.patch, self.client.put):
+            response = method(url, {'status': 'delivered', 'total_amount': '0.01'}, format='json')
+            self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.client.post(reverse('order-list'), {'total_amount': '0.01'}).status_code, 405)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.total_amount), ('pending', Decimal('85.50')))
+
+    def test_detail_is_readable(self):
+        order = create_order(self.user, [self.stone])
+        response = self.client.get(reverse('order-detail', args=[order.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'pending')
+
+
+def in_process(name):
+    """Run as a server process with its own local memory cache, sharing the 'shared' cache with the others"""
+    return override_settings(CACHES={
+        **TEST_CACHES, 'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name},
+    })
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TokenRevocationTests(TestCase):
+    """A revoked token is rejected by every process, not only the one that revoked it"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user('sara', email='sara@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def profile_status(self, process):
+        with in_process(process):
+            return self.client.get('/api/users/profile/').status_code
+
+    def test_logout(self):
+        self.assertEqual(self.profile_status('worker-a'), 200)
+        with in_process('worker-b'):
+            self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+        self.assertEqual(self.profile_status('worker-a'), 403)
+
+    def test_deactivation(self):
+        self.assertEqual(self.profile_status('worker-a'), 200)
+        with in_process('worker-b'):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.profile_status('worker-a'), 403)
+
+    def test_rotation(self):
+        self.assertEqual(self.profile_status('worker-a'), 200)
+        with in_process('worker-b'):
+            self.token.delete()
+            Token.objects.create(user=self.user)
+        self.assertEqual(self.profile_status('worker-a'), 403)
+
+    def test_entry_is_dropped_again_after_commit(self):
+        cache_key = token_cache_key(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request still reads the committed, active user and caches it
+            token_cache().set(cache_key, self.user)
+        self.assertIsNone(token_cache().get(cache_key))
+
+
+@override_settings(CACHES=TEST_CACHES, REPLICA_DATABASES=['replica'])
+class ReplicaPinTests(TestCase):
+    """A user who wrote reads from the primary on every process for REPLICA_PIN_SECONDS"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.request = RequestFactory().get('/api/stones/')
+        self.request.user = User.objects.create_user('sara')
+
+    def reads_from(self):
+        state = RoutingState()
+        token = routing._state.set(state)
+        try:
+            with mock.patch.object(routing, 'choose_replica', return_value='replica'):
+                read_from_replica(self.request, self.request.user)
+        finally:
+            routing._state.reset(token)
+        return state.replica or 'default'
+
+    def test_pin_reaches_other_processes(self):
+        with in_process('worker-a'):
+            self.assertEqual(self.reads_from(), 'replica')
+        with in_process('worker-b'):
+            pin_to_primary(self.request, HttpResponse())
+        with in_process('worker-a'):
+            self.assertEqual(self.reads_from(), 'default')
+
+
+@override_settings(NPLUSONE_MODE='raise', NPLUSONE_THRESHOLD=3)
+class NPlusOneDetectionTests(TestCase):
+    """Only a query repeated with different values is an N+1"""
+    sql = 'SELECT "store_stone"."id" FROM "store_stone" WHERE "store_stone"."id" = %s'
+
+    def setUp(self):
+        self.queries = RequestQueries(RequestFactory().get('/api/cart/'))
+
+    def test_same_values_are_not_reported(self):
+        for _ in range(10):
+            self.queries.record(self.sql, (1,))
+        self.assertEqual(self.queries.repeated, {})
+
+    def test_different_values_are_reported(self):
+        self.queries.record(self.sql, (1,))
+        self.queries.record(self.sql, (1,))
+        self.queries.record(self.sql, (2,))
+        with self.assertRaisesMessage(NPlusOneError, '4 runs with 3 different values'):
+            self.queries.record(self.sql, (3,))
+
+
+@override_settings(NOTIFICATION_STAFF_EMAILS=['staff@example.com'], NOTIFICATION_MAX_ATTEMPTS=3, NOTIFICATION_RETRY_DELAY=0)
+class NotificationTests(TestCase):
+    """Events go to the outbox with the change they report and are sent, retried and measured from there"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sara', email='sara@example.com')
+        cls.stone = create_stones(1, create_category())[0]
+
+    def failing_smtp(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = SMTPException('Mailbox unavailable')
+        return mock.patch('store.notifications.get_connection', return_value=connection)
+
+    def test_paid_order_is_queued_and_sent(self):
+        order = create_order(self.user, [self.stone])
+        order.mark_paid()
+        self.assertEqual(list(Notification.objects.values_list('event', 'recipient')), [('order_paid', 'sara@example.com')])
+        self.assertEqual(send_batch(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['sara@example.com'])
+        self.assertIn(order.order_number, mail.outbox[0].body)
+        self.assertEqual(Notification.objects.get().status, 'sent')
+        self.assertEqual(send_batch(), (0, 0))
+
+    def test_rolled_back_payment_queues_nothing(self):
+        order = create_order(self.user, [self.stone])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            order.mark_paid()
+            raise RuntimeError
+        self.assertFalse(Notification.objects.exists())
+
+    def test_quote_notifies_staff(self):
+        response = self.client.post('/api/quotes/submit_quote/', {
+            'name': 'Sara', 'email': 'sara@example.com', 'project_type': 'Hotel', 'project_location': 'Tehran',
+            'timeline': '3 months', 'items': [{'stone_id': self.stone.pk, 'quantity': 20}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(list(Notification.objects.values_list('event', 'recipient')), [('quote_submitted', 'staff@example.com')])
+
+    def test_enqueue_skips_duplicates(self):
+        enqueue('order_paid', [(1, 'sara@example.com'), (1, 'sara@example.com')])
+        enqueue('order_paid', [(1, 'sara@example.com'), (2, 'sara@example.com')])
+        self.assertEqual(sorted(Notification.objects.values_list('object_id', flat=True)), [1, 2])
+
+    def test_failed_send_is_retried_then_given_up(self):
+        create_order(self.user, [self.stone]).mark_paid()
+        with self.failing_smtp():
+            for attempt in range(1, 4):
+                self.assertEqual(send_batch(), (0, 1))
+                notification = Notification.objects.get()
+                self.assertEqual(notification.attempts, attempt)
+                self.assertEqual(notification.last_error, 'Mailbox unavailable')
+                self.assertEqual(notification.status, 'failed' if attempt == 3 else 'queued')
+        self.assertEqual(send_batch(), (0, 0))
+
+    def test_retry_succeeds(self):
+        create_order(self.user, [self.stone]).mark_paid()
+        with self.failing_smtp():
+            send_batch()
+        self.assertEqual(send_batch(), (1, 0))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts, notification.last_error), ('sent', 2, ''))
+
+    def test_stuck_claims_are_queued_again(self):
+        enqueue('order_paid', [(create_order(self.user, [self.stone]).pk, 'sara@example.com')])
+        self.assertEqual(len(claim_batch(10)), 1)
+        self.assertEqual(claim_batch(10), [])
+        Notification.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_batch(10)), 1)
+
+    def test_queue_stats(self):
+        now = timezone.now()
+        enqueue('order_paid', [(n, 'sara@example.com') for n in range(21)])
+        notifications = list(Notification.objects.order_by('object_id'))
+        for n, notification in enumerate(notifications[:20]):
+            # Sent 1 to 20 seconds after they were queued
+            notification.status, notification.sent_at = 'sent', notification.created_at + timedelta(seconds=n + 1)
+        Notification.objects.bulk_update(notifications[:20], ['status', 'sent_at'])
+        Notification.objects.filter(pk=notifications[20].pk).update(created_at=now - timedelta(minutes=5))
+        stats = queue_stats()
+        self.assertEqual((stats['queued'], stats['sent']), (1, 20))
+        self.assertEqual(stats['latency_avg'], 10.5)
+        self.assertEqual(stats['latency_p95'], 20.0)
+        self.assertGreaterEqual(stats['oldest_queued_age'], 300)
+
+
+@override_settings(CACHES=TEST_CACHES, STOCK_RESERVATION_TIMEOUT=30 * 60)
+class StockReservationTests(TestCase):
+    """Checkout reserves stock, payment keeps it, and cancellation, expiry or a failed gateway hand it back"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sara', email='sara@example.com')
+        cls.stone = create_stones(1, create_category())[0]
+
+    def setUp(self):
+        self.stock = StoneStock.objects.create(stone=self.stone, available=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, stone=self.stone, quantity=quantity)
+        return self.client.post('/api/cart/checkout/', {'shipping': {
+            'address': 'No. 12, Valiasr Street', 'city': 'Tehran', 'postal_code': '1234567890', 'phone': '09120000000',
+        }}, format='json')
+
+    def available(self):
+        self.stock.refresh_from_db()
+        return self.stock.available
+
+    def reserved_order(self, quantity=2):
+        order = create_order(self.user, [self.stone])
+        OrderItem.objects.filter(order=order).update(quantity=quantity)
+        reserve_stock(order, list(order.items.all()))
+        return order
+
+    def test_checkout_reserves_stock(self):
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.available(), 1)
+        reservation = StockReservation.objects.get()
+        self.assertEqual((reservation.order_id, reservation.quantity, reservation.status),
+                         (response.data['order']['id'], 2, 'held'))
+
+    def test_oversell_is_rejected(self):
+        response = self.checkout(4)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.available(), 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_lines_of_one_variant_are_reserved_together(self):
+        order = create_order(self.user, [self.stone, self.stone])
+        with self.assertRaises(OutOfStock), transaction.atomic():
+            reserve_stock(order, list(order.items.all()))
+        self.assertEqual(self.available(), 3)
+
+    def test_variant_row_is_preferred(self):
+        polished = StoneStock.objects.create(stone=self.stone, selected_finish='Polished', available=5)
+        order = create_order(self.user, [self.stone])
+        OrderItem.objects.filter(order=order).update(selected_finish='Polished')
+        reserve_stock(order, list(order.items.all()))
+        polished.refresh_from_db()
+        self.assertEqual((polished.available, self.available()), (3, 3))
+
+    def test_orders_cannot_be_deleted_through_the_api(self):
+        order = self.reserved_order()
+        response = self.client.delete(reverse('order-detail', args=[order.pk]))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.available(), 1)
+        self.assertTrue(StockReservation.objects.filter(order=order, status='held').exists())
+
+    def test_gateway_failure_releases_stock(self):
+        failure = {'success': False, 'error': 'Gateway unavailable'}
+        with mock.patch.object(ZarinPalPayment, 'create_payment_request', return_value=failure):
+            response = self.checkout(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.available(), 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        expired, current = self.reserved_order(1), self.reserved_order(1)
+        StockReservation.objects.filter(order=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 1)
+        expired.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual((expired.status, expired.payment_status), ('cancelled', 'expired'))
+        self.assertEqual(current.status, 'pending')
+        self.assertEqual(StockReservation.objects.get(order=expired).status, 'released')
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_paid_reservations_are_kept(self):
+        order = self.reserved_order()
+        order.mark_paid()
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.available(), 1)
+
+    def test_cancelling_a_paid_order_returns_stock(self):
+        order = self.reserved_order()
+        order.mark_paid()
+        transition_orders(Order.objects.filter(pk=order.pk), 'cancelled')
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+        self.assertEqual(self.available(), 3)
+
+    def test_release_is_idempotent(self):
+        order = self.reserved_order()
+        self.assertEqual(release_reservations(order.stock_reservations.all()), 1)
+        self.assertEqual(release_reservations(order.stock_reservations.all()), 0)
+        self.assertEqual(self.available(), 3)
+
+
+class SalesRollupTests(TestCase):
+    """The incrementally maintained rollups always equal a fresh aggregate of the orders that count as sales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sara', email='sara@example.com')
+        cls.stones = create_stones(2, create_category()) + create_stones(1, create_category())
+
+    def create_orders(self):
+        orders = []
+        for n, (city, payment_type) in enumerate(itertools.product(['Tehran', 'Isfahan'], ['zarinpal', 'mellat'])):
+            order = create_order(self.user, self.stones[n % 3:])
+            Order.objects.filter(pk=order.pk).update(shipping_city=city, payment_type=payment_type)
+            order.refresh_from_db()
+            orders.append(order)
+        return orders
+
+    def rollups(self):
+        """Rollup rows by report, leaving out buckets every order has left"""
+        return {
+            name: sorted(
+                (row['date'], row[key], row['order_count'], row['quantity'], row['revenue'])
+                for row in model.objects.exclude(order_count=0).values()
+            )
+            for name, (model, key) in ROLLUPS.items()
+        }
+
+    def assertRollupsMatchOrders(self):
+        expected = {
+            name: sorted(
+                (row['date'], row[ROLLUPS[name][1]], row['order_count'], row['quantity'], row['revenue'])
+                for row in rows
+            )
+            for name, rows in aggregate_sales(Order.objects.filter(status__in=REVENUE_STATUSES)).items()
+        }
+        self.assertEqual(self.rollups(), expected)
+
+    def test_transitions(self):
+        orders = self.create_orders()
+        for order in orders:
+            order.mark_paid()
+        self.assertRollupsMatchOrders()
+
+        # Fulfilment moves between sales statuses and changes nothing
+        before = self.rollups()
+        transition_orders(Order.objects.filter(pk__in=[orders[0].pk, orders[1].pk]), 'processing')
+        transition_orders(Order.objects.filter(pk=orders[0].pk), 'shipped')
+        self.assertEqual(self.rollups(), before)
+
+        # Refunds: cancelling paid and processing orders takes them out again
+        transition_orders(Order.objects.filter(pk__in=[orders[1].pk, orders[2].pk]), 'cancelled')
+        self.assertRollupsMatchOrders()
+
+    def test_unpaid_cancellation_is_not_counted(self):
+        orders = self.create_orders()
+        orders[0].mark_paid()
+        orders[1].mark_cancelled('failed')
+        self.assertRollupsMatchOrders()
+
+    def test_duplicate_payment_is_counted_once(self):
+        order = self.create_orders()[0]
+        stale = Order.objects.get(pk=order.pk)
+        order.mark_paid()
+        stale.mark_paid()
+        self.assertRollupsMatchOrders()
+
+    def test_admin_cannot_delete_rollups(self):
+        self.create_orders()[0].mark_paid()
+        row = DailyStoneSales.objects.first()
+        self.client.force_login(User.objects.create_superuser('admin', email='admin@example.com'))
+        response = self.client.post(reverse('admin:store_dailystonesales_delete', args=[row.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse('admin:store_dailystonesales_changelist'), {
+            'action': 'delete_selected', '_selected_action': [row.pk], 'post': 'yes',
+        })
+        self.assertTrue(DailyStoneSales.objects.filter(pk=row.pk).exists())
+
+    def test_rebuild(self):
+        orders = self.create_orders()
+        for order in orders:
+            order.mark_paid()
+        transition_orders(Order.objects.filter(pk__in=[orders[0].pk, orders[3].pk]), 'cancelled')
+        before = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), before)
+
+
+class MockGatewayRandomnessTests(TestCase):
+    """Seeded gateway runs draw one private stream per connection"""
+
+    def draws(self, config, connections=3):
+        return [[rng.random() for _ in range(5)] for rng in (config.derive_rng() for _ in range(connections))]
+
+    def test_same_seed_repeats_every_stream(self):
+        self.assertEqual(self.draws(GatewayConfig(seed=7)), self.draws(GatewayConfig(seed=7)))
+
+    def test_streams_are_independent(self):
+        streams = self.draws(GatewayConfig(seed=7))
+        self.assertEqual(len({tuple(stream) for stream in streams}), len(streams))
+        self.assertNotEqual(streams, self.draws(GatewayConfig(seed=8)))
+
+
+class MockGatewayConnectionTests(TestCase):
+    """Every reply leaves a kept-alive connection ready for the next request"""
+
+    def serve(self, **config):
+        server = MockGatewayServer(('127.0.0.1', 0), GatewayConfig(seed=1, **config))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        connection = HTTPConnection(*server.server_address[:2], timeout=5)
+        self.addCleanup(connection.close)
+        return connection
+
+    def post_twice(self, connection, path):
+        body = json.dumps({'merchant_id': 'test', 'callback_url': 'http://testserver/cb', 'amount': 1000})
+        statuses = []
+        for _ in range(2):
+            connection.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            statuses.append(response.status)
+        return statuses
+
+    def test_injected_errors(self):
+        self.assertEqual(self.post_twice(self.serve(error_rate=1.0), REQUEST_PATH), [200, 200])
+        self.assertEqual(self.post_twice(self.serve(server_error_rate=1.0), REQUEST_PATH), [503, 503])
+
+    def test_unknown_path(self):
+        self.assertEqual(self.post_twice(self.serve(), '/unknown/'), [404, 404])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QuoteRepricingTests(TestCase):
+    """Price and rule changes mark open quotes stale; the batch job re-prices them"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        clear_rules()
+        self.addCleanup(clear_rules)
+        user = User.objects.create_user(username='buyer', password='secret123')
+        self.stones = create_stones(2, create_category())
+        self.first = create_quote(user, self.stones[:1])
+        self.second = create_quote(user, self.stones[1:])
+        self.closed = create_quote(user, self.stones[:1])
+        self.closed.status = 'completed'
+        self.closed.save()
+        estimate_quotes(Quote.objects.all())
+
+    def stale(self):
+        return set(Quote.objects.filter(estimated_at__isnull=True).values_list('pk', flat=True))
+
+    def test_price_change_marks_open_quotes_without_reading_the_stone(self):
+        stone = Stone.objects.get(pk=self.stones[0].pk)
+        stone.price = Decimal('100.00')
+        with CaptureQueriesContext(connection) as queries:
+            stone.save()
+        self.assertFalse([q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')])
+        self.assertEqual(self.stale(), {self.first.pk})
+        # Nothing is re-priced in the saving request
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.estimated_total, Decimal('1710.00'))
+
+    def test_other_changes_leave_quotes_current(self):
+        stone = Stone.objects.get(pk=self.stones[0].pk)
+        stone.name_en = 'Renamed'
+        stone.save()
+        stone.price = Decimal('100.00')
+        stone.save(update_fields=['name_en'])
+        self.assertEqual(self.stale(), set())
+
+    def test_rule_change_marks_every_open_quote(self):
+        VolumeTier.objects.create(min_quantity=10, discount_percent=Decimal('10'))
+        self.assertEqual(self.stale(), {self.first.pk, self.second.pk})
+
+    def test_reprice_stale_quotes(self):
+        Stone.objects.filter(pk=self.stones[0].pk).update(price=Decimal('100.00'))
+        VolumeTier.objects.create(min_quantity=10, discount_percent=Decimal('10'))
+        self.assertEqual(reprice_stale_quotes(), 2)
+        self.assertEqual(self.stale(), set())
+
+        totals = dict(Quote.objects.values_list('pk', 'estimated_total'))
+        self.assertEqual(totals[self.first.pk], Decimal('1800.00'))
+        self.assertEqual(totals[self.second.pk], Decimal('1539.00'))
+        # Closed quotes keep the estimate they had
+        self.assertEqual(totals[self.closed.pk], Decimal('1710.00'))
+        self.assertEqual(
+            list(QuoteItem.objects.filter(quote=self.second).values_list('estimated_unit_price', 'estimated_total')),
+            [(Decimal('76.95'), Decimal('1539.00'))]
+        )
+        self.assertEqual(reprice_stale_quotes(), 0)
+
+    def test_stale_pass_reads_current_rules(self):
+        get_rules()
+        # A rule saved by another process: this process's cached rules are not cleared
+        VolumeTier.objects.bulk_create([VolumeTier(min_quantity=10, discount_percent=Decimal('10'))])
+        Quote.objects.filter(pk=self.first.pk).update(estimated_at=None)
+        call_command('estimate_quotes', '--stale', stdout=StringIO())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.estimated_total, Decimal('1539.00'))
+
+    def test_rule_change_reaches_other_processes(self):
+        rules = get_rules()
+        # Saved by another process: only the version bumped on its commit tells this one
+        VolumeTier.objects.bulk_create([VolumeTier(min_quantity=10, discount_percent=Decimal('10'))])
+        self.assertIs(get_rules(), rules)
+        publish_rule_change()
+        self.assertEqual(get_rules().discount(None, 20), Decimal('10'))
+
+    def test_quotes_priced_before_the_commit_are_marked_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            VolumeTier.objects.create(min_quantity=10, discount_percent=Decimal('10'))
+            # Another process re-prices or submits with the rules it still holds
+            estimate_quotes(Quote.objects.filter(pk=self.first.pk), rules=PricingRules({}, {}))
+            self.assertNotIn(self.first.pk, self.stale())
+        self.assertEqual(self.stale(), {self.first.pk, self.second.pk})
+
+    def test_discount_is_a_percentage(self):
+        for percent in ('-1', '100.01'):
+            with self.assertRaises(ValidationError):
+                VolumeTier(min_quantity=10, discount_percent=Decimal(percent)).full_clean()
@@ -1,20 +1,33 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register(r'categories', views.CategoryViewSet)
 router.register(r'stones', views.StoneViewSet)
 router.register(r'projects', views.ProjectViewSet)
 router.register(r'cart', views.CartViewSet, basename='cart')
-router.register(r'quotes', views.QuoteViewSet)
+router.register(r'quotes', views.QuoteViewSet, basename='quote')
 router.register(r'users', views.UserViewSet, basename='user')
 router.register(r'orders', views.OrderViewSet, basename='order')
 router.register(r'register', views.UserRegistrationViewSet, basename='register')
 router.register(r'payment', views.PaymentCallbackView, basename='payment')
+router.register(r'reports/sales', views.SalesReportViewSet, basename='sales-report')
+router.register(r'exports', views.ExportViewSet, basename='export')
+router.register(r'notifications/stats', views.NotificationStatsViewSet, basename='notification-stats')
+router.register(r'metrics/timings', views.TimingStatsViewSet, basename='timing-stats')
+router.register(r'metrics/slow-queries', views.SlowQueryViewSet, basename='slow-query')
 
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/auth/login/', views.CustomAuthToken.as_view(), name='login'),
+    path('api/auth/logout/', views.LogoutView.as_view(), name='logout'),
+    path('api/payment/async-callback/', async_views.AsyncPaymentCallbackView.as_view(), name='payment-async-callback'),
+    path('api/async/categories/', async_views.AsyncCategoryView.as_view(), name='async-category-list'),
+    path('api/async/categories/<int:pk>/', async_views.AsyncCategoryView.as_view(), name='async-category-detail'),
+    path('api/async/stones/', async_views.AsyncStoneView.as_view(), name='async-stone-list'),
+    path('api/async/stones/<int:pk>/', async_views.AsyncStoneView.as_view(), name='async-stone-detail'),
+    path('api/async/projects/', async_views.AsyncProjectView.as_view(), name='async-project-list'),
+    path('api/async/projects/<int:pk>/', async_views.AsyncProjectView.as_view(), name='async-project-detail'),
     path('payment/mock/', views.MockPaymentView.as_view(), name='mock_payment'),
 ]
@@ -1,17 +1,20 @@
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from django.db.models import Q
+from django.db.models import Count, Prefetch, Q, Sum, prefetch_related_objects
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views import View
 from decimal import Decimal
 from .models import (
@@ -20,22 +23,38 @@ from .models import (
 )
 from .serializers import (
     CategorySerializer, StoneSerializer, ProjectSerializer, 
-    CartSerializer, CartItemSerializer, QuoteSerializer, QuoteItemSerializer,
-    UserSerializer, OrderSerializer, OrderItemSerializer, UserRegistrationSerializer
+    CartSerializer, CartItemSerializer, QuoteSerializer, QuoteItemSerializer, QuoteSummarySerializer,
+    UserSerializer, OrderSerializer, OrderItemSerializer, OrderSummarySerializer,
+    UserRegistrationSerializer
 )
 from .payment import ZarinPalPayment
+from .order_states import InvalidTransition, transition_orders
+from .reporting import ROLLUPS, sales_report
+from .exports import DATASETS, FORMATS, stream_export
+from .inventory import OutOfStock, release_reservations, reserve_stock
+from .pricing import OPEN_STATUSES, estimate_items
+from .notifications import notify_quote_submitted, queue_stats
+from .routing import ReplicaReadMixin
+from .caching import CatalogCacheMixin, cache_response
+from .instrumentation import InstrumentedViewMixin, timing_stats
+from .querylog import clear_slow_queries, slow_query_stats
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(InstrumentedViewMixin, ReplicaReadMixin, CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    cache_models = [Category]
+    cache_timeouts = {'list': 10 * 60, 'retrieve': 10 * 60}
 
 
-class StoneViewSet(viewsets.ReadOnlyModelViewSet):
+class StoneViewSet(InstrumentedViewMixin, ReplicaReadMixin, CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Stone.objects.filter(is_active=True).select_related('category').prefetch_related('images', 'videos')
     serializer_class = StoneSerializer
     permission_classes = [AllowAny]
+    cache_models = [Stone, Category, StoneImage, StoneVideo]
+    # Search and filter combinations are many and rarely repeated, so lists live shorter
+    cache_timeouts = {'list': 2 * 60, 'retrieve': 5 * 60, 'featured': 5 * 60, 'by_category': 5 * 60}
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'origin']
     search_fields = ['name_en', 'name_fa', 'description_en', 'description_fa']
@@ -43,6 +62,7 @@ class StoneViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['name_en']
     
     @action(detail=False, methods=['get'])
+    @cache_response
     def featured(self, request):
         """Get featured stones (you can customize this logic)"""
         featured_stones = self.queryset[:6]  # Get first 6 stones as featured
@@ -50,13 +70,17 @@ class StoneViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @cache_response
     def by_category(self, request):
         """Get stones grouped by category"""
-        categories = Category.objects.prefetch_related('stones').all()
+        # Active stones of every category, with their media, in three queries
+        categories = Category.objects.prefetch_related(
+            Prefetch('stones', queryset=Stone.objects.filter(is_active=True).prefetch_related('images', 'videos'))
+        )
         result = {}
         for category in categories:
-            stones = category.stones.filter(is_active=True)
-            if stones.exists():
+            stones = category.stones.all()
+            if stones:
                 result[category.slug] = {
                     'category': CategorySerializer(category).data,
                     'stones': StoneSerializer(stones, many=True).data
@@ -64,10 +88,17 @@ class StoneViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(result)
 
 
-class ProjectViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Project.objects.filter(is_active=True).prefetch_related('images', 'videos', 'project_stones__stone')
+class ProjectViewSet(InstrumentedViewMixin, ReplicaReadMixin, CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    # Project stones are serialized with the full stone, category and media
+    queryset = Project.objects.filter(is_active=True).prefetch_related(
+        'images', 'videos',
+        Prefetch('project_stones', ProjectStone.objects.select_related('stone__category')),
+        'project_stones__stone__images', 'project_stones__stone__videos',
+    )
     serializer_class = ProjectSerializer
     permission_classes = [AllowAny]
+    cache_models = [Project, ProjectImage, ProjectVideo, ProjectStone, Stone, Category, StoneImage, StoneVideo]
+    cache_timeouts = {'list': 5 * 60, 'retrieve': 10 * 60, 'featured': 10 * 60}
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category_en', 'year']
     search_fields = ['title_en', 'title_fa', 'description_en', 'description_fa', 'location_en', 'location_fa']
@@ -75,6 +106,7 @@ class ProjectViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['-created_at']
     
     @action(detail=False, methods=['get'])
+    @cache_response
     def featured(self, request):
         """Get featured projects"""
         featured_projects = self.queryset[:3]  # Get first 3 projects as featured
@@ -82,12 +114,24 @@ class ProjectViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class CartViewSet(viewsets.ModelViewSet):
+# Cart lines as CartSerializer shows them: each with its stone, category and media
+CART_ITEM_PREFETCHES = [
+    Prefetch('items', queryset=CartItem.objects.select_related('stone__category')),
+    'items__stone__images', 'items__stone__videos',
+]
+
+
+def prefetch_cart_items(carts):
+    """Load carts' lines with their stones, categories and media in three extra queries"""
+    return carts.prefetch_related(*CART_ITEM_PREFETCHES)
+
+
+class CartViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user, is_active=True)
+        return prefetch_cart_items(Cart.objects.filter(user=self.request.user, is_active=True))
     
     def get_or_create_cart(self):
         cart, created = Cart.objects.get_or_create(
@@ -99,6 +143,8 @@ class CartViewSet(viewsets.ModelViewSet):
     
     def list(self, request):
         cart = self.get_or_create_cart()
+        # Lines are serialized with their full stones; load them all at once
+        prefetch_related_objects([cart], *CART_ITEM_PREFETCHES)
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
@@ -192,9 +238,12 @@ class CartViewSet(viewsets.ModelViewSet):
             if not shipping_data.get(field):
                 return Response({'error': f'Missing required field: {field}'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # The response serializes the order's items with their full stones
+        items = list(cart.items.select_related('stone__category').prefetch_related('stone__images', 'stone__videos'))
+
         # Calculate total amount
         total_amount = Decimal('0')
-        for item in cart.items.all():
+        for item in items:
             if item.stone.price:
                 total_amount += item.stone.price * item.quantity
             else:
@@ -204,70 +253,107 @@ class CartViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Invalid total amount'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            with transaction.atomic():
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
-                    total_amount=total_amount,
-                    payment_type=payment_type,
-                    shipping_address=shipping_data['address'],
-                    shipping_city=shipping_data['city'],
-                    shipping_postal_code=shipping_data['postal_code'],
-                    shipping_phone=shipping_data['phone']
-                )
-                
-                # Create order items
-                for cart_item in cart.items.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        stone=cart_item.stone,
-                        quantity=cart_item.quantity,
-                        price=cart_item.stone.price,
-                        selected_finish=cart_item.selected_finish,
-                        selected_thickness=cart_item.selected_thickness,
-                        notes=cart_item.notes
+            # Keep the transaction short: stock rows stay locked only until the
+            # reservation is recorded, not while the gateway is being called
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        user=request.user,
+                        total_amount=total_amount,
+                        payment_type=payment_type,
+                        shipping_address=shipping_data['address'],
+                        shipping_city=shipping_data['city'],
+                        shipping_postal_code=shipping_data['postal_code'],
+                        shipping_phone=shipping_data['phone']
                     )
+                    order_items = OrderItem.objects.bulk_create([
+                        OrderItem(
+                            order=order,
+                            stone=cart_item.stone,
+                            quantity=cart_item.quantity,
+                            price=cart_item.stone.price,
+                            selected_finish=cart_item.selected_finish,
+                            selected_thickness=cart_item.selected_thickness,
+                            notes=cart_item.notes
+                        )
+                        for cart_item in items
+                    ])
+                    reserve_stock(order, items)
+            except OutOfStock as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+            
+            # Initiate payment with ZarinPal
+            payment = ZarinPalPayment()
+            payment_result = payment.create_payment_request(
+                amount=total_amount,
+                description=f"Order {order.order_number} - Stone Store Purchase",
+                order_id=order.id,
+                user_email=request.user.email,
+                user_phone=shipping_data['phone']
+            )
+            
+            if payment_result['success']:
+                # Update order with payment authority
+                order.payment_id = payment_result['authority']
+                order.save(update_fields=['payment_id', 'updated_at'])
                 
-                # Initiate payment with ZarinPal
-                payment = ZarinPalPayment()
-                payment_result = payment.create_payment_request(
-                    amount=total_amount,
-                    description=f"Order {order.order_number} - Stone Store Purchase",
-                    order_id=order.id,
-                    user_email=request.user.email,
-                    user_phone=shipping_data['phone']
-                )
-                
-                if payment_result['success']:
-                    # Update order with payment authority
-                    order.payment_id = payment_result['authority']
-                    order.save()
-                    
-                    return Response({
-                        'order': OrderSerializer(order).data,
-                        'payment_url': payment_result['payment_url'],
-                        'authority': payment_result['authority']
-                    })
-                else:
-                    # Payment request failed, delete order
-                    order.delete()
-                    return Response({'error': payment_result['error']}, status=status.HTTP_400_BAD_REQUEST)
+                # Serialize the items just written instead of querying them back
+                order._prefetched_objects_cache = {'items': order_items}
+                return Response({
+                    'order': OrderSerializer(order).data,
+                    'payment_url': payment_result['payment_url'],
+                    'authority': payment_result['authority']
+                })
+            
+            # Payment request failed: hand the stock back and drop the order
+            with transaction.atomic():
+                release_reservations(order.stock_reservations.all())
+                order.delete()
+            return Response({'error': payment_result['error']}, status=status.HTTP_400_BAD_REQUEST)
                     
         except Exception as e:
             return Response({'error': f'Checkout failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class QuoteViewSet(viewsets.ModelViewSet):
-    queryset = Quote.objects.all()
+def prefetch_quote_items(quotes):
+    """Load quotes' items with their stones and categories in one extra query"""
+    return quotes.prefetch_related(
+        Prefetch('items', queryset=QuoteItem.objects.select_related('stone__category').order_by('pk'))
+    )
+
+
+class QuoteViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     serializer_class = QuoteSerializer
     permission_classes = [AllowAny]  # Allow anonymous quotes
     
-    def perform_create(self, serializer):
-        # If user is authenticated, associate with user
-        if self.request.user.is_authenticated:
-            serializer.save(user=self.request.user)
+    def get_queryset(self):
+        # Anyone may submit a quote, but only staff see all of them
+        user = self.request.user
+        if user.is_staff:
+            quotes = Quote.objects.all()
+        elif user.is_authenticated:
+            quotes = Quote.objects.filter(user=user)
         else:
-            serializer.save()
+            quotes = Quote.objects.none()
+        quotes = prefetch_quote_items(quotes.order_by('-created_at'))
+        if self.action != 'list':
+            # The full representation also shows each stone's media
+            quotes = quotes.prefetch_related('items__stone__images', 'items__stone__videos')
+        return quotes
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return QuoteSummarySerializer
+        return QuoteSerializer
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            # If user is authenticated, associate with user
+            if self.request.user.is_authenticated:
+                quote = serializer.save(user=self.request.user)
+            else:
+                quote = serializer.save()
+            notify_quote_submitted(quote)
     
     @action(detail=False, methods=['post'])
     def submit_quote(self, request):
@@ -276,27 +362,72 @@ class QuoteViewSet(viewsets.ModelViewSet):
         items_data = quote_data.pop('items', [])
         
         quote_serializer = self.get_serializer(data=quote_data)
-        if quote_serializer.is_valid():
+        items_serializer = QuoteItemSerializer(data=items_data, many=True)
+        quote_valid = quote_serializer.is_valid()
+        if not items_serializer.is_valid():
+            return Response({**quote_serializer.errors, 'items': items_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        if not quote_valid:
+            return Response(quote_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Validate every stone id with one query; the stones are loaded with
+        # everything the response needs
+        items = items_serializer.validated_data
+        stones = Stone.objects.select_related('category').prefetch_related('images', 'videos').in_bulk(
+            {item['stone_id'] for item in items}
+        )
+        missing = sorted({item['stone_id'] for item in items} - stones.keys())
+        if missing:
+            return Response(
+                {'items': [f'Stone not found: {stone_id}' for stone_id in missing]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        quote_items = [
+            QuoteItem(
+                stone=stones[item['stone_id']],
+                quantity=item['quantity'],
+                selected_finish=item.get('selected_finish', ''),
+                selected_thickness=item.get('selected_thickness', ''),
+                notes=item.get('notes', '')
+            )
+            for item in items
+        ]
+        estimate = {'estimated_total': estimate_items(quote_items), 'estimated_at': timezone.now()}
+        
+        with transaction.atomic():
             # Associate with user if authenticated
             if request.user.is_authenticated:
-                quote = quote_serializer.save(user=request.user)
+                quote = quote_serializer.save(user=request.user, **estimate)
             else:
-                quote = quote_serializer.save()
-            
-            # Create quote items
-            for item_data in items_data:
-                QuoteItem.objects.create(
-                    quote=quote,
-                    stone_id=item_data['stone_id'],
-                    quantity=item_data['quantity'],
-                    notes=item_data.get('notes', '')
-                )
+                quote = quote_serializer.save(**estimate)
             
-            return Response(quote_serializer.data, status=status.HTTP_201_CREATED)
-        return Response(quote_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            for quote_item in quote_items:
+                quote_item.quote = quote
+            quote_items = QuoteItem.objects.bulk_create(quote_items)
+            notify_quote_submitted(quote)
+        
+        # Serialize the items just written instead of querying them back
+        quote._prefetched_objects_cache = {'items': quote_items}
+        return Response(quote_serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def pipeline(self, request):
+        """Estimated value of open quotes per status, read from the stored estimates (staff only)"""
+        rows = list(
+            Quote.objects.filter(status__in=OPEN_STATUSES).values('status').annotate(
+                quote_count=Count('id'),
+                unpriced_count=Count('id', filter=Q(estimated_total__isnull=True)),
+                stale_count=Count('id', filter=Q(estimated_at__isnull=True)),
+                estimated_value=Sum('estimated_total'),
+            ).order_by('status')
+        )
+        return Response({
+            'results': rows,
+            'estimated_value': sum((row['estimated_value'] or 0 for row in rows), Decimal('0.00')),
+        })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -319,13 +450,14 @@ class UserViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def quotes(self, request):
-        """Get current user's quotes"""
-        quotes = Quote.objects.filter(user=request.user).order_by('-created_at')
-        serializer = QuoteSerializer(quotes, many=True)
-        return Response(serializer.data)
+        """Get current user's quotes, paginated"""
+        quotes = prefetch_quote_items(Quote.objects.filter(user=request.user).order_by('-created_at'))
+        page = self.paginate_queryset(quotes)
+        serializer = QuoteSummarySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class UserRegistrationViewSet(viewsets.ModelViewSet):
+class UserRegistrationViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
@@ -335,7 +467,7 @@ class UserRegistrationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            token, created = Token.objects.get_or_create(user=user)
+            token = Token.objects.create(user=user)
             return Response({
                 'user': UserSerializer(user).data,
                 'token': token.key,
@@ -344,7 +476,7 @@ class UserRegistrationViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CustomAuthToken(ObtainAuthToken):
+class CustomAuthToken(InstrumentedViewMixin, ObtainAuthToken):
     """Custom login view that returns user data along with token"""
     
     def post(self, request, *args, **kwargs):
@@ -361,23 +493,43 @@ class CustomAuthToken(ObtainAuthToken):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class LogoutView(InstrumentedViewMixin, APIView):
+    """Delete the caller's API token, which also drops it from the auth cache"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response({'message': 'Logout successful'})
+
+
+class OrderViewSet(InstrumentedViewMixin, viewsets.ReadOnlyModelViewSet):
+    """A user's orders, read-only: checkout creates them and store.order_states moves them"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Order.objects.filter(user=self.request.user).order_by('-created_at')
+        if self.action == 'list':
+            # Order history: one paginated query, items are only counted
+            return queryset.annotate(item_count=Count('items'))
+        return queryset.select_related('user__profile').prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related('stone__category').prefetch_related(
+                    'stone__images', 'stone__videos'
+                )
+            )
+        )
     
-    def list(self, request):
-        """Get user's order history"""
-        orders = self.get_queryset()
-        serializer = self.get_serializer(orders, many=True)
-        return Response(serializer.data)
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return OrderSummarySerializer
+        return OrderSerializer
     
     def retrieve(self, request, pk=None):
         """Get specific order details"""
         try:
-            order = Order.objects.get(pk=pk, user=request.user)
+            order = self.get_queryset().get(pk=pk)
             serializer = self.get_serializer(order)
             return Response(serializer.data)
         except Order.DoesNotExist:
@@ -385,9 +537,131 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'success': False,
                 'message': 'سفارش یافت نشد'
             })
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_transition(self, request):
+        """Move many orders to a new status at once (staff only)"""
+        target = request.data.get('status')
+        order_ids = request.data.get('order_ids')
+        current_status = request.data.get('current_status')
+        
+        if not order_ids and not current_status:
+            return Response({'error': 'Provide order_ids or current_status'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        orders = Order.objects.all()
+        if order_ids:
+            orders = orders.filter(id__in=order_ids)
+        if current_status:
+            orders = orders.filter(status=current_status)
+        
+        try:
+            updated = transition_orders(orders, target)
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': target, 'updated': updated})
+
+
+class SalesReportViewSet(InstrumentedViewMixin, viewsets.ViewSet):
+    """Sales totals for staff dashboards, served from the daily rollup tables"""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        group = request.query_params.get('group', 'stone')
+        if group not in ROLLUPS:
+            return Response(
+                {'error': f'group must be one of: {", ".join(ROLLUPS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            since = parse_date(request.query_params.get('since') or '')
+            until = parse_date(request.query_params.get('until') or '')
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'group': group,
+            'since': since,
+            'until': until,
+            'results': list(sales_report(group, since=since, until=until))
+        })
 
 
-class PaymentCallbackView(viewsets.ViewSet):
+class NotificationStatsViewSet(InstrumentedViewMixin, viewsets.ViewSet):
+    """Notification queue depth and delivery latency (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        return Response(queue_stats())
+
+
+class TimingStatsViewSet(InstrumentedViewMixin, viewsets.ViewSet):
+    """Per-endpoint latency histograms of the process serving the request (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        return Response(timing_stats())
+
+
+class SlowQueryViewSet(InstrumentedViewMixin, viewsets.ViewSet):
+    """Slow queries of the process serving the request, by fingerprint and most recent (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(slow_query_stats(limit=limit))
+    
+    @action(detail=False, methods=['post'])
+    def clear(self, request):
+        clear_slow_queries()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ExportViewSet(InstrumentedViewMixin, viewsets.ViewSet):
+    """Streaming CSV/JSONL exports for finance and sales (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        return Response({'datasets': list(DATASETS), 'outputs': list(FORMATS)})
+    
+    def retrieve(self, request, pk=None):
+        if pk not in DATASETS:
+            return Response({'error': 'Unknown dataset'}, status=status.HTTP_404_NOT_FOUND)
+        output = request.query_params.get('output', 'csv')
+        if output not in FORMATS:
+            return Response({'error': f'output must be one of: {", ".join(FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = parse_date(request.query_params.get('since') or '')
+            until = parse_date(request.query_params.get('until') or '')
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(
+            stream_export(pk, output, since=since, until=until, status=request.query_params.get('status')),
+            content_type=FORMATS[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{pk}.{output}"'
+        return response
+
+
+def processed_payment_result(request, order):
+    """Result page for a callback on an order that is no longer pending"""
+    if order.status == 'cancelled':
+        return render(request, 'payment/payment_result.html', {
+            'success': False,
+            'message': f'سفارش قبلاً {order.status} شده است',
+            'order_number': order.order_number
+        })
+    return render(request, 'payment/payment_result.html', {
+        'success': True,
+        'message': 'پرداخت قبلاً با موفقیت انجام شده است',
+        'order_number': order.order_number
+    })
+
+
+class PaymentCallbackView(InstrumentedViewMixin, viewsets.ViewSet):
     """Handle ZarinPal payment callbacks"""
     permission_classes = [AllowAny]
     
@@ -405,18 +679,8 @@ class PaymentCallbackView(viewsets.ViewSet):
             order = Order.objects.get(payment_id=authority)
             
             # Check if order is already processed
-            if order.status == 'paid':
-                return render(request, 'payment/payment_result.html', {
-                    'success': True,
-                    'message': 'پرداخت قبلاً با موفقیت انجام شده است',
-                    'order_number': order.order_number
-                })
-            elif order.status in ['cancelled', 'failed']:
-                return render(request, 'payment/payment_result.html', {
-                    'success': False,
-                    'message': f'سفارش قبلاً {order.status} شده است',
-                    'order_number': order.order_number
-                })
+            if order.status != 'pending':
+                return processed_payment_result(request, order)
             
             if status_param == 'OK':
                 # Payment was successful, verify with ZarinPal
@@ -424,19 +688,11 @@ class PaymentCallbackView(viewsets.ViewSet):
                 verification_result = payment.verify_payment(authority, order.total_amount)
                 
                 if verification_result['success']:
-                    # Payment verified successfully
-                    with transaction.atomic():
-                        order.status = 'paid'
-                        order.payment_status = 'completed'
-                        order.payment_date = timezone.now()
-                        order.save()
-                        
-                        # Clear the user's cart
-                        cart = Cart.objects.filter(user=order.user, is_active=True).first()
-                        if cart:
-                            cart.items.all().delete()
-                            cart.is_active = False
-                            cart.save()
+                    # Payment verified successfully, this also clears the user's cart. A duplicate
+                    # callback or reservation expiry may have moved the order while we verified.
+                    if not order.mark_paid():
+                        order.refresh_from_db()
+                        return processed_payment_result(request, order)
                     
                     # Return HTML response for browser redirect
                     return render(request, 'payment/payment_result.html', {
@@ -447,9 +703,9 @@ class PaymentCallbackView(viewsets.ViewSet):
                     })
                 else:
                     # Payment verification failed
-                    order.status = 'cancelled'
-                    order.payment_status = 'failed'
-                    order.save()
+                    if not order.mark_cancelled('failed'):
+                        order.refresh_from_db()
+                        return processed_payment_result(request, order)
                     
                     # Return HTML response for browser redirect
                     return render(request, 'payment/payment_result.html', {
@@ -459,9 +715,9 @@ class PaymentCallbackView(viewsets.ViewSet):
                     })
             else:
                 # Payment was cancelled by user
-                order.status = 'cancelled'
-                order.payment_status = 'cancelled'
-                order.save()
+                if not order.mark_cancelled('cancelled'):
+                    order.refresh_from_db()
+                    return processed_payment_result(request, order)
                 
                 # Return HTML response for browser redirect
                 return render(request, 'payment/payment_result.html', {
@@ -509,5 +765,5 @@ class MockPaymentView(View):
             'amount': float(amount),
             'description': description,
             'order_number': order_number,
-            'callback_url': 'http://localhost:8000/api/payment/callback/'
+            'callback_url': settings.ZARINPAL_CALLBACK_URL
         })
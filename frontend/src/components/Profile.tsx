@@ -17,7 +17,7 @@ interface ProfileProps {
 }
 
 const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick, onLoginClick, onHomeClick }) => {
-    const { user, updateProfile, getOrders, getQuotes, logout } = useAuth();
+    const { user, updateProfile, getOrders, getOrderItems, getQuotes, logout } = useAuth();
     const { language } = useLanguage();
     const t = translations[language];
     const { getCartItemsCount } = useCart();
@@ -26,8 +26,20 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
     const [loading, setLoading] = useState(false);
     const [orders, setOrders] = useState<Order[]>([]);
     const [ordersLoading, setOrdersLoading] = useState(true);
+    const [ordersPage, setOrdersPage] = useState(1);
+    const [ordersCount, setOrdersCount] = useState(0);
+    const [hasMoreOrders, setHasMoreOrders] = useState(false);
+    const [loadingMoreOrders, setLoadingMoreOrders] = useState(false);
+    // Line items are loaded from the order detail endpoint when an order is opened
+    const [orderItems, setOrderItems] = useState<Record<string, Order['items']>>({});
+    const [openOrderIds, setOpenOrderIds] = useState<string[]>([]);
+    const [orderItemsLoading, setOrderItemsLoading] = useState<string | null>(null);
     const [quotes, setQuotes] = useState<any[]>([]);
     const [quotesLoading, setQuotesLoading] = useState(true);
+    const [quotesPage, setQuotesPage] = useState(1);
+    const [quotesCount, setQuotesCount] = useState(0);
+    const [hasMoreQuotes, setHasMoreQuotes] = useState(false);
+    const [loadingMoreQuotes, setLoadingMoreQuotes] = useState(false);
     const [isProfileDropdownOpen, setIsProfileDropdownOpen] = useState(false);
     const [showLogoutConfirm, setShowLogoutConfirm] = useState(false);
     const [isLoggingOut, setIsLoggingOut] = useState(false);
@@ -90,8 +102,14 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
         const fetchOrders = async () => {
             setOrdersLoading(true);
             try {
-                const userOrders = await getOrders(language);
+                const { orders: userOrders, count, hasMore } = await getOrders();
                 setOrders(userOrders);
+                setOrdersCount(count);
+                setHasMoreOrders(hasMore);
+                setOrdersPage(1);
+                // Item names are per language, so open orders are loaded again
+                setOrderItems({});
+                setOpenOrderIds([]);
             } catch (error) {
                 console.error('Error fetching orders:', error);
             } finally {
@@ -102,8 +120,11 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
         const fetchQuotes = async () => {
             setQuotesLoading(true);
             try {
-                const userQuotes = await getQuotes();
+                const { quotes: userQuotes, count, hasMore } = await getQuotes();
                 setQuotes(userQuotes);
+                setQuotesCount(count);
+                setHasMoreQuotes(hasMore);
+                setQuotesPage(1);
             } catch (error) {
                 console.error('Error fetching quotes:', error);
             } finally {
@@ -117,6 +138,58 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
         }
     }, [user, getOrders, getQuotes, language]);
 
+    const loadMoreOrders = async () => {
+        setLoadingMoreOrders(true);
+        try {
+            const nextPage = ordersPage + 1;
+            const { orders: moreOrders, count, hasMore } = await getOrders(nextPage);
+            setOrders(prev => [...prev, ...moreOrders]);
+            setOrdersCount(count);
+            setHasMoreOrders(hasMore);
+            setOrdersPage(nextPage);
+        } catch (error) {
+            console.error('Error fetching orders:', error);
+        } finally {
+            setLoadingMoreOrders(false);
+        }
+    };
+
+    const loadMoreQuotes = async () => {
+        setLoadingMoreQuotes(true);
+        try {
+            const nextPage = quotesPage + 1;
+            const { quotes: moreQuotes, count, hasMore } = await getQuotes(nextPage);
+            setQuotes(prev => [...prev, ...moreQuotes]);
+            setQuotesCount(count);
+            setHasMoreQuotes(hasMore);
+            setQuotesPage(nextPage);
+        } catch (error) {
+            console.error('Error fetching quotes:', error);
+        } finally {
+            setLoadingMoreQuotes(false);
+        }
+    };
+
+    const toggleOrderItems = async (orderId: string) => {
+        if (openOrderIds.includes(orderId)) {
+            setOpenOrderIds(prev => prev.filter(id => id !== orderId));
+            return;
+        }
+        setOpenOrderIds(prev => [...prev, orderId]);
+        if (orderItems[orderId]) {
+            return;
+        }
+        setOrderItemsLoading(orderId);
+        try {
+            const items = await getOrderItems(orderId, language);
+            setOrderItems(prev => ({ ...prev, [orderId]: items }));
+        } catch (error) {
+            console.error('Error fetching order items:', error);
+        } finally {
+            setOrderItemsLoading(null);
+        }
+    };
+
     const handleInputChange = (e: React.ChangeEvent<HTMLInputElement | HTMLTextAreaElement>) => {
         const { name, value } = e.target;
         setFormData(prev => ({
@@ -225,9 +298,12 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
             // Hide success message after 5 seconds
             setTimeout(() => setQuoteFormSuccess(false), 5000);
             
-            // Refresh quotes
-            const userQuotes = await getQuotes();
+            // Refresh quotes from the first page, where the new one is
+            const { quotes: userQuotes, count, hasMore } = await getQuotes();
             setQuotes(userQuotes);
+            setQuotesCount(count);
+            setHasMoreQuotes(hasMore);
+            setQuotesPage(1);
         } catch (error) {
             console.error('Error submitting quote:', error);
             alert(language === 'fa' ? 'خطا در ارسال درخواست' : 'Error submitting quote request');
@@ -652,7 +728,7 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
                                 </h2>
                                 <div className="flex items-center space-x-2 rtl:space-x-reverse">
                                     <span className="text-sm text-stone-500 font-persian">
-                                        ({formatNumber(orders.length, language)} {language === 'fa' ? 'سفارش' : 'orders'})
+                                        ({formatNumber(ordersCount, language)} {language === 'fa' ? 'سفارش' : 'orders'})
                                     </span>
                                     {isOrdersExpanded ? (
                                         <ChevronUp className="w-5 h-5 text-stone-600" />
@@ -720,21 +796,40 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
                                                     </div>
 
                                                     <div className="mb-3">
-                                                        <p className="text-sm text-stone-500 font-persian mb-1">
-                                                            {t.orders.items}
-                                                        </p>
-                                                        <div className="space-y-1">
-                                                            {order.items.map((item, index) => (
-                                                                <div key={index} className="flex items-center justify-between text-sm">
-                                                                    <span className="text-stone-700 font-persian">
-                                                                        {item.name} × {formatQuantity(item.quantity, language)}
-                                                                    </span>
-                                                                    <span className="text-stone-600">
-                                                                        {formatPrice((item.price * item.quantity), language)}
-                                                                    </span>
-                                                                </div>
-                                                            ))}
+                                                        <div className="flex items-center justify-between mb-1">
+                                                            <p className="text-sm text-stone-500 font-persian">
+                                                                {t.orders.items} ({formatQuantity(order.item_count, language)})
+                                                            </p>
+                                                            <button
+                                                                onClick={() => toggleOrderItems(order.id)}
+                                                                className="flex items-center text-sm text-stone-600 hover:text-stone-800 transition-colors font-persian"
+                                                            >
+                                                                {openOrderIds.includes(order.id) ? t.orders.hideItems : t.orders.showItems}
+                                                                {openOrderIds.includes(order.id) ? (
+                                                                    <ChevronUp className="w-4 h-4" />
+                                                                ) : (
+                                                                    <ChevronDown className="w-4 h-4" />
+                                                                )}
+                                                            </button>
                                                         </div>
+                                                        {openOrderIds.includes(order.id) && (
+                                                            <div className="space-y-1">
+                                                                {orderItemsLoading === order.id ? (
+                                                                    <p className="text-sm text-stone-500 font-persian">
+                                                                        {language === 'fa' ? 'در حال بارگذاری...' : 'Loading...'}
+                                                                    </p>
+                                                                ) : (orderItems[order.id] || []).map((item, index) => (
+                                                                    <div key={index} className="flex items-center justify-between text-sm">
+                                                                        <span className="text-stone-700 font-persian">
+                                                                            {item.name} × {formatQuantity(item.quantity, language)}
+                                                                        </span>
+                                                                        <span className="text-stone-600">
+                                                                            {formatPrice((item.price * item.quantity), language)}
+                                                                        </span>
+                                                                    </div>
+                                                                ))}
+                                                            </div>
+                                                        )}
                                                     </div>
 
                                                     <div className="flex items-center justify-between pt-3 border-t border-stone-100">
@@ -752,6 +847,18 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
                                                     </div>
                                                 </div>
                                             ))}
+                                            {hasMoreOrders && (
+                                                <button
+                                                    onClick={loadMoreOrders}
+                                                    disabled={loadingMoreOrders}
+                                                    className="w-full bg-gray-200 text-gray-800 py-2 px-4 rounded-lg hover:bg-gray-300 transition-colors disabled:opacity-50 font-persian"
+                                                >
+                                                    {loadingMoreOrders
+                                                        ? (language === 'fa' ? 'در حال بارگذاری...' : 'Loading...')
+                                                        : t.orders.loadMore
+                                                    }
+                                                </button>
+                                            )}
                                         </div>
                                     )}
                                 </div>
@@ -769,7 +876,7 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
                                 </h2>
                                 <div className="flex items-center space-x-2 rtl:space-x-reverse">
                                     <span className="text-sm text-stone-500 font-persian">
-                                        ({formatNumber(quotes.length, language)} {language === 'fa' ? 'درخواست' : 'requests'})
+                                        ({formatNumber(quotesCount, language)} {language === 'fa' ? 'درخواست' : 'requests'})
                                     </span>
                                     {isQuotesExpanded ? (
                                         <ChevronUp className="w-5 h-5 text-stone-600" />
@@ -902,6 +1009,18 @@ const Profile: React.FC<ProfileProps> = ({ onBack, onCartClick, onProfileClick,
                                                     )}
                                                 </div>
                                             ))}
+                                            {hasMoreQuotes && (
+                                                <button
+                                                    onClick={loadMoreQuotes}
+                                                    disabled={loadingMoreQuotes}
+                                                    className="w-full bg-gray-200 text-gray-800 py-2 px-4 rounded-lg hover:bg-gray-300 transition-colors disabled:opacity-50 font-persian"
+                                                >
+                                                    {loadingMoreQuotes
+                                                        ? (language === 'fa' ? 'در حال بارگذاری...' : 'Loading...')
+                                                        : t.quotes.loadMore
+                                                    }
+                                                </button>
+                                            )}
                                         </div>
                                     )}
                                 </div>
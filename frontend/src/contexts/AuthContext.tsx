@@ -1,5 +1,5 @@
 import React, { createContext, ReactNode, useContext, useEffect, useState } from 'react';
-import { api, ApiUser, ApiOrder } from '../services/api';
+import { api, ApiUser } from '../services/api';
 
 export interface User {
     id: string;
@@ -15,6 +15,7 @@ export interface Order {
     user_id: string;
     order_number: string;
     tracking_code?: string;
+    item_count: number;
     items: Array<{
         stone_id: string;
         name: string;
@@ -30,6 +31,18 @@ export interface Order {
     notes?: string;
 }
 
+export interface OrderPage {
+    orders: Order[];
+    count: number;
+    hasMore: boolean;
+}
+
+export interface QuotePage {
+    quotes: any[];
+    count: number;
+    hasMore: boolean;
+}
+
 interface AuthContextType {
     user: User | null;
     loading: boolean;
@@ -37,8 +50,9 @@ interface AuthContextType {
     register: (email: string, password: string, name: string) => Promise<{ success: boolean; error?: string }>;
     logout: () => Promise<void>;
     updateProfile: (updates: Partial<User>) => Promise<{ success: boolean; error?: string }>;
-    getOrders: (language?: 'en' | 'fa') => Promise<Order[]>;
-    getQuotes: () => Promise<any[]>;
+    getOrders: (page?: number) => Promise<OrderPage>;
+    getOrderItems: (orderId: string, language?: 'en' | 'fa') => Promise<Order['items']>;
+    getQuotes: (page?: number) => Promise<QuotePage>;
 }
 
 const AuthContext = createContext<AuthContextType | undefined>(undefined);
@@ -195,7 +209,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
                 localStorage.removeItem(cartKey);
             }
             
-            api.auth.logout();
+            await api.auth.logout();
             setUser(null);
         } catch (error) {
             console.error('Error logging out:', error);
@@ -239,27 +253,23 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
         }
     };
 
-    const getOrders = async (language: 'en' | 'fa' = 'en'): Promise<Order[]> => {
+    const getOrders = async (page: number = 1): Promise<OrderPage> => {
         if (!user) {
-            return [];
+            return { orders: [], count: 0, hasMore: false };
         }
 
         try {
-            const apiOrders: ApiOrder[] = await api.orders.getAll();
+            // The history list is a paginated summary; line items come from getOrderItems
+            const { results: apiOrders, count, next } = await api.orders.getAll(page);
             
             // Transform API orders to frontend format
-            return apiOrders.map(apiOrder => ({
+            const orders: Order[] = apiOrders.map(apiOrder => ({
                 id: apiOrder.id.toString(),
                 user_id: user.id,
                 order_number: apiOrder.order_number,
                 tracking_code: apiOrder.tracking_code,
-                items: apiOrder.items.map(item => ({
-                    stone_id: item.stone.id.toString(),
-                    name: language === 'fa' ? item.stone.name_fa : item.stone.name_en,
-                    quantity: item.quantity,
-                    price: parseFloat(item.price),
-                    image: item.stone.images[0]?.image || ''
-                })),
+                item_count: apiOrder.item_count,
+                items: [],
                 total: parseFloat(apiOrder.total_amount),
                 status: apiOrder.status,
                 payment_status: apiOrder.payment_status,
@@ -267,23 +277,35 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
                 shipping_address: `${apiOrder.shipping_address}, ${apiOrder.shipping_city}, ${apiOrder.shipping_postal_code}`,
                 notes: ''
             }));
+            return { orders, count, hasMore: next !== null };
         } catch (error) {
             console.error('Error fetching orders:', error);
-            return [];
+            return { orders: [], count: 0, hasMore: false };
         }
     };
 
-    const getQuotes = async (): Promise<any[]> => {
+    const getOrderItems = async (orderId: string, language: 'en' | 'fa' = 'en'): Promise<Order['items']> => {
+        const apiOrder = await api.orders.getById(parseInt(orderId, 10));
+        return apiOrder.items.map(item => ({
+            stone_id: item.stone.id.toString(),
+            name: language === 'fa' ? item.stone.name_fa : item.stone.name_en,
+            quantity: item.quantity,
+            price: parseFloat(item.price),
+            image: item.stone.images[0]?.image || ''
+        }));
+    };
+
+    const getQuotes = async (page: number = 1): Promise<QuotePage> => {
         if (!user) {
-            return [];
+            return { quotes: [], count: 0, hasMore: false };
         }
 
         try {
-            const apiQuotes = await api.auth.getQuotes();
-            return apiQuotes;
+            const { results: apiQuotes, count, next } = await api.auth.getQuotes(page);
+            return { quotes: apiQuotes, count, hasMore: next !== null };
         } catch (error) {
             console.error('Error fetching quotes:', error);
-            return [];
+            return { quotes: [], count: 0, hasMore: false };
         }
     };
 
@@ -295,6 +317,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
         logout,
         updateProfile,
         getOrders,
+        getOrderItems,
         getQuotes,
     };
 
@@ -106,6 +106,9 @@ export const translations = {
       items: 'Items',
       shippingAddress: 'Shipping Address',
       noOrders: 'No orders yet',
+      showItems: 'Show items',
+      hideItems: 'Hide items',
+      loadMore: 'Load more orders',
       status: {
         pending: 'Pending',
         paid: 'Paid',
@@ -127,6 +130,7 @@ export const translations = {
       phone: 'Phone',
       notes: 'Additional Notes',
       items: 'Requested Items',
+      loadMore: 'Load more requests',
       status: {
         pending: 'Pending Review',
         in_progress: 'In Progress',
@@ -217,6 +221,9 @@ export const translations = {
       items: 'محصولات',
       shippingAddress: 'آدرس ارسال',
       noOrders: 'هنوز سفارشی ثبت نکرده‌اید',
+      showItems: 'نمایش محصولات',
+      hideItems: 'بستن محصولات',
+      loadMore: 'نمایش سفارشات بیشتر',
       status: {
         pending: 'در انتظار',
         paid: 'پرداخت شده',
@@ -238,6 +245,7 @@ export const translations = {
       phone: 'تلفن',
       notes: 'توضیحات اضافی',
       items: 'اقلام درخواستی',
+      loadMore: 'نمایش درخواست‌های بیشتر',
       status: {
         pending: 'در انتظار بررسی',
         in_progress: 'در حال بررسی',
@@ -128,6 +128,27 @@ export interface ApiOrder {
   updated_at: string;
 }
 
+export interface ApiOrderSummary {
+  id: number;
+  order_number: string;
+  tracking_code?: string;
+  status: ApiOrder['status'];
+  payment_status: ApiOrder['payment_status'];
+  total_amount: string;
+  item_count: number;
+  shipping_address: string;
+  shipping_city: string;
+  shipping_postal_code: string;
+  created_at: string;
+}
+
+export interface PaginatedResponse<T> {
+  count: number;
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface ApiQuote {
   id: number;
   user?: number;
@@ -142,12 +163,13 @@ export interface ApiQuote {
   status: 'pending' | 'in_progress' | 'completed' | 'cancelled';
   items?: Array<{
     id: number;
-    stone: ApiStone;
+    // Lists carry a slim stone (names, category, origin); the detail endpoint the full ApiStone
+    stone: Pick<ApiStone, 'id' | 'name_en' | 'name_fa' | 'category' | 'origin'>;
     quantity: number;
     notes: string;
   }>;
   created_at: string;
-  updated_at: string;
+  updated_at?: string;
 }
 
 // Helper function to get auth token
@@ -262,7 +284,12 @@ export const authApi = {
     return data;
   },
 
-  logout: () => {
+  logout: async () => {
+    // Revoke the token server-side; the local copy is dropped even if that fails
+    await fetch(`${API_BASE_URL}/auth/logout/`, {
+      method: 'POST',
+      headers: getAuthHeaders()
+    }).catch(() => undefined);
     localStorage.removeItem('auth_token');
   },
 
@@ -282,8 +309,8 @@ export const authApi = {
     return handleResponse(response);
   },
 
-  getQuotes: async (): Promise<ApiQuote[]> => {
-    const response = await fetch(`${API_BASE_URL}/users/quotes/`, {
+  getQuotes: async (page: number = 1): Promise<PaginatedResponse<ApiQuote>> => {
+    const response = await fetch(`${API_BASE_URL}/users/quotes/?page=${page}`, {
       headers: getAuthHeaders()
     });
     return handleResponse(response);
@@ -416,8 +443,8 @@ export const cartApi = {
 
 // Orders API
 export const ordersApi = {
-  getAll: async (): Promise<ApiOrder[]> => {
-    const response = await fetch(`${API_BASE_URL}/orders/`, {
+  getAll: async (page: number = 1): Promise<PaginatedResponse<ApiOrderSummary>> => {
+    const response = await fetch(`${API_BASE_URL}/orders/?page=${page}`, {
       headers: getAuthHeaders()
     });
     return handleResponse(response);
@@ -460,8 +487,8 @@ export const quotesApi = {
     return handleResponse(response);
   },
 
-  getAll: async (): Promise<ApiQuote[]> => {
-    const response = await fetch(`${API_BASE_URL}/quotes/`, {
+  getAll: async (page: number = 1): Promise<PaginatedResponse<ApiQuote>> => {
+    const response = await fetch(`${API_BASE_URL}/quotes/?page=${page}`, {
       headers: getAuthHeaders()
     });
     return handleResponse(response);